@@ -5,24 +5,21 @@ Flask API Server for ZKTeco Device Information System
 Provides REST endpoints for device operations
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
 import logging
 import json
 from datetime import datetime
 
-from controllers.device_controller import DeviceController
+from controllers.device_controller import get_device_controller
+from services.attendance_index import AttendanceQuery
+from services.log_index import LogQuery
+from services.metrics import REGISTRY, CACHE_REQUESTS
+from services.log_setup import setup_logging
 from config import Config
 
-# Configure logging
-logging.basicConfig(
-    level=getattr(logging, Config.LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(Config.LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging (queued, rotated; see services/log_setup.py)
+setup_logging(process='api_server')
 
 logger = logging.getLogger(__name__)
 
@@ -30,9 +27,6 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Initialize controller
-device_controller = DeviceController()
-
 @app.route('/')
 def index():
     """Root endpoint"""
@@ -42,20 +36,77 @@ def index():
         'timestamp': datetime.now().isoformat(),
         'endpoints': {
             'GET /api/device/data': 'Get device data',
-            'POST /api/device/sync': 'Sync device data to server',
+            'GET /api/attendance': 'Query attendance (start, end, user_id, device, fields, limit, cursor)',
+            'GET /api/export/attendance.ndjson': 'Stream attendance export as NDJSON',
+            'GET /api/export/attendance.csv': 'Stream attendance export as CSV (?bom=1 for Excel)',
+            'GET /api/export/formatted.ndjson': 'Stream server-format records as NDJSON',
+            'POST /api/device/sync': 'Start background sync job (?wait=1 to block, ?profile=1 to profile, ?full=1 to resend all records)',
+            'POST /api/device/reconcile': 'Compare uploads with server digests, resend differing days (start, end, dry_run)',
+            'GET /api/jobs/<job_id>': 'Get sync job progress',
+            'GET /api/jobs': 'List recent sync jobs',
             'GET /api/device/status': 'Get device status',
+            'GET /api/device/snapshot': 'Get last known device snapshot (restored at startup, refreshed in background)',
             'GET /api/device/health': 'Get system health',
             'POST /api/device/test': 'Test connections',
-            'GET /api/device/formatted': 'Get formatted data'
+            'GET /api/device/formatted': 'Get formatted data',
+            'GET /api/logs': 'Get recent log records (lines, after=<offset> to follow)',
+            'GET /api/logs/search': 'Search rotated logs (start, end, device, level, q, limit)',
+            'GET /metrics': 'Prometheus metrics'
         }
     })
 
+# Serialized bodies of the last successful response per endpoint, keyed by ETag
+_response_cache = {}
+
+def conditional_json(variant, build_result):
+    """
+    Serve device data with a weak ETag, answering a matching If-None-Match with 304
+    
+    The device is only asked for its attendance count and user table first;
+    the full log is read only if they changed since the last read.
+    
+    Args:
+        variant: Endpoint name, part of the ETag
+        build_result: Callable taking device_data and returning the result dict
+    """
+    force = request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
+    etag, device_data = get_device_controller().get_data_snapshot(force=force)
+    if etag is None:
+        return jsonify({
+            'success': False,
+            'message': 'Failed to retrieve device data',
+            'timestamp': datetime.now().isoformat()
+        }), 500
+    
+    # Weak: the body carries read times, which differ between equal loads
+    tag = f'{variant}-{etag}'
+    if request.if_none_match.contains_weak(tag):
+        CACHE_REQUESTS.inc(device=Config.DEVICE_IP, cache='etag', result='hit')
+        response = Response(status=304)
+    else:
+        CACHE_REQUESTS.inc(device=Config.DEVICE_IP, cache='etag', result='miss')
+        cached = _response_cache.get(variant)
+        if cached and cached[0] == tag:
+            CACHE_REQUESTS.inc(device=Config.DEVICE_IP, cache='response_body', result='hit')
+            body, status = cached[1], cached[2]
+        else:
+            CACHE_REQUESTS.inc(device=Config.DEVICE_IP, cache='response_body', result='miss')
+            result = build_result(device_data)
+            status = 200 if result['success'] else 500
+            body = jsonify(result).get_data()
+            if result['success']:
+                _response_cache[variant] = (tag, body, status)
+        response = Response(body, status=status, mimetype='application/json')
+    
+    response.set_etag(tag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/api/device/data', methods=['GET'])
 def get_device_data():
-    """Get device data endpoint"""
+    """Get device data endpoint (supports If-None-Match; ?refresh=1 re-reads the device)"""
     try:
-        result = device_controller.get_device_data()
-        return jsonify(result), 200 if result['success'] else 500
+        return conditional_json('data', get_device_controller().get_device_data)
     except Exception as e:
         logger.error(f"Error in get_device_data endpoint: {e}")
         return jsonify({
@@ -66,10 +117,23 @@ def get_device_data():
 
 @app.route('/api/device/sync', methods=['POST'])
 def sync_device_data():
-    """Sync device data to server endpoint"""
+    """Start a background sync job endpoint (?wait=1 blocks until done, ?profile=1 profiles it, ?full=1 resends everything)"""
     try:
-        result = device_controller.sync_device_data()
-        return jsonify(result), 200 if result['success'] else 500
+        profile = request.args.get('profile', '').lower() in ('1', 'true', 'yes')
+        full_resend = request.args.get('full', '').lower() in ('1', 'true', 'yes')
+        result = get_device_controller().start_sync_job(trigger='api', profile=profile, full_resend=full_resend)
+        if not result['success']:
+            return jsonify(result), 500
+        
+        if request.args.get('wait', '').lower() in ('1', 'true', 'yes'):
+            # Bounded, so a hung device connection does not hold the worker; the client polls instead
+            result = get_device_controller().wait_for_sync_job(result['data']['job_id'],
+                                                              timeout=Config.get_sync_config()['wait_timeout'])
+            if result.get('running'):
+                return jsonify(result), 202
+            return jsonify(result), 200 if result['success'] else 500
+        
+        return jsonify(result), 202
     except Exception as e:
         logger.error(f"Error in sync_device_data endpoint: {e}")
         return jsonify({
@@ -78,11 +142,142 @@ def sync_device_data():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/api/device/reconcile', methods=['POST'])
+def reconcile_uploads():
+    """Compare uploads with the server's digests and resend differing days (?start, ?end, ?dry_run=1)"""
+    try:
+        dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        try:
+            result = get_device_controller().reconcile(request.args.get('start'), request.args.get('end'), dry_run)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': f'Invalid request: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        if result.get('busy'):
+            return jsonify(result), 409
+        if not result['success']:
+            return jsonify(result), 502
+        return jsonify(result), 202 if 'job' in result else 200
+    except Exception as e:
+        logger.error(f"Error in reconcile_uploads endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/attendance', methods=['GET'])
+def query_attendance():
+    """Filtered, paginated attendance query endpoint"""
+    try:
+        query_config = Config.get_query_config()
+        try:
+            query = AttendanceQuery.from_args(
+                request.args,
+                default_limit=query_config['page_size'],
+                max_limit=query_config['max_page_size']
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': f'Invalid query: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        result = get_device_controller().query_attendance(query)
+        return jsonify(result), 200 if result['success'] else 500
+    except Exception as e:
+        logger.error(f"Error in query_attendance endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+EXPORT_FORMATS = {
+    'attendance.ndjson': ('ndjson', 'application/x-ndjson; charset=utf-8'),
+    'attendance.csv': ('csv', 'text/csv; charset=utf-8'),
+    'formatted.ndjson': ('formatted', 'application/x-ndjson; charset=utf-8')
+}
+
+@app.route('/api/export/<filename>', methods=['GET'])
+def export_attendance(filename):
+    """Streaming attendance export endpoint (NDJSON or CSV, ?bom=1 for Excel)"""
+    try:
+        if filename not in EXPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'message': f'Unknown export: {filename}',
+                'timestamp': datetime.now().isoformat()
+            }), 404
+        export_format, mimetype = EXPORT_FORMATS[filename]
+        
+        try:
+            query = AttendanceQuery.from_args(request.args, paged=False)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': f'Invalid query: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        bom = request.args.get('bom', '').lower() in ('1', 'true', 'yes')
+        chunks = get_device_controller().export_attendance(query, export_format, bom=bom)
+        if chunks is None:
+            return jsonify({
+                'success': False,
+                'message': 'Failed to retrieve device data',
+                'timestamp': datetime.now().isoformat()
+            }), 500
+        
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+    except Exception as e:
+        logger.error(f"Error in export_attendance endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/jobs', methods=['GET'])
+def list_sync_jobs():
+    """List recent sync jobs endpoint"""
+    try:
+        result = get_device_controller().list_sync_jobs()
+        return jsonify(result), 200
+    except Exception as e:
+        logger.error(f"Error in list_sync_jobs endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_sync_job(job_id):
+    """Get sync job progress endpoint"""
+    try:
+        result = get_device_controller().get_sync_job(job_id)
+        return jsonify(result), 200 if result['success'] else 404
+    except Exception as e:
+        logger.error(f"Error in get_sync_job endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
 @app.route('/api/device/status', methods=['GET'])
 def get_device_status():
     """Get device status endpoint"""
     try:
-        result = device_controller.get_device_status()
+        result = get_device_controller().get_device_status()
         return jsonify(result), 200 if result['success'] else 500
     except Exception as e:
         logger.error(f"Error in get_device_status endpoint: {e}")
@@ -92,11 +287,25 @@ def get_device_status():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/api/device/snapshot', methods=['GET'])
+def get_device_snapshot():
+    """Get the background-refreshed device snapshot endpoint (no device traffic)"""
+    try:
+        result = get_device_controller().get_dashboard_snapshot()
+        return jsonify(result), 200 if result['success'] else 500
+    except Exception as e:
+        logger.error(f"Error in get_device_snapshot endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
 @app.route('/api/device/health', methods=['GET'])
 def get_health_status():
     """Get system health status endpoint"""
     try:
-        result = device_controller.get_health_status()
+        result = get_device_controller().get_health_status()
         return jsonify(result), 200 if result['success'] else 500
     except Exception as e:
         logger.error(f"Error in get_health_status endpoint: {e}")
@@ -110,7 +319,7 @@ def get_health_status():
 def test_connections():
     """Test device and server connections endpoint"""
     try:
-        result = device_controller.test_connections()
+        result = get_device_controller().test_connections()
         return jsonify(result), 200 if result['success'] else 500
     except Exception as e:
         logger.error(f"Error in test_connections endpoint: {e}")
@@ -122,10 +331,9 @@ def test_connections():
 
 @app.route('/api/device/formatted', methods=['GET'])
 def get_formatted_data():
-    """Get formatted data endpoint"""
+    """Get formatted data endpoint (supports If-None-Match; ?refresh=1 re-reads the device)"""
     try:
-        result = device_controller.get_formatted_data()
-        return jsonify(result), 200 if result['success'] else 500
+        return conditional_json('formatted', get_device_controller().get_formatted_data)
     except Exception as e:
         logger.error(f"Error in get_formatted_data endpoint: {e}")
         return jsonify({
@@ -134,6 +342,67 @@ def get_formatted_data():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+# Upper bound for the number of log records per request
+MAX_LOG_RECORDS = 1000
+
+@app.route('/api/logs', methods=['GET'])
+def get_recent_logs():
+    """Recent log records endpoint (?after=<offset> returns only newer records)"""
+    try:
+        try:
+            count = min(max(int(request.args.get('lines', Config.LOG_TAIL_RECORDS)), 1), MAX_LOG_RECORDS)
+            after = request.args.get('after')
+            offset = int(after) if after not in (None, '') else None
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid query: lines and after must be integers',
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        result = get_device_controller().get_recent_logs(count, offset)
+        return jsonify(result), 200 if result['success'] else 500
+    except Exception as e:
+        logger.error(f"Error in get_recent_logs endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/logs/search', methods=['GET'])
+def search_logs():
+    """Indexed search over the sync log and its rotations"""
+    try:
+        query_config = Config.get_query_config()
+        try:
+            query = LogQuery.from_args(
+                request.args,
+                default_limit=query_config['page_size'],
+                max_limit=query_config['max_page_size']
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': f'Invalid query: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }), 400
+        
+        result = get_device_controller().search_logs(query)
+        return jsonify(result), 200 if result['success'] else 500
+    except Exception as e:
+        logger.error(f"Error in search_logs endpoint: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Server error: {str(e)}',
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics endpoint"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
@@ -154,6 +423,8 @@ def internal_error(error):
 
 if __name__ == '__main__':
     logger.info("Starting ZKTeco Device Information API Server")
+    # Serve the persisted snapshot at once and refresh it in the background
+    get_device_controller().snapshot_service.start()
     app.run(
         host='0.0.0.0',
         port=5000,
@@ -0,0 +1,4 @@
+"""
+Benchmarks for ZKTeco Device Information System
+Run with: python -m benchmarks.run --help
+"""
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+End-to-end sync benchmark
+
+Runs full syncs (device read, format, upload) from the ZK simulator to the
+mock import server, both in-process, and reports throughput and tail latency:
+
+    python -m benchmarks.e2e --users 100 --days 30 --syncs 20
+    python -m benchmarks.e2e --error-rate 0.2 --upload-latency 0.05 --jitter 0.1
+    python -m benchmarks.e2e --script 503,503,200 --save
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.report import summarize_latencies, format_latencies, save_report
+from config import Config
+from tools.mock_import_server import MockImportServer, ImportFaults
+from tools.zk_simulator import ZKSimulator, DeviceTables, FaultInjector
+
+
+def configure(simulator: ZKSimulator, mock: MockImportServer, args: argparse.Namespace):
+    """Point the sync configuration at the simulator and the mock server"""
+    Config.DEVICE_IP = simulator.host
+    Config.DEVICE_PORT = simulator.port
+    Config.DEVICE_SKIP_PING = True
+    Config.DEVICE_FORCE_UDP = args.udp
+    Config.TARGET_SERVER_URL = mock.url
+    Config.API_TIMEOUT = args.timeout
+    Config.API_RETRY_DELAY = args.retry_delay
+    work_dir = tempfile.mkdtemp(prefix='zk-e2e-')
+    Config.SYNC_LOCK_FILE = os.path.join(work_dir, 'locks.db')
+    Config.UPLOAD_LEDGER_FILE = os.path.join(work_dir, 'upload_ledger.db')
+    # The mock upserts by date and id_number, so partial uploads are safe
+    Config.UPLOAD_DELTA = True
+
+
+def run_syncs(count: int, full_resend: bool = False) -> List[Dict[str, Any]]:
+    """
+    Run syncs one after another with one warm DeviceService
+
+    Only the first sync uploads everything unless full_resend is set; later
+    ones send the day groups the ledger has not seen acknowledged.
+
+    Returns:
+        List of dicts with seconds, success and the sync's stats
+    """
+    from services.device_service import DeviceService
+
+    service = DeviceService()
+    runs = []
+    try:
+        for index in range(count):
+            started = time.perf_counter()
+            result = service.sync_device_data(lock_mode='wait', trigger='benchmark', full_resend=full_resend)
+            seconds = time.perf_counter() - started
+            runs.append({'seconds': seconds, 'success': result['success'], 'stats': result.get('stats', {})})
+            print(f"sync {index + 1:>4}/{count}  {'ok  ' if result['success'] else 'FAIL'}  {seconds * 1000:9.1f} ms")
+    finally:
+        service.close()
+    return runs
+
+
+def build_report(runs: List[Dict[str, Any]], mock: MockImportServer, simulator: ZKSimulator,
+                 wall_seconds: float) -> Dict[str, Any]:
+    """Aggregate sync runs, mock server requests and simulator counters"""
+    succeeded = [run for run in runs if run['success']]
+    records = sum(run['stats'].get('records', {}).get('sent', 0) for run in succeeded)
+    upload_requests = [entry['seconds'] for entry in mock.requests_snapshot()]
+    retries = {}
+    for run in runs:
+        for kind, value in run['stats'].get('retries', {}).items():
+            retries[kind] = retries.get(kind, 0) + value
+
+    stages = {}
+    for run in runs:
+        for stage, seconds in run['stats'].get('stages', {}).items():
+            stages.setdefault(stage, []).append(seconds)
+
+    return {
+        'syncs': len(runs),
+        'succeeded': len(succeeded),
+        'success_rate': round(len(succeeded) / len(runs), 4) if runs else 0.0,
+        'wall_seconds': round(wall_seconds, 3),
+        'records_uploaded': records,
+        'records_per_sec': round(records / wall_seconds) if wall_seconds else None,
+        'syncs_per_min': round(len(runs) / wall_seconds * 60, 2) if wall_seconds else None,
+        'sync_latency': summarize_latencies([run['seconds'] for run in runs]),
+        'server_latency': summarize_latencies(upload_requests),
+        'stage_latency': {stage: summarize_latencies(values) for stage, values in stages.items()},
+        'retries': retries,
+        'server': mock.summary(),
+        'device': simulator.stats()
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{report['succeeded']}/{report['syncs']} syncs succeeded in {report['wall_seconds']} s, "
+          f"{report['records_uploaded']} records uploaded ({report['records_per_sec']} rec/s, "
+          f"{report['syncs_per_min']} syncs/min)")
+    print(format_latencies('sync', report['sync_latency']))
+    print(format_latencies('server request', report['server_latency']))
+    for stage, summary in report['stage_latency'].items():
+        print(format_latencies(stage, summary))
+    print(f"retries: {report['retries'] or 'none'}")
+    print(f"server: {report['server']}")
+    print(f"device: {report['device']['commands_total']} commands, {report['device']['connections']} connections, "
+          f"{report['device']['bytes_sent']} bytes")
+
+
+def _status_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='End-to-end sync benchmark against simulated device and server')
+    parser.add_argument('--users', type=int, default=100, help='Simulated users (default: 100)')
+    parser.add_argument('--days', type=int, default=30, help='Simulated days of punches (default: 30)')
+    parser.add_argument('--format', choices=('zk8', 'zk6'), default='zk8', help='Device record format')
+    parser.add_argument('--udp', action='store_true', help='Talk to the device over UDP')
+    parser.add_argument('--syncs', type=int, default=10, help='Syncs to run (default: 10)')
+    parser.add_argument('--device-latency', type=float, default=0.0, help='Seconds added to device responses')
+    parser.add_argument('--upload-latency', type=float, default=0.0, help='Seconds added to import responses')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra import delay up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of imports that fail (0-1)')
+    parser.add_argument('--error-status', type=int, default=503, help='Status of failed imports (default: 503)')
+    parser.add_argument('--throttle', type=float, default=0.0, help='Imports per second before 429 (default: off)')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='Share of imports that hang past --timeout')
+    parser.add_argument('--script', type=_status_list, help='Statuses for the first imports, e.g. 503,503,200')
+    parser.add_argument('--timeout', type=int, default=5, help='Upload timeout in seconds (default: 5)')
+    parser.add_argument('--retry-delay', type=int, default=0, help='Seconds between upload retries (default: 0)')
+    parser.add_argument('--full-resend', action='store_true',
+                        help='Upload every day group on every sync instead of only new or changed ones')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for data and faults')
+    parser.add_argument('--verbose', action='store_true', help='Show sync logging')
+    parser.add_argument('--save', action='store_true', help='Store the report under benchmarks/results/')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    level = logging.INFO if args.verbose else logging.ERROR
+    logging.getLogger().setLevel(level)
+    logging.getLogger('werkzeug').setLevel(level)
+
+    tables = DeviceTables.synthetic(args.users, args.days, args.format, seed=args.seed)
+    simulator = ZKSimulator(tables, port=0, faults=FaultInjector(latency=args.device_latency, seed=args.seed)).start()
+    faults = ImportFaults(latency=args.upload_latency, jitter=args.jitter, error_rate=args.error_rate,
+                          error_status=args.error_status, throttle=args.throttle, timeout_rate=args.timeout_rate,
+                          hang_seconds=args.timeout + 1, script=args.script, seed=args.seed)
+    mock = MockImportServer(port=0, faults=faults).start()
+    try:
+        configure(simulator, mock, args)
+        print(f"{args.users} users x {args.days} days ({tables.records_count} punches), {args.syncs} syncs")
+        started = time.perf_counter()
+        runs = run_syncs(args.syncs, args.full_resend)
+        report = build_report(runs, mock, simulator, time.perf_counter() - started)
+    finally:
+        mock.stop()
+        simulator.stop()
+
+    print_report(report)
+    if args.save:
+        print(f"\nReport saved to {save_report('e2e', report, vars(args))}")
+
+
+if __name__ == '__main__':
+    main()
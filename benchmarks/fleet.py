@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic device fleets for benchmarks
+Builds device data shaped like DeviceService.get_device_data() output
+"""
+
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Any
+
+# Typical shift punches (hour, minute): in, lunch out, lunch in, out
+SHIFT_PUNCHES = ((8, 0), (12, 0), (13, 0), (17, 0))
+
+
+def generate_fleet(users: int, days: int, punches_per_day: int = 4, attendance_rate: float = 0.9,
+                   start: str = '2024-01-01', seed: int = 0) -> Dict[str, Any]:
+    """
+    Generate device data for a synthetic fleet
+
+    Args:
+        users: Number of enrolled users
+        days: Number of days of punches
+        punches_per_day: Punches of a present user per day (cycles through the shift)
+        attendance_rate: Share of users present on a given day
+        start: First day (YYYY-MM-DD)
+        seed: Random seed, so runs compare the same data
+
+    Returns:
+        Dict with device_status, users, attendance and sync_info
+    """
+    rng = random.Random(seed)
+    first_day = datetime.strptime(start, '%Y-%m-%d')
+
+    users_list = [
+        {'user_id': str(1000 + index), 'name': f'Employee {index}', 'card': '0', 'privilege': 0}
+        for index in range(users)
+    ]
+
+    attendance = []
+    for day in range(days):
+        date = first_day + timedelta(days=day)
+        for user in users_list:
+            if rng.random() >= attendance_rate:
+                continue
+            for punch in range(punches_per_day):
+                hour, minute = SHIFT_PUNCHES[punch % len(SHIFT_PUNCHES)]
+                moment = date.replace(hour=hour, minute=minute) + timedelta(seconds=rng.randint(-900, 900))
+                attendance.append({
+                    'user_id': user['user_id'],
+                    'timestamp': moment.strftime('%Y-%m-%d %H:%M:%S'),
+                    'status': punch % 2,
+                    'punch': punch % 2
+                })
+
+    return {
+        'device_status': {
+            'device_info': {'device_name': 'Benchmark Device', 'serial_number': 'BENCH0001'},
+            'users_count': len(users_list),
+            'attendance_count': len(attendance),
+            'connection_status': 'connected'
+        },
+        'users': users_list,
+        'attendance': attendance,
+        'sync_info': {
+            'sync_timestamp': datetime.now().isoformat(),
+            'sync_status': 'success',
+            'total_users': len(users_list),
+            'total_attendance': len(attendance)
+        }
+    }
+
+
+def expected_records(users: int, days: int, punches_per_day: int = 4, attendance_rate: float = 0.9) -> int:
+    """Approximate attendance record count of a fleet, for sizing decisions"""
+    return int(users * days * punches_per_day * attendance_rate)
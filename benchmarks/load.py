@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load test for the API server's /api/device/* endpoints
+
+Starts api_server in-process against the ZK simulator and the mock import
+server, drives it with concurrent clients in a weighted endpoint mix and
+reports throughput, p50/p95/p99 latency and device commands per request:
+
+    python -m benchmarks.load --concurrency 16 --duration 20
+    python -m benchmarks.load --mix status=1,data=1 --revalidate --per-endpoint
+    python -m benchmarks.load --url http://127.0.0.1:5000 --concurrency 8
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import requests
+from werkzeug.serving import make_server
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.report import summarize_latencies, format_latencies, save_report
+from config import Config
+from tools.mock_import_server import MockImportServer
+from tools.zk_simulator import ZKSimulator, DeviceTables, FaultInjector
+
+# name -> (method, path)
+ENDPOINTS = {
+    'status': ('GET', '/api/device/status'),
+    'health': ('GET', '/api/device/health'),
+    'data': ('GET', '/api/device/data'),
+    'formatted': ('GET', '/api/device/formatted'),
+    'test': ('POST', '/api/device/test'),
+    'sync': ('POST', '/api/device/sync')
+}
+DEFAULT_MIX = 'status=4,health=2,data=2,formatted=1'
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """
+    Parse an endpoint mix such as 'status=4,data=1'
+
+    Raises:
+        argparse.ArgumentTypeError: If an endpoint or weight is invalid
+    """
+    mix = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r} (choose from {', '.join(ENDPOINTS)})")
+        try:
+            mix[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight for {name}: {weight!r}")
+    if not mix or not any(mix.values()):
+        raise argparse.ArgumentTypeError('the mix needs at least one endpoint with a positive weight')
+    return mix
+
+
+class LoadEnvironment:
+    """ZK simulator, mock import server and api_server running in-process"""
+
+    def __init__(self, users: int, days: int, device_latency: float, seed: int):
+        self.simulator = ZKSimulator(DeviceTables.synthetic(users, days, seed=seed), port=0,
+                                     faults=FaultInjector(latency=device_latency, seed=seed))
+        self.mock = MockImportServer(port=0)
+        self.server = None
+        self.thread = None
+
+    def start(self, log_level: int) -> str:
+        """
+        Start everything and point the configuration at it
+
+        Returns:
+            Base URL of the API server
+        """
+        self.simulator.start()
+        self.mock.start()
+        Config.DEVICE_IP = self.simulator.host
+        Config.DEVICE_PORT = self.simulator.port
+        Config.DEVICE_SKIP_PING = True
+        Config.TARGET_SERVER_URL = self.mock.url
+        Config.API_RETRY_DELAY = 0
+        work_dir = tempfile.mkdtemp(prefix='zk-load-')
+        Config.SYNC_LOCK_FILE = os.path.join(work_dir, 'locks.db')
+        Config.LOG_FILE = os.path.join(work_dir, 'api_server.log')
+
+        # api_server configures logging at import time; the controller is built on the first request
+        import api_server
+        logging.getLogger().setLevel(log_level)
+        logging.getLogger('werkzeug').setLevel(log_level)
+
+        self.server = make_server('127.0.0.1', 0, api_server.app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='api-server', daemon=True)
+        self.thread.start()
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.thread.join(timeout=5)
+        self.mock.stop()
+        self.simulator.stop()
+
+
+def run_load(base_url: str, mix: Dict[str, float], concurrency: int, duration: float,
+             total_requests: Optional[int], revalidate: bool, timeout: float, seed: int) -> Dict[str, Any]:
+    """
+    Drive the API with concurrent clients
+
+    Args:
+        base_url: API server URL
+        mix: Endpoint name -> weight
+        concurrency: Client threads, each with its own connection pool
+        duration: Seconds to run (ignored if total_requests is set)
+        total_requests: Stop after this many requests instead
+        revalidate: Send If-None-Match with the last ETag seen per endpoint
+        timeout: Per-request timeout in seconds
+        seed: Random seed for the endpoint choice
+
+    Returns:
+        Dict with samples [(endpoint, seconds, status)] and wall_seconds
+    """
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = []
+    samples_lock = threading.Lock()
+    issued = [0]
+    deadline = time.perf_counter() + duration
+
+    def next_slot() -> bool:
+        with samples_lock:
+            if total_requests is not None:
+                if issued[0] >= total_requests:
+                    return False
+            elif time.perf_counter() >= deadline:
+                return False
+            issued[0] += 1
+            return True
+
+    def worker(index: int):
+        chooser = random.Random(seed + index)
+        session = requests.Session()
+        etags = {}
+        local = []
+        try:
+            while next_slot():
+                name = chooser.choices(names, weights)[0]
+                method, path = ENDPOINTS[name]
+                headers = {'If-None-Match': etags[name]} if revalidate and name in etags else {}
+                started = time.perf_counter()
+                try:
+                    response = session.request(method, base_url + path, headers=headers, timeout=timeout)
+                    status = response.status_code
+                    if response.headers.get('ETag'):
+                        etags[name] = response.headers['ETag']
+                except requests.exceptions.RequestException:
+                    status = 'error'
+                local.append((name, time.perf_counter() - started, status))
+        finally:
+            session.close()
+            with samples_lock:
+                samples.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(index,), name=f'load-{index}') for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {'samples': samples, 'wall_seconds': time.perf_counter() - started}
+
+
+def build_report(run: Dict[str, Any], device_stats: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate samples into throughput, latency and status counts per endpoint"""
+    samples = run['samples']
+    wall_seconds = run['wall_seconds']
+    endpoints = {}
+    for name in sorted({sample[0] for sample in samples}):
+        latencies = [seconds for endpoint, seconds, _ in samples if endpoint == name]
+        statuses = {}
+        for endpoint, _, status in samples:
+            if endpoint == name:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+        endpoints[name] = {'latency': summarize_latencies(latencies), 'statuses': statuses}
+
+    report = {
+        'requests': len(samples),
+        'wall_seconds': round(wall_seconds, 3),
+        'requests_per_sec': round(len(samples) / wall_seconds, 2) if wall_seconds else None,
+        'errors': sum(1 for _, _, status in samples if status == 'error' or status >= 500),
+        'latency': summarize_latencies([sample[1] for sample in samples]),
+        'endpoints': endpoints
+    }
+    if device_stats is not None:
+        report['device'] = {
+            'commands': device_stats['commands_total'],
+            'connections': device_stats['connections'],
+            'bytes_sent': device_stats['bytes_sent'],
+            'commands_per_request': round(device_stats['commands_total'] / len(samples), 3) if samples else None
+        }
+    return report
+
+
+def print_report(title: str, report: Dict[str, Any]):
+    print(f"\n{title}: {report['requests']} requests in {report['wall_seconds']} s "
+          f"({report['requests_per_sec']} req/s, {report['errors']} errors)")
+    print(format_latencies('all', report['latency']))
+    for name, endpoint in report['endpoints'].items():
+        print(f"{format_latencies(name, endpoint['latency'])}  {endpoint['statuses']}")
+    if 'device' in report:
+        device = report['device']
+        print(f"device: {device['commands']} commands ({device['commands_per_request']} per request), "
+              f"{device['connections']} connections, {device['bytes_sent']} bytes")
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Load test the API server /api/device/* endpoints')
+    parser.add_argument('--url', help='Test a running API server instead of an in-process one '
+                                      '(device commands are then not counted)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Endpoint weights, from {', '.join(ENDPOINTS)} (default: {DEFAULT_MIX})")
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients (default: 8)')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per run (default: 10)')
+    parser.add_argument('--requests', type=int, help='Stop after this many requests instead of --duration')
+    parser.add_argument('--revalidate', action='store_true', help='Send If-None-Match with the last ETag seen')
+    parser.add_argument('--per-endpoint', action='store_true',
+                        help='Also run each endpoint of the mix alone to attribute device commands')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Request timeout in seconds (default: 60)')
+    parser.add_argument('--users', type=int, default=100, help='Simulated users (default: 100)')
+    parser.add_argument('--days', type=int, default=30, help='Simulated days of punches (default: 30)')
+    parser.add_argument('--device-latency', type=float, default=0.0, help='Seconds added to device responses')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for data and the endpoint mix')
+    parser.add_argument('--verbose', action='store_true', help='Show server logging')
+    parser.add_argument('--save', action='store_true', help='Store the report under benchmarks/results/')
+    args = parser.parse_args()
+
+    log_level = logging.INFO if args.verbose else logging.ERROR
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logging.getLogger().setLevel(log_level)
+
+    environment = None
+    simulator = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        environment = LoadEnvironment(args.users, args.days, args.device_latency, args.seed)
+        base_url = environment.start(log_level)
+        simulator = environment.simulator
+
+    phases: List[Tuple[str, Dict[str, float]]] = [('mix', args.mix)]
+    if args.per_endpoint and len(args.mix) > 1:
+        phases += [(name, {name: 1.0}) for name in args.mix]
+
+    reports = {}
+    try:
+        for title, mix in phases:
+            if simulator:
+                simulator.reset_stats()
+            run = run_load(base_url, mix, args.concurrency, args.duration, args.requests,
+                           args.revalidate, args.timeout, args.seed)
+            reports[title] = build_report(run, simulator.stats() if simulator else None)
+            print_report(title, reports[title])
+    finally:
+        if environment:
+            environment.stop()
+
+    if args.save:
+        arguments = dict(vars(args), mix=args.mix)
+        print(f"\nReport saved to {save_report('load', reports, arguments)}")
+
+
+if __name__ == '__main__':
+    main()
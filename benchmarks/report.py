@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Latency summaries shared by the benchmark harnesses
+"""
+
+import json
+import math
+import os
+import platform
+from datetime import datetime
+from typing import Dict, Any, List, Sequence
+
+from benchmarks.run import RESULTS_DIR, git_revision
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile
+
+    Args:
+        values: Samples (any order)
+        fraction: 0-1, e.g. 0.99 for p99
+
+    Returns:
+        The sample at that rank, or 0.0 if there are none
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize_latencies(values: List[float]) -> Dict[str, Any]:
+    """
+    Summarize latencies in seconds
+
+    Returns:
+        Dict with count, mean, p50, p95, p99 and max (seconds, rounded)
+    """
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 6) if values else 0.0,
+        'p50': round(percentile(values, 0.50), 6),
+        'p95': round(percentile(values, 0.95), 6),
+        'p99': round(percentile(values, 0.99), 6),
+        'max': round(max(values), 6) if values else 0.0
+    }
+
+
+def format_latencies(name: str, summary: Dict[str, Any]) -> str:
+    """Render a summary from summarize_latencies() in milliseconds"""
+    return (f"{name:<16} n={summary['count']:<6} mean {summary['mean'] * 1000:9.1f} ms  "
+            f"p50 {summary['p50'] * 1000:9.1f}  p95 {summary['p95'] * 1000:9.1f}  "
+            f"p99 {summary['p99'] * 1000:9.1f}  max {summary['max'] * 1000:9.1f}")
+
+
+def save_report(kind: str, report: Dict[str, Any], arguments: Dict[str, Any]) -> str:
+    """
+    Store a harness report as benchmarks/results/<kind>-<commit>[-dirty].json
+
+    Args:
+        kind: Harness name, e.g. 'e2e' or 'load'
+        report: Report dict
+        arguments: Options the harness ran with
+
+    Returns:
+        Path of the written file
+    """
+    revision = git_revision()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    name = f"{kind}-{revision['commit']}" + ('-dirty' if revision['dirty'] else '')
+    path = os.path.join(RESULTS_DIR, f"{name}.json")
+    document = {
+        'commit': revision['commit'],
+        'dirty': revision['dirty'],
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'arguments': arguments,
+        'report': report
+    }
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(document, output, indent=2)
+    return path
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark runner for the formatting and serialization hot path
+
+Times each case over a matrix of synthetic fleets, records peak memory with
+tracemalloc and stores the results per commit so runs can be compared:
+
+    python -m benchmarks.run --quick
+    python -m benchmarks.run --users 1000 --days 30,365 --save
+    python -m benchmarks.run --save --compare 3c9db3b
+"""
+
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, Any, List, Callable, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(1, os.path.join(ROOT_DIR, 'zktime_windows_app'))
+
+from benchmarks.fleet import generate_fleet, expected_records
+
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+
+# Matrices: 10 to 10,000 users, one day to one year of punches
+FULL_USERS = (10, 100, 1000, 10000)
+FULL_DAYS = (1, 30, 365)
+QUICK_USERS = (10, 100, 1000)
+QUICK_DAYS = (1, 30)
+
+# name -> setup(fleet) returning the callable to time
+CASES = {}
+
+
+class BenchmarkSkipped(Exception):
+    """A case cannot run in this environment"""
+
+
+def case(name: str):
+    """Register a benchmark case"""
+    def register(setup: Callable[[Dict[str, Any]], Callable[[], Any]]):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def _device_service():
+    from services.device_service import DeviceService
+    return DeviceService()
+
+
+@case('format_data_for_server')
+def _format_for_server(fleet: Dict[str, Any]) -> Callable[[], Any]:
+    service = _device_service()
+    return lambda: service.format_data_for_server(fleet)
+
+
+@case('format_data_for_api')
+def _format_for_api(fleet: Dict[str, Any]) -> Callable[[], Any]:
+    # The tray app imports its GUI dependencies (pystray, PIL, winreg) at module level
+    try:
+        from simple_zktime_app import SimpleZKTimeApp
+    except ImportError as e:
+        raise BenchmarkSkipped(f"simple_zktime_app not importable: {e}")
+
+    class _Holder:
+        logger = __import__('logging').getLogger('benchmarks')
+
+    format_data = SimpleZKTimeApp.format_data_for_api.__get__(_Holder())
+    users_dict = {user['user_id']: user['name'] for user in fleet['users']}
+    return lambda: format_data(users_dict, fleet['attendance'])
+
+
+@case('json_encode')
+def _json_encode(fleet: Dict[str, Any]) -> Callable[[], Any]:
+    payload = _device_service().format_data_for_server(fleet)
+    # Same encoding as DeviceService.send_to_server()
+    return lambda: json.dumps(payload).encode('utf-8')
+
+
+def measure(func: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """
+    Time a callable and record its peak traced memory
+
+    Memory is measured in a separate run so tracemalloc overhead does not
+    distort the timings.
+
+    Args:
+        func: Callable to benchmark
+        repeat: Timed runs after one warm-up run
+
+    Returns:
+        Dict with min/median/mean seconds and peak_bytes
+    """
+    func()
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'min': round(min(timings), 6),
+        'median': round(statistics.median(timings), 6),
+        'mean': round(statistics.mean(timings), 6),
+        'peak_bytes': peak
+    }
+
+
+def run_matrix(cases: List[str], users: List[int], days: List[int], repeat: int,
+               max_records: int) -> List[Dict[str, Any]]:
+    """
+    Run every case on every fleet size
+
+    Args:
+        cases: Case names
+        users: User counts
+        days: Day counts
+        repeat: Timed runs per case
+        max_records: Skip fleets with more attendance records than this
+
+    Returns:
+        List of result dicts
+    """
+    results = []
+    skipped = set()
+    for user_count in users:
+        for day_count in days:
+            if expected_records(user_count, day_count) > max_records:
+                print(f"skip {user_count} users x {day_count} days (over --max-records)")
+                continue
+            fleet = generate_fleet(user_count, day_count)
+            records = len(fleet['attendance'])
+            for name in cases:
+                if name in skipped:
+                    continue
+                try:
+                    func = CASES[name](fleet)
+                except BenchmarkSkipped as e:
+                    print(f"skip {name}: {e}")
+                    skipped.add(name)
+                    continue
+                result = measure(func, repeat)
+                result.update({
+                    'case': name,
+                    'users': user_count,
+                    'days': day_count,
+                    'records': records,
+                    'records_per_sec': round(records / result['median']) if result['median'] else None
+                })
+                results.append(result)
+                print(_format_result(result))
+            del fleet
+            gc.collect()
+    return results
+
+
+def _format_result(result: Dict[str, Any]) -> str:
+    return (f"{result['case']:<24} {result['users']:>6} users {result['days']:>4} days "
+            f"{result['records']:>9} records  median {result['median'] * 1000:>10.2f} ms  "
+            f"{(result['records_per_sec'] or 0):>10} rec/s  peak {result['peak_bytes'] / 1048576:>8.1f} MiB")
+
+
+def git_revision() -> Dict[str, Any]:
+    """Current commit and whether the tree has uncommitted changes"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': 'unknown', 'dirty': True}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def save_results(results: List[Dict[str, Any]], args: argparse.Namespace) -> str:
+    """
+    Store results as benchmarks/results/<commit>[-dirty].json
+
+    Returns:
+        Path of the written file
+    """
+    revision = git_revision()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    name = revision['commit'] + ('-dirty' if revision['dirty'] else '')
+    path = os.path.join(RESULTS_DIR, f"{name}.json")
+    document = {
+        'commit': revision['commit'],
+        'dirty': revision['dirty'],
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results
+    }
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(document, output, indent=2)
+    return path
+
+
+def load_results(reference: str) -> Optional[Dict[str, Any]]:
+    """Load a results file by path or by (a prefix of) its commit"""
+    if os.path.isfile(reference):
+        path = reference
+    else:
+        matches = sorted(glob.glob(os.path.join(RESULTS_DIR, f"{reference}*.json")))
+        if not matches:
+            return None
+        path = matches[0]
+    with open(path, 'r', encoding='utf-8') as source:
+        return json.load(source)
+
+
+def compare(baseline: Dict[str, Any], results: List[Dict[str, Any]]):
+    """Print median time and peak memory changes against a baseline"""
+    previous = {(r['case'], r['users'], r['days']): r for r in baseline['results']}
+    print(f"\nCompared with {baseline['commit']}{'-dirty' if baseline.get('dirty') else ''} "
+          f"({baseline['timestamp'][:19]}):")
+    for result in results:
+        before = previous.get((result['case'], result['users'], result['days']))
+        if not before:
+            continue
+        time_change = (result['median'] / before['median'] - 1) * 100 if before['median'] else 0.0
+        memory_change = (result['peak_bytes'] / before['peak_bytes'] - 1) * 100 if before['peak_bytes'] else 0.0
+        print(f"{result['case']:<24} {result['users']:>6} users {result['days']:>4} days  "
+              f"time {time_change:>+7.1f}%  peak memory {memory_change:>+7.1f}%")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Benchmark the formatting and serialization hot path')
+    parser.add_argument('--case', action='append', choices=sorted(CASES),
+                        help='Case to run (repeatable; default: all)')
+    parser.add_argument('--users', type=_int_list, help='Comma-separated user counts')
+    parser.add_argument('--days', type=_int_list, help='Comma-separated day counts')
+    parser.add_argument('--quick', action='store_true', help='Small matrix for a fast check')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case (default: 3)')
+    parser.add_argument('--max-records', type=int, default=1500000,
+                        help='Skip fleets with more attendance records (default: 1500000)')
+    parser.add_argument('--save', action='store_true', help='Store results under benchmarks/results/')
+    parser.add_argument('--compare', metavar='COMMIT_OR_FILE', help='Compare with stored results')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        baseline = load_results(args.compare)
+        if baseline is None:
+            parser.error(f"No stored results for {args.compare}")
+
+    users = args.users or (QUICK_USERS if args.quick else FULL_USERS)
+    days = args.days or (QUICK_DAYS if args.quick else FULL_DAYS)
+    results = run_matrix(args.case or list(CASES), users, days, args.repeat, args.max_records)
+
+    if args.save:
+        print(f"\nResults saved to {save_results(results, args)}")
+    if baseline:
+        compare(baseline, results)
+
+
+if __name__ == '__main__':
+    main()
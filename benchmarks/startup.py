@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup time of the entry points
+
+Each target runs in a fresh interpreter, as the scheduler launches
+sync_command.py; the bare interpreter start is measured too so the
+overhead of our imports can be read off directly:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 30 --targets sync-help,sync-import
+    python -m benchmarks.startup --importtime 10 --save
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.report import summarize_latencies, format_latencies, save_report
+
+# name -> interpreter arguments, run from the repository root
+TARGETS = {
+    'python': ['-c', 'pass'],
+    'sync-help': ['sync_command.py', '--help'],
+    'sync-import': ['-c', 'import sync_command'],
+    'device-service': ['-c', 'import services.device_service'],
+    'api-server': ['-c', 'import api_server'],
+    'web-interface': ['-c', 'import web_interface']
+}
+BASELINE = 'python'
+
+
+def _environment(work_dir: str) -> Dict[str, str]:
+    """Keep the entry points' log and lock files out of the working tree"""
+    env = dict(os.environ)
+    env['LOG_FILE'] = os.path.join(work_dir, 'startup.log')
+    env['SYNC_LOCK_FILE'] = os.path.join(work_dir, 'locks.db')
+    return env
+
+
+def time_target(arguments: List[str], repeat: int, env: Dict[str, str]) -> List[float]:
+    """
+    Run a target in fresh interpreters
+
+    One untimed run first fills the bytecode and file caches.
+
+    Returns:
+        Wall-clock seconds of each timed run
+
+    Raises:
+        RuntimeError: If the target exits with an error
+    """
+    command = [sys.executable] + arguments
+    times = []
+    for index in range(repeat + 1):
+        started = time.perf_counter()
+        completed = subprocess.run(command, cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE)
+        seconds = time.perf_counter() - started
+        if completed.returncode != 0:
+            raise RuntimeError(f"{' '.join(arguments)} exited with {completed.returncode}: "
+                               f"{completed.stderr.decode(errors='replace').strip()[-500:]}")
+        if index:
+            times.append(seconds)
+    return times
+
+
+def slowest_imports(arguments: List[str], top: int, env: Dict[str, str]) -> List[Tuple[str, float]]:
+    """
+    Modules with the largest self import time, from python -X importtime
+
+    Returns:
+        [(module, seconds)] slowest first
+    """
+    completed = subprocess.run([sys.executable, '-X', 'importtime'] + arguments, cwd=ROOT_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    modules = []
+    for line in completed.stderr.decode(errors='replace').splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        modules.append((fields[2].strip(), int(fields[0]) / 1e6))
+    modules.sort(key=lambda module: module[1], reverse=True)
+    return modules[:top]
+
+
+def run_startup(targets: List[str], repeat: int, importtime: int) -> Dict[str, Any]:
+    """
+    Time each target and, optionally, list its slowest imports
+
+    Returns:
+        Dict of target name -> latency summary, overhead over the bare
+        interpreter (median, seconds) and slowest imports
+    """
+    report = {}
+    with tempfile.TemporaryDirectory(prefix='zk-startup-') as work_dir:
+        env = _environment(work_dir)
+        for name in [BASELINE] + [target for target in targets if target != BASELINE]:
+            entry = {'latency': summarize_latencies(time_target(TARGETS[name], repeat, env))}
+            if importtime and name != BASELINE:
+                entry['slowest_imports'] = [
+                    {'module': module, 'seconds': round(seconds, 6)}
+                    for module, seconds in slowest_imports(TARGETS[name], importtime, env)
+                ]
+            report[name] = entry
+
+    baseline = report[BASELINE]['latency']['p50']
+    for entry in report.values():
+        entry['overhead'] = round(entry['latency']['p50'] - baseline, 6)
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    for name, entry in report.items():
+        print(f"{format_latencies(name, entry['latency'])}  +{entry['overhead'] * 1000:.1f} ms over python")
+        for module in entry.get('slowest_imports', []):
+            print(f"{'':<18}{module['seconds'] * 1000:8.1f} ms  {module['module']}")
+
+
+def _target_list(value: str) -> List[str]:
+    targets = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = [target for target in targets if target not in TARGETS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown target {unknown[0]!r} (choose from {', '.join(TARGETS)})")
+    return targets
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Measure entry point startup time')
+    parser.add_argument('--targets', type=_target_list, default=list(TARGETS),
+                        help=f"Comma-separated targets (default: all of {', '.join(TARGETS)})")
+    parser.add_argument('--repeat', type=int, default=10, help='Timed runs per target (default: 10)')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help='Also list the N slowest imports of each target')
+    parser.add_argument('--save', action='store_true', help='Store the report under benchmarks/results/')
+    args = parser.parse_args()
+
+    report = run_startup(args.targets, args.repeat, args.importtime)
+    print_report(report)
+    if args.save:
+        print(f"\nReport saved to {save_report('startup', report, vars(args))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -16,7 +16,7 @@ pip install pyinstaller
 
 REM Build the debug executable (with console)
 echo Building debug executable...
-python -m PyInstaller --onefile --name ZKTecoWebInterface_Debug web_interface.py
+python -m PyInstaller --onefile --name ZKTecoWebInterface_Debug --add-data "templates;templates" --add-data "static;static" web_interface.py
 
 if errorlevel 1 (
     echo Error: Failed to build debug executable
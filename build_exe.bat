@@ -16,7 +16,7 @@ pip install pyinstaller
 
 REM Build the executable
 echo Building executable...
-python -m PyInstaller --onefile --name ZKTecoWebInterface web_interface.py
+python -m PyInstaller --onefile --name ZKTecoWebInterface --add-data "templates;templates" --add-data "static;static" web_interface.py
 
 if errorlevel 1 (
     echo Error: Failed to build executable
@@ -4,8 +4,14 @@
 Configuration file for ZKTeco Device Information System
 """
 
+import importlib
+import logging
 import os
-from typing import Dict, Any
+import sys
+import tempfile
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
 
 class Config:
     """Configuration class for the device information system"""
@@ -14,24 +20,57 @@ class Config:
     DEVICE_IP = os.getenv('DEVICE_IP', '192.168.70.141')
     DEVICE_PORT = int(os.getenv('DEVICE_PORT', '4370'))
     DEVICE_TIMEOUT = int(os.getenv('DEVICE_TIMEOUT', '5'))
+    DEVICE_FORCE_UDP = os.getenv('DEVICE_FORCE_UDP', 'false').lower() in ('1', 'true', 'yes')
+    DEVICE_SKIP_PING = os.getenv('DEVICE_SKIP_PING', 'false').lower() in ('1', 'true', 'yes')  # e.g. hosts without ping
     
     # Target Server Configuration
     TARGET_SERVER_URL = os.getenv('TARGET_SERVER_URL', 'https://panel.sdadparts.com/api/attendance/device-import')
     TARGET_SERVER_TOKEN = os.getenv('TARGET_SERVER_TOKEN', '3|4GQYfJgpAhjlZfumsMMBrKvZyr68L9hVA3V9u5Fnd983ce66')
+    TARGET_DIGEST_URL = os.getenv('TARGET_DIGEST_URL', '')  # reconciliation check (default: TARGET_SERVER_URL + '/digests')
     
     # Sync Configuration
     SYNC_INTERVAL = int(os.getenv('SYNC_INTERVAL', '3600'))  # seconds
     SYNC_START_TIME = os.getenv('SYNC_START_TIME', '00:00')
     SYNC_END_TIME = os.getenv('SYNC_END_TIME', '23:59')
+    SYNC_OUTSIDE_WINDOW = os.getenv('SYNC_OUTSIDE_WINDOW', 'skip')  # 'skip' or 'defer' runs outside the window
+    SYNC_ADAPTIVE_MIN_INTERVAL = int(os.getenv('SYNC_ADAPTIVE_MIN_INTERVAL', '300'))  # seconds
+    SYNC_ADAPTIVE_MAX_INTERVAL = int(os.getenv('SYNC_ADAPTIVE_MAX_INTERVAL', '3600'))  # seconds
+    SYNC_ADAPTIVE_TARGET_PUNCHES = int(os.getenv('SYNC_ADAPTIVE_TARGET_PUNCHES', '25'))  # new records per sync
+    
+    # Sync Lock Configuration (shared by every process on the host)
+    SYNC_LOCK_FILE = os.getenv('SYNC_LOCK_FILE', os.path.join(tempfile.gettempdir(), 'zkteco_sync_locks.db'))
+    SYNC_LOCK_TTL = int(os.getenv('SYNC_LOCK_TTL', '600'))  # seconds before a crashed holder's lease expires
+    SYNC_LOCK_MODE = os.getenv('SYNC_LOCK_MODE', 'attach')  # 'wait', 'attach' or 'skip' when a sync is running
+    SYNC_LOCK_WAIT_TIMEOUT = int(os.getenv('SYNC_LOCK_WAIT_TIMEOUT', '1800'))  # seconds
+    SYNC_JOB_HISTORY = int(os.getenv('SYNC_JOB_HISTORY', '50'))  # finished jobs kept for polling
+    SYNC_WAIT_TIMEOUT = int(os.getenv('SYNC_WAIT_TIMEOUT', '120'))  # seconds ?wait=1 blocks before answering with the job id
+    SNAPSHOT_INTERVAL = int(os.getenv('SNAPSHOT_INTERVAL', '60'))  # seconds between dashboard refreshes
+    SNAPSHOT_FILE = os.getenv('SNAPSHOT_FILE', '')  # last snapshot, restored at startup (default: next to LOG_FILE)
+    SYNC_PROFILE_DIR = os.getenv('SYNC_PROFILE_DIR', '')  # profiled syncs write here (default: next to LOG_FILE)
     
     # Logging Configuration
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', 'device_sync.log')
+    LOG_TAIL_RECORDS = int(os.getenv('LOG_TAIL_RECORDS', '50'))  # records shown on the dashboard
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' (one object per line) or 'text'
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))  # rotate above this size (0: never)
+    LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', 'midnight')  # 'midnight', 'hourly' or 'never'
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '14'))  # rotated files kept
+    LOG_COMPRESS = os.getenv('LOG_COMPRESS', 'true').lower() in ('1', 'true', 'yes')  # gzip rotated files
+    LOG_ROTATE_PROCESS = os.getenv('LOG_ROTATE_PROCESS', 'api_server')  # entry point that rotates LOG_FILE; the others append
     
     # API Configuration
     API_TIMEOUT = int(os.getenv('API_TIMEOUT', '30'))
     API_RETRY_ATTEMPTS = int(os.getenv('API_RETRY_ATTEMPTS', '3'))
     API_RETRY_DELAY = int(os.getenv('API_RETRY_DELAY', '5'))
+    UPLOAD_DELTA = os.getenv('UPLOAD_DELTA', 'false').lower() in ('1', 'true', 'yes')  # send only new or changed day groups (server must upsert)
+    RECONCILE_ENABLED = os.getenv('RECONCILE_ENABLED', 'true').lower() in ('1', 'true', 'yes')  # keep the upload ledger for reconciliation, also without delta uploads
+    UPLOAD_LEDGER_FILE = os.getenv('UPLOAD_LEDGER_FILE', '')  # hashes of acknowledged day groups (default: next to LOG_FILE)
+    
+    # Query Configuration
+    INDEX_MAX_AGE = int(os.getenv('INDEX_MAX_AGE', '300'))  # seconds before the local copy is re-read
+    QUERY_PAGE_SIZE = int(os.getenv('QUERY_PAGE_SIZE', '100'))
+    QUERY_MAX_PAGE_SIZE = int(os.getenv('QUERY_MAX_PAGE_SIZE', '1000'))
     
     @classmethod
     def get_device_config(cls) -> Dict[str, Any]:
@@ -39,7 +78,9 @@ class Config:
         return {
             'ip': cls.DEVICE_IP,
             'port': cls.DEVICE_PORT,
-            'timeout': cls.DEVICE_TIMEOUT
+            'timeout': cls.DEVICE_TIMEOUT,
+            'force_udp': cls.DEVICE_FORCE_UDP,
+            'skip_ping': cls.DEVICE_SKIP_PING
         }
     
     @classmethod
@@ -50,7 +91,11 @@ class Config:
             'token': cls.TARGET_SERVER_TOKEN,
             'timeout': cls.API_TIMEOUT,
             'retry_attempts': cls.API_RETRY_ATTEMPTS,
-            'retry_delay': cls.API_RETRY_DELAY
+            'retry_delay': cls.API_RETRY_DELAY,
+            'delta': cls.UPLOAD_DELTA,
+            'reconcile': cls.RECONCILE_ENABLED,
+            'ledger_file': cls.UPLOAD_LEDGER_FILE,
+            'digest_url': cls.TARGET_DIGEST_URL or cls.TARGET_SERVER_URL.rstrip('/') + '/digests'
         }
     
     @classmethod
@@ -59,5 +104,87 @@ class Config:
         return {
             'interval': cls.SYNC_INTERVAL,
             'start_time': cls.SYNC_START_TIME,
-            'end_time': cls.SYNC_END_TIME
-        } 
\ No newline at end of file
+            'end_time': cls.SYNC_END_TIME,
+            'outside_window': cls.SYNC_OUTSIDE_WINDOW,
+            'adaptive_min_interval': cls.SYNC_ADAPTIVE_MIN_INTERVAL,
+            'adaptive_max_interval': cls.SYNC_ADAPTIVE_MAX_INTERVAL,
+            'adaptive_target_punches': cls.SYNC_ADAPTIVE_TARGET_PUNCHES,
+            'lock_file': cls.SYNC_LOCK_FILE,
+            'lock_ttl': cls.SYNC_LOCK_TTL,
+            'lock_mode': cls.SYNC_LOCK_MODE,
+            'lock_wait_timeout': cls.SYNC_LOCK_WAIT_TIMEOUT,
+            'job_history': cls.SYNC_JOB_HISTORY,
+            'wait_timeout': cls.SYNC_WAIT_TIMEOUT,
+            'snapshot_interval': cls.SNAPSHOT_INTERVAL,
+            'snapshot_file': cls.SNAPSHOT_FILE,
+            'profile_dir': cls.SYNC_PROFILE_DIR
+        }
+    
+    @classmethod
+    def get_logging_config(cls) -> Dict[str, Any]:
+        """Get logging configuration"""
+        return {
+            'level': cls.LOG_LEVEL,
+            'file': cls.LOG_FILE,
+            'format': cls.LOG_FORMAT,
+            'max_bytes': cls.LOG_MAX_BYTES,
+            'rotate_when': cls.LOG_ROTATE_WHEN,
+            'backup_count': cls.LOG_BACKUP_COUNT,
+            'compress': cls.LOG_COMPRESS,
+            'rotate_process': cls.LOG_ROTATE_PROCESS
+        }
+    
+    @classmethod
+    def get_query_config(cls) -> Dict[str, Any]:
+        """Get attendance query configuration"""
+        return {
+            'index_max_age': cls.INDEX_MAX_AGE,
+            'page_size': cls.QUERY_PAGE_SIZE,
+            'max_page_size': cls.QUERY_MAX_PAGE_SIZE
+        }
+    
+    @classmethod
+    def load_env_file(cls, path: str) -> Dict[str, str]:
+        """
+        Load KEY=VALUE lines from an env file into the process environment
+        
+        Values in the file override variables already set, so edits take
+        effect on reload. Blank lines and # comments are ignored.
+        
+        Args:
+            path: Env file path
+            
+        Returns:
+            Dict of the variables read
+        """
+        values = {}
+        with open(path, 'r', encoding='utf-8') as env_file:
+            for line in env_file:
+                line = line.strip()
+                if not line or line.startswith('#') or '=' not in line:
+                    continue
+                key, value = line.split('=', 1)
+                values[key.strip()] = value.strip().strip('"').strip("'")
+        os.environ.update(values)
+        return values
+    
+    @classmethod
+    def reload(cls, env_file: Optional[str] = None):
+        """
+        Re-read all settings from the environment
+        
+        The settings are updated in place on this class, so modules that
+        imported Config see the new values.
+        
+        Args:
+            env_file: Optional env file loaded into the environment first
+        """
+        if env_file:
+            cls.load_env_file(env_file)
+        module = sys.modules[cls.__module__]
+        fresh = importlib.reload(module).Config
+        for name, value in vars(fresh).items():
+            if name.isupper():
+                setattr(cls, name, value)
+        module.Config = cls
+        logger.info("Configuration reloaded")
@@ -7,23 +7,105 @@ Provides API endpoints for device operations
 
 import logging
 import json
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
 
-from services.device_service import DeviceService
+from services.device_service import DeviceService, redact_device_data
+from services.sync_job_service import SyncJobService, JOB_RUNNING, ACTIVE_STATES
+from services.sync_lock import LOCK_WAIT
+from services.snapshot_service import SnapshotService, snapshot_file
+from services.reconcile_service import ReconcileService
+from services.log_service import LogTailer
+from services.log_index import LogIndex, LogQuery
+from services.attendance_index import AttendanceStore, AttendanceQuery
+from services import export_service
+from services.metrics import SYNC_QUEUE_DEPTH
+from config import Config
 
 logger = logging.getLogger(__name__)
 
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_device_controller() -> 'DeviceController':
+    """
+    Get the process-wide controller, building it on first use
+    
+    Entry points call this from request handlers instead of building the
+    controller at import time, so importing them stays cheap.
+    """
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = DeviceController()
+    return _controller
+
 class DeviceController:
     """Controller for device operations and API endpoints"""
     
     def __init__(self):
         """Initialize device controller"""
         self.device_service = DeviceService()
+        self.sync_jobs = SyncJobService(
+            service_factory=DeviceService,
+            history_limit=Config.get_sync_config()['job_history']
+        )
+        self.attendance_store = AttendanceStore(
+            loader=self.device_service.get_device_data,
+            max_age=Config.get_query_config()['index_max_age'],
+            device=Config.DEVICE_IP,
+            prober=self.device_service.get_change_marker
+        )
+        SYNC_QUEUE_DEPTH.set_function(lambda: {(Config.DEVICE_IP,): self.sync_jobs.queue_depth()})
+        self.snapshot_service = SnapshotService(
+            service_factory=DeviceService,
+            interval=Config.get_sync_config()['snapshot_interval'],
+            state_file=snapshot_file(Config.get_sync_config()['snapshot_file'], Config.LOG_FILE),
+            device=Config.DEVICE_IP
+        )
+        self.sync_jobs.add_listener(self._on_sync_job)
+        self.attendance_store.add_listener(self._on_index_loaded)
+        self.log_tailer = LogTailer(Config.LOG_FILE)
+        self.log_index = LogIndex(Config.LOG_FILE)
+    
+    def _on_sync_job(self, job):
+        """Feed sync job state changes into the dashboard snapshot"""
+        if job.status == JOB_RUNNING:
+            self.snapshot_service.record_sync_state({'job_id': job.job_id, 'status': job.status})
+            return
+        self.snapshot_service.record_sync_state(None)
+        self.snapshot_service.record_sync(job.result or {
+            'success': False,
+            'message': job.error or 'Sync failed'
+        })
+    
+    def _on_index_loaded(self, index):
+        """Keep the attendance watermark and roster fingerprint in the persisted snapshot"""
+        self.snapshot_service.record_index(index.watermark, index.roster_fingerprint)
+    
+    def get_data_snapshot(self, force: bool = False) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Get the local copy of device data and its ETag, re-reading the device
+        only if its attendance count or user table changed
+        
+        Args:
+            force: Re-read the device without checking for changes
+            
+        Returns:
+            Tuple of (etag, device_data); both None if the device is unreachable
+        """
+        if not self.attendance_store.validate(force=force):
+            return None, None
+        return self.attendance_store.snapshot()
     
-    def get_device_data(self) -> Dict[str, Any]:
+    def get_device_data(self, device_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
-        Get device data via API
+        Get device data via API, without user passwords and card numbers
+        
+        Args:
+            device_data: Already loaded device data (read from the device if None)
         
         Returns:
             Dict containing API response
@@ -31,12 +113,13 @@ class DeviceController:
         try:
             logger.info("API: Getting device data")
             
-            device_data = self.device_service.get_device_data()
+            if device_data is None:
+                device_data = self.device_service.get_device_data()
             if device_data:
                 return {
                     'success': True,
                     'message': 'Device data retrieved successfully',
-                    'data': device_data,
+                    'data': redact_device_data(device_data),
                     'timestamp': datetime.now().isoformat()
                 }
             else:
@@ -64,7 +147,7 @@ class DeviceController:
         try:
             logger.info("API: Syncing device data")
             
-            result = self.device_service.sync_device_data()
+            result = self.device_service.sync_device_data(trigger='api')
             return result
             
         except Exception as e:
@@ -75,6 +158,170 @@ class DeviceController:
                 'timestamp': datetime.now().isoformat()
             }
     
+    def start_sync_job(self, trigger: str = 'api', profile: bool = False,
+                       full_resend: bool = False) -> Dict[str, Any]:
+        """
+        Start a background sync job, attaching to a running one if present
+        
+        Args:
+            trigger: Who requested the sync (api, web, ...)
+            profile: Profile the sync; the result lists the written files
+            full_resend: Upload every day group, not only new or changed ones
+            
+        Returns:
+            Dict containing the job state
+        """
+        try:
+            logger.info(f"API: Starting sync job ({trigger})")
+            
+            job, created = self.sync_jobs.start_sync(trigger=trigger, profile=profile, full_resend=full_resend)
+            return {
+                'success': True,
+                'message': 'Sync job started' if created else 'Attached to running sync job',
+                'created': created,
+                'data': job.to_dict(),
+                'timestamp': datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            logger.error(f"API Error starting sync job: {e}")
+            return {
+                'success': False,
+                'message': f'Sync error: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }
+    
+    def wait_for_sync_job(self, job_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Wait for a sync job to finish and return its sync result
+        
+        Args:
+            job_id: Job identifier
+            timeout: Maximum seconds to wait
+            
+        Returns:
+            Dict containing sync result, or the job state if it failed or is
+            still running ('running' is set when the timeout expired first)
+        """
+        job = self.sync_jobs.get_job(job_id)
+        if not job:
+            return {
+                'success': False,
+                'message': f'Unknown job: {job_id}',
+                'timestamp': datetime.now().isoformat()
+            }
+        if not self.sync_jobs.wait(job, timeout):
+            return {
+                'success': True,
+                'running': True,
+                'message': f'Sync job still running, poll /api/jobs/{job.job_id}',
+                'data': job.to_dict(),
+                'timestamp': datetime.now().isoformat()
+            }
+        if job.result:
+            return job.result
+        return {
+            'success': False,
+            'message': job.error or 'Sync job still running',
+            'data': job.to_dict(),
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def get_sync_job(self, job_id: str) -> Dict[str, Any]:
+        """
+        Get progress of a sync job via API
+        
+        Args:
+            job_id: Job identifier
+            
+        Returns:
+            Dict containing job state
+        """
+        job = self.sync_jobs.get_job(job_id)
+        if not job:
+            return {
+                'success': False,
+                'message': f'Unknown job: {job_id}',
+                'timestamp': datetime.now().isoformat()
+            }
+        return {
+            'success': True,
+            'message': 'Job status retrieved successfully',
+            'data': job.to_dict(),
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def list_sync_jobs(self) -> Dict[str, Any]:
+        """
+        List recent sync jobs via API
+        
+        Returns:
+            Dict containing job states, newest first
+        """
+        return {
+            'success': True,
+            'message': 'Jobs retrieved successfully',
+            'data': self.sync_jobs.list_jobs(),
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def reconcile(self, start: Optional[str] = None, end: Optional[str] = None,
+                  dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Compare acknowledged uploads with the server's digests and start a
+        sync job resending the days that differ
+        
+        Args:
+            start: First date to check (YYYY-MM-DD, default: oldest acknowledged)
+            end: Last date to check (YYYY-MM-DD, default: newest acknowledged)
+            dry_run: Only report the differing days
+            
+        Returns:
+            Dict containing the comparison and, if a sync was started, its
+            job; 'busy' is set when a running sync job kept the resend from
+            starting (the running job chose its records before the check)
+            
+        Raises:
+            ValueError: If a date is malformed or reconciliation is off
+        """
+        try:
+            logger.info("API: Reconciling uploads with the server")
+            
+            reconcile_service = ReconcileService(self.device_service)
+            report = reconcile_service.compare(start, end)
+            result = {
+                'success': True,
+                'message': f"{len(report['days_differing'])} days differ",
+                'data': report,
+                'timestamp': datetime.now().isoformat()
+            }
+            if not report['days_differing'] or dry_run:
+                return result
+            
+            running = self.sync_jobs.active_job
+            if running and running.status in ACTIVE_STATES:
+                return dict(result, success=False, busy=True, job=running.to_dict(),
+                            message=f"{result['message']}; a sync job is running, reconcile again when it finishes")
+            
+            reconcile_service.forget(report['days_differing'])
+            # Another process's running sync cannot resend the forgotten days; wait for it
+            job, created = self.sync_jobs.start_sync(trigger='reconcile', lock_mode=LOCK_WAIT, attach=False)
+            result['job'] = job.to_dict()
+            if not created:
+                return dict(result, success=False, busy=True,
+                            message=f"{result['message']}; a sync job started meanwhile, it or the next sync resends them")
+            return result
+            
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"API Error reconciling uploads: {e}")
+            return {
+                'success': False,
+                'message': f'Reconcile error: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }
+    
     def get_device_status(self) -> Dict[str, Any]:
         """
         Get device status only (lightweight) via API
@@ -171,17 +418,21 @@ class DeviceController:
                 'timestamp': datetime.now().isoformat()
             }
     
-    def get_formatted_data(self) -> Dict[str, Any]:
+    def get_formatted_data(self, device_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Get formatted data ready for server transmission via API
         
+        Args:
+            device_data: Already loaded device data (read from the device if None)
+        
         Returns:
             Dict containing formatted data
         """
         try:
             logger.info("API: Getting formatted data")
             
-            device_data = self.device_service.get_device_data()
+            if device_data is None:
+                device_data = self.device_service.get_device_data()
             if not device_data:
                 return {
                     'success': False,
@@ -210,4 +461,159 @@ class DeviceController:
                 'success': False,
                 'message': f'Error: {str(e)}',
                 'timestamp': datetime.now().isoformat()
-            } 
\ No newline at end of file
+            }
+    
+    def query_attendance(self, query: AttendanceQuery) -> Dict[str, Any]:
+        """
+        Query attendance records from the indexed local copy via API
+        
+        Args:
+            query: Validated attendance query
+            
+        Returns:
+            Dict containing one page of records and the next cursor
+        """
+        try:
+            logger.info("API: Querying attendance")
+            
+            if not self.attendance_store.ensure_fresh():
+                return {
+                    'success': False,
+                    'message': 'Failed to retrieve device data',
+                    'timestamp': datetime.now().isoformat()
+                }
+            
+            page = self.attendance_store.query(query)
+            return {
+                'success': True,
+                'message': 'Attendance records retrieved successfully',
+                'data': page['records'],
+                'paging': {
+                    'count': page['count'],
+                    'limit': query.limit,
+                    'next_cursor': page['next_cursor']
+                },
+                'index_refreshed_at': page['index_refreshed_at'],
+                'timestamp': datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            logger.error(f"API Error querying attendance: {e}")
+            return {
+                'success': False,
+                'message': f'Error: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }
+    
+    def export_attendance(self, query: AttendanceQuery, export_format: str, bom: bool = False):
+        """
+        Build a streaming attendance export
+        
+        Args:
+            query: Validated attendance query
+            export_format: 'ndjson', 'csv' or 'formatted' (server API records as NDJSON)
+            bom: Prefix CSV output with a UTF-8 byte order mark
+            
+        Returns:
+            Generator of text chunks, or None if no device data is available
+        """
+        logger.info(f"API: Exporting attendance ({export_format})")
+        
+        if not self.attendance_store.ensure_fresh():
+            return None
+        
+        if export_format == 'csv':
+            return export_service.iter_csv(self.attendance_store, query, bom=bom)
+        if export_format == 'formatted':
+            return export_service.iter_formatted_ndjson(self.attendance_store, query)
+        return export_service.iter_ndjson(self.attendance_store, query)
+    
+    def get_dashboard_snapshot(self) -> Dict[str, Any]:
+        """
+        Get the background-refreshed dashboard snapshot (no device traffic)
+        
+        Starts the background refresher on first use.
+        
+        Returns:
+            Dict containing the snapshot
+        """
+        try:
+            self.snapshot_service.start()
+            return {
+                'success': True,
+                'message': 'Snapshot retrieved successfully',
+                'data': self.snapshot_service.get_snapshot(),
+                'timestamp': datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            logger.error(f"API Error getting dashboard snapshot: {e}")
+            return {
+                'success': False,
+                'message': f'Error: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }
+    
+    def get_recent_logs(self, count: int, offset: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Get the most recent log records, or those written after an offset
+        
+        Args:
+            count: Maximum number of records
+            offset: Byte offset returned by a previous call (follow mode)
+            
+        Returns:
+            Dict containing records and the offset to follow from
+        """
+        try:
+            if offset is None:
+                logs = self.log_tailer.tail(count)
+            else:
+                logs = self.log_tailer.follow(offset, count)
+            return {
+                'success': True,
+                'message': f"Retrieved {len(logs['records'])} log records",
+                'data': logs,
+                'timestamp': datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            logger.error(f"API Error getting recent logs: {e}")
+            return {
+                'success': False,
+                'message': f'Error: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }
+    
+    def search_logs(self, query: LogQuery) -> Dict[str, Any]:
+        """
+        Search the sync log and its rotations through the sidecar index
+        
+        Args:
+            query: Validated log query
+            
+        Returns:
+            Dict containing matching records (newest first) and scan statistics
+        """
+        try:
+            logger.info("API: Searching logs")
+            result = self.log_index.search(query)
+            return {
+                'success': True,
+                'message': f"Found {len(result['records'])} log records",
+                'data': result['records'],
+                'stats': {
+                    'blocks_scanned': result['blocks_scanned'],
+                    'blocks_total': result['blocks_total'],
+                    'truncated': result['truncated']
+                },
+                'timestamp': datetime.now().isoformat()
+            }
+            
+        except Exception as e:
+            logger.error(f"API Error searching logs: {e}")
+            return {
+                'success': False,
+                'message': f'Error: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }
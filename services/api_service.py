@@ -6,17 +6,24 @@ Handles direct communication with ZKTeco attendance devices
 """
 
 import logging
-from typing import Optional, Dict, Any, List
-from zk import ZK
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple, Callable
 from datetime import datetime
 import time
 
+from .metrics import DEVICE_CONNECT_SECONDS, DEVICE_READ_SECONDS, DEVICE_READ_BYTES, DEVICE_READ_RECORDS, DEVICE_ERRORS
+
 logger = logging.getLogger(__name__)
 
+# Attendance record size on the wire by user packet size (zk6: 28, zk8: 72);
+# pyzk does not expose the actual size, so byte metrics are estimates
+ATTENDANCE_RECORD_SIZE = {28: 16, 72: 40}
+
 class ApiService:
     """Service for handling ZKTeco device API communication"""
     
-    def __init__(self, device_ip: str, device_port: int = 4370, timeout: int = 5):
+    def __init__(self, device_ip: str, device_port: int = 4370, timeout: int = 5,
+                 force_udp: bool = False, skip_ping: bool = False):
         """
         Initialize API service
         
@@ -24,12 +31,18 @@ class ApiService:
             device_ip: Device IP address
             device_port: Device port (default: 4370)
             timeout: Connection timeout in seconds
+            force_udp: Talk to the device over UDP instead of TCP
+            skip_ping: Do not ping the device before connecting
         """
         self.device_ip = device_ip
         self.device_port = device_port
         self.timeout = timeout
-        self.zk = ZK(device_ip, port=device_port, timeout=timeout)
+        # Imported here so importing the services does not load pyzk
+        from zk import ZK
+        self.zk = ZK(device_ip, port=device_port, timeout=timeout, force_udp=force_udp, ommit_ping=skip_ping)
         self.connection = None
+        # SyncStats of the running sync, if any; reads and retries are added to it
+        self.stats = None
         
     def connect(self) -> bool:
         """
@@ -40,7 +53,11 @@ class ApiService:
         """
         try:
             logger.info(f"Attempting to connect to device {self.device_ip}:{self.device_port}")
-            self.connection = self.zk.connect()
+            started = time.perf_counter()
+            try:
+                self.connection = self.zk.connect()
+            finally:
+                DEVICE_CONNECT_SECONDS.observe(time.perf_counter() - started, device=self.device_ip)
             if self.connection:
                 logger.info(f"Successfully connected to device {self.device_ip}:{self.device_port}")
                 return True
@@ -49,6 +66,7 @@ class ApiService:
                 return False
         except Exception as e:
             logger.error(f"Error connecting to device {self.device_ip}:{self.device_port}: {e}")
+            DEVICE_ERRORS.inc(device=self.device_ip, operation='connect')
             return False
     
     def disconnect(self):
@@ -69,7 +87,7 @@ class ApiService:
         """
         try:
             # Ensure we have a connection
-            if not self.connection or not self.connection.is_enable():
+            if not self.connection or not self.connection.is_connect:
                 if not self.connect():
                     return None
             
@@ -117,11 +135,13 @@ class ApiService:
         """
         try:
             # Ensure we have a connection
-            if not self.connection or not self.connection.is_enable():
+            if not self.connection or not self.connection.is_connect:
                 if not self.connect():
                     return None
             
+            started = time.perf_counter()
             users = self.connection.get_users()
+            self._record_read('users', started, len(users), getattr(self.zk, 'user_packet_size', 72))
             users_info = []
             
             for user in users:
@@ -132,8 +152,9 @@ class ApiService:
                     'privilege': user.privilege,
                     'password': user.password,
                     'group_id': user.group_id,
-                    'user_sns': user.user_sns,
-                    'work_code': user.work_code
+                    # Not set by pyzk 0.9's User
+                    'user_sns': getattr(user, 'user_sns', None),
+                    'work_code': getattr(user, 'work_code', None)
                 }
                 users_info.append(user_info)
             
@@ -142,12 +163,17 @@ class ApiService:
             
         except Exception as e:
             logger.error(f"Error getting users info: {e}")
+            DEVICE_ERRORS.inc(device=self.device_ip, operation='read_users')
             # Try to reconnect on error
+            if self.stats:
+                self.stats.add_retry('device')
             try:
                 self.disconnect()
                 if self.connect():
                     # Retry once after reconnection
+                    started = time.perf_counter()
                     users = self.connection.get_users()
+                    self._record_read('users', started, len(users), getattr(self.zk, 'user_packet_size', 72))
                     users_info = []
                     
                     for user in users:
@@ -158,8 +184,8 @@ class ApiService:
                             'privilege': user.privilege,
                             'password': user.password,
                             'group_id': user.group_id,
-                            'user_sns': user.user_sns,
-                            'work_code': user.work_code
+                            'user_sns': getattr(user, 'user_sns', None),
+                            'work_code': getattr(user, 'work_code', None)
                         }
                         users_info.append(user_info)
                     
@@ -169,20 +195,27 @@ class ApiService:
                 logger.error(f"Error getting users info after reconnection: {retry_e}")
             return None
     
-    def get_attendance_info(self) -> Optional[List[Dict[str, Any]]]:
+    def get_attendance_info(self, progress_callback: Optional[Callable[[int], None]] = None) -> Optional[List[Dict[str, Any]]]:
         """
         Get attendance information from device
         
+        Args:
+            progress_callback: Optional callable receiving the (estimated)
+                number of records received so far after each chunk
+        
         Returns:
             List of attendance records or None if failed
         """
         try:
             # Ensure we have a connection
-            if not self.connection or not self.connection.is_enable():
+            if not self.connection or not self.connection.is_connect:
                 if not self.connect():
                     return None
             
-            attendance = self.connection.get_attendance()
+            started = time.perf_counter()
+            with self._chunk_progress(progress_callback):
+                attendance = self.connection.get_attendance()
+            self._record_read('attendance', started, len(attendance), self._attendance_record_size())
             attendance_info = []
             
             for record in attendance:
@@ -199,12 +232,18 @@ class ApiService:
             
         except Exception as e:
             logger.error(f"Error getting attendance info: {e}")
+            DEVICE_ERRORS.inc(device=self.device_ip, operation='read_attendance')
             # Try to reconnect on error
+            if self.stats:
+                self.stats.add_retry('device')
             try:
                 self.disconnect()
                 if self.connect():
                     # Retry once after reconnection
-                    attendance = self.connection.get_attendance()
+                    started = time.perf_counter()
+                    with self._chunk_progress(progress_callback):
+                        attendance = self.connection.get_attendance()
+                    self._record_read('attendance', started, len(attendance), self._attendance_record_size())
                     attendance_info = []
                     
                     for record in attendance:
@@ -222,6 +261,114 @@ class ApiService:
                 logger.error(f"Error getting attendance info after reconnection: {retry_e}")
             return None
     
+    @contextmanager
+    def _chunk_progress(self, progress_callback: Optional[Callable[[int], None]]):
+        """
+        Report records received while the attendance log is read in chunks
+        
+        pyzk reads the log with read_with_buffer(), one chunk per request,
+        but has no progress hook; the connection's private chunk reader is
+        wrapped for the duration of the attendance read only (not the user
+        table read that get_attendance() does first). Without that reader
+        nothing is reported.
+        """
+        connection = self.connection
+        read_chunk = getattr(connection, '_ZK__read_chunk', None)
+        read_with_buffer = getattr(connection, 'read_with_buffer', None)
+        if progress_callback is None or read_chunk is None or read_with_buffer is None:
+            yield
+            return
+        
+        from zk import const
+        record_size = self._attendance_record_size()
+        state = {'reading': False, 'bytes': 0}
+        
+        def counting_read_with_buffer(command, *args, **kwargs):
+            state['reading'] = command == const.CMD_ATTLOG_RRQ
+            try:
+                return read_with_buffer(command, *args, **kwargs)
+            finally:
+                state['reading'] = False
+        
+        def counting_read_chunk(start, size):
+            data = read_chunk(start, size)
+            if state['reading']:
+                state['bytes'] += len(data)
+                progress_callback(state['bytes'] // record_size)
+            return data
+        
+        connection.read_with_buffer = counting_read_with_buffer
+        connection._ZK__read_chunk = counting_read_chunk
+        try:
+            yield
+        finally:
+            del connection.read_with_buffer
+            del connection._ZK__read_chunk
+    
+    def _attendance_record_size(self) -> int:
+        """Estimated wire size of one attendance record"""
+        return ATTENDANCE_RECORD_SIZE.get(getattr(self.zk, 'user_packet_size', 72), 40)
+    
+    def _record_read(self, table: str, started: float, records: int, record_size: int):
+        """
+        Record metrics for a finished table read
+        
+        Args:
+            table: 'users' or 'attendance'
+            started: perf_counter() value taken before the read
+            records: Number of records read
+            record_size: Bytes per record on the wire
+        """
+        DEVICE_READ_SECONDS.observe(time.perf_counter() - started, device=self.device_ip, table=table)
+        DEVICE_READ_RECORDS.inc(records, device=self.device_ip, table=table)
+        DEVICE_READ_BYTES.inc(records * int(record_size), device=self.device_ip, table=table)
+        if self.stats:
+            self.stats.add_bytes('device', records * int(record_size))
+    
+    def get_record_counts(self) -> Tuple[int, int]:
+        """
+        Get user and attendance record counts
+        
+        Reads the device's size table, which is a single small command,
+        instead of transferring the user table and attendance log. Falls
+        back to full reads if the device does not answer it.
+        
+        Returns:
+            Tuple of (users_count, attendance_count)
+        """
+        try:
+            self.connection.read_sizes()
+            return self.connection.users, self.connection.records
+        except Exception as e:
+            logger.warning(f"Could not read record counts, falling back to full reads: {e}")
+            users = self.get_users_info()
+            attendance = self.get_attendance_info()
+            return len(users) if users else 0, len(attendance) if attendance else 0
+    
+    def get_table_sizes(self) -> Optional[Tuple[int, int]]:
+        """
+        Get user and attendance record counts from the device's size table
+        
+        Unlike get_record_counts() this never falls back to reading the
+        user table or the log, so it always costs a single small command.
+        
+        Returns:
+            Tuple of (users_count, attendance_count) or None if failed
+        """
+        try:
+            # Ensure we have a connection
+            if not self.connection or not self.connection.is_connect:
+                if not self.connect():
+                    return None
+            
+            self.connection.read_sizes()
+            return self.connection.users, self.connection.records
+        except Exception as e:
+            logger.error(f"Error reading table sizes: {e}")
+            DEVICE_ERRORS.inc(device=self.device_ip, operation='read_sizes')
+            self.disconnect()
+            return None
+    
     def get_device_status(self) -> Optional[Dict[str, Any]]:
         """
         Get comprehensive device status
@@ -231,7 +378,7 @@ class ApiService:
         """
         try:
             # Ensure we have a connection
-            if not self.connection or not self.connection.is_enable():
+            if not self.connection or not self.connection.is_connect:
                 if not self.connect():
                     return None
             
@@ -240,13 +387,8 @@ class ApiService:
             if not device_info:
                 return None
             
-            # Get users count
-            users = self.get_users_info()
-            users_count = len(users) if users else 0
-            
-            # Get attendance count
-            attendance = self.get_attendance_info()
-            attendance_count = len(attendance) if attendance else 0
+            # Get users and attendance counts
+            users_count, attendance_count = self.get_record_counts()
             
             # Compile status
             status = {
@@ -263,17 +405,15 @@ class ApiService:
         except Exception as e:
             logger.error(f"Error getting device status: {e}")
             # Try to reconnect and retry once
+            if self.stats:
+                self.stats.add_retry('device')
             try:
                 self.disconnect()
                 if self.connect():
                     # Retry getting device info
                     device_info = self.get_device_info()
                     if device_info:
-                        users = self.get_users_info()
-                        users_count = len(users) if users else 0
-                        
-                        attendance = self.get_attendance_info()
-                        attendance_count = len(attendance) if attendance else 0
+                        users_count, attendance_count = self.get_record_counts()
                         
                         status = {
                             'device_info': device_info,
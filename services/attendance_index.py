@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Attendance Index for ZKTeco Device Information System
+Indexed local copy of device attendance logs for filtered, paginated queries
+"""
+
+import base64
+import hashlib
+import heapq
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Optional, Dict, Any, List, Tuple, Iterator, Callable
+from datetime import datetime
+
+from .metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Fields a client may request; user secrets (password, card) are never exposed
+QUERY_FIELDS = ('device', 'user_id', 'name', 'timestamp', 'date', 'time', 'status', 'punch')
+
+# Positions inside an indexed record tuple
+REC_TIMESTAMP, REC_ORDINAL, REC_USER, REC_STATUS, REC_PUNCH = range(5)
+
+
+class AttendanceQuery:
+    """Validated attendance query parameters"""
+
+    def __init__(self, start: Optional[str] = None, end: Optional[str] = None,
+                 user_ids: Optional[List[str]] = None, device: Optional[str] = None,
+                 fields: Optional[List[str]] = None, limit: int = 100,
+                 cursor: Optional[str] = None):
+        """
+        Initialize attendance query
+
+        Args:
+            start: Inclusive lower bound ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS')
+            end: Inclusive upper bound (a bare date covers the whole day)
+            user_ids: Only return punches of these users
+            device: Only return punches of this device (serial number or IP)
+            fields: Fields to include in each row
+            limit: Page size
+            cursor: Opaque cursor returned by the previous page
+        """
+        self.start = _normalize_bound(start, end_of_day=False) if start else None
+        self.end = _normalize_bound(end, end_of_day=True) if end else None
+        self.user_ids = [str(user_id) for user_id in user_ids] if user_ids else None
+        self.device = device
+        self.fields = list(fields) if fields else list(QUERY_FIELDS)
+        self.limit = limit
+        self.after = decode_cursor(cursor) if cursor else None
+
+        unknown = [field for field in self.fields if field not in QUERY_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        if self.start and self.end and self.start > self.end:
+            raise ValueError("start must not be after end")
+
+    @classmethod
+    def from_args(cls, args, default_limit: int = 100, max_limit: int = 1000,
+                  paged: bool = True) -> 'AttendanceQuery':
+        """
+        Build a query from request arguments
+
+        Args:
+            args: Mapping with getlist() (e.g. flask request.args)
+            default_limit: Page size when none is given
+            max_limit: Largest accepted page size
+            paged: False for exports, which cover every match: limit and
+                cursor are then ignored instead of validated
+
+        Returns:
+            AttendanceQuery
+
+        Raises:
+            ValueError: If a parameter is invalid
+        """
+        limit = default_limit
+        if paged:
+            try:
+                limit = int(args.get('limit', default_limit))
+            except (TypeError, ValueError):
+                raise ValueError("limit must be an integer")
+            if limit < 1 or limit > max_limit:
+                raise ValueError(f"limit must be between 1 and {max_limit}")
+
+        return cls(
+            start=args.get('start'),
+            end=args.get('end'),
+            user_ids=_split_list(args.getlist('user_id')),
+            device=args.get('device'),
+            fields=_split_list(args.getlist('fields')),
+            limit=limit,
+            cursor=args.get('cursor') if paged else None
+        )
+
+
+class AttendanceIndex:
+    """Sorted, per-user indexed attendance log of a single device"""
+
+    def __init__(self, device_info: Dict[str, Any], users: List[Dict[str, Any]],
+                 attendance: List[Dict[str, Any]]):
+        """
+        Build the index
+
+        Args:
+            device_info: Device info dict (serial_number, ip_address, ...)
+            users: User dicts as returned by ApiService.get_users_info()
+            attendance: Attendance dicts as returned by ApiService.get_attendance_info()
+        """
+        self.device_id = str(device_info.get('serial_number') or device_info.get('ip_address', 'unknown'))
+        self.aliases = {self.device_id, str(device_info.get('ip_address', ''))}
+        self.names = {str(user.get('user_id', '')): user.get('name', '') for user in users}
+
+        # The device log is append-only, so the original position (ordinal)
+        # is a stable tie-breaker for punches sharing a timestamp.
+        records = [
+            (str(record.get('timestamp', '')), ordinal, str(record.get('user_id', '')),
+             record.get('status'), record.get('punch'))
+            for ordinal, record in enumerate(attendance)
+        ]
+        records.sort()
+        self.records = records
+        self.keys = [(record[REC_TIMESTAMP], record[REC_ORDINAL]) for record in records]
+
+        # Change detectors: the log only grows at the end, and any roster
+        # edit changes the fingerprint
+        last = records[-1] if records else ('', -1)
+        self.watermark = f"{len(records)}@{last[REC_TIMESTAMP]}#{last[REC_ORDINAL]}"
+        self.roster_fingerprint = roster_fingerprint(users)
+
+        self.user_keys = {}
+        self.user_records = {}
+        for record in records:
+            user_id = record[REC_USER]
+            if user_id not in self.user_records:
+                self.user_records[user_id] = []
+                self.user_keys[user_id] = []
+            self.user_records[user_id].append(record)
+            self.user_keys[user_id].append((record[REC_TIMESTAMP], record[REC_ORDINAL]))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def matches_device(self, device: Optional[str]) -> bool:
+        """Check whether a device filter selects this index"""
+        return not device or device in self.aliases
+
+    def iter_range(self, start: Optional[str] = None, end: Optional[str] = None,
+                   user_ids: Optional[List[str]] = None,
+                   after: Optional[Tuple[str, int]] = None) -> Iterator[tuple]:
+        """
+        Iterate indexed records in timestamp order
+
+        Args:
+            start: Inclusive lower timestamp bound
+            end: Inclusive upper timestamp bound
+            user_ids: Restrict to these users (repeats are ignored)
+            after: Only records strictly after this (timestamp, ordinal) key
+
+        Yields:
+            Record tuples (timestamp, ordinal, user_id, status, punch)
+        """
+        if user_ids is None:
+            return self._slice(self.keys, self.records, start, end, after)
+        # A repeated id would merge the same user's records twice
+        return heapq.merge(*[
+            self._slice(self.user_keys[user_id], self.user_records[user_id], start, end, after)
+            for user_id in dict.fromkeys(user_ids) if user_id in self.user_records
+        ])
+
+    @staticmethod
+    def _slice(keys, records, start, end, after) -> Iterator[tuple]:
+        """Yield the records of one sorted array that fall in the window"""
+        lo = bisect_left(keys, (start, -1)) if start else 0
+        if after:
+            lo = max(lo, bisect_right(keys, after))
+        # Timestamps are 'YYYY-MM-DD HH:MM:SS' strings, so a '\uffff' suffix sorts after
+        # every timestamp sharing the bound as a prefix
+        hi = bisect_right(keys, (end + '\uffff', -1)) if end else len(keys)
+        for position in range(lo, hi):
+            yield records[position]
+
+    def row(self, record: tuple, fields: List[str]) -> Dict[str, Any]:
+        """
+        Project an indexed record onto the requested fields
+
+        Args:
+            record: Record tuple
+            fields: Field names from QUERY_FIELDS
+
+        Returns:
+            Dict with the requested fields
+        """
+        timestamp = record[REC_TIMESTAMP]
+        values = {
+            'device': self.device_id,
+            'user_id': record[REC_USER],
+            'name': self.names.get(record[REC_USER], f"User {record[REC_USER]}"),
+            'timestamp': timestamp,
+            'date': timestamp[:10],
+            'time': timestamp[11:19],
+            'status': record[REC_STATUS],
+            'punch': record[REC_PUNCH]
+        }
+        return {field: values[field] for field in fields}
+
+
+class AttendanceStore:
+    """Holds the attendance indexes of all devices and refreshes them when stale"""
+
+    def __init__(self, loader: Callable[[], Optional[Dict[str, Any]]], max_age: float = 300,
+                 device: str = 'all',
+                 prober: Optional[Callable[[], Optional[Tuple[int, int]]]] = None):
+        """
+        Initialize attendance store
+
+        Args:
+            loader: Callable returning device data (DeviceService.get_device_data)
+            max_age: Seconds before the local copy is refreshed from the device
+            device: Device label used for cache metrics
+            prober: Callable returning (user count, attendance count) from the
+                device's size table (DeviceService.get_change_marker); validate()
+                re-reads the device whenever it probes without it
+        """
+        self.loader = loader
+        self.prober = prober
+        self.max_age = max_age
+        self.device = device
+        self.indexes = {}
+        self.refreshed_at = None
+        self.latest = None  # (etag, device_data) of the most recent load
+        self.listeners = []
+        self.marker = None  # (user count, record count) of the most recent load
+        self._refreshed_monotonic = None
+        self._validated_monotonic = None
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback: Callable[['AttendanceIndex'], None]):
+        """
+        Register a callback invoked with each newly built device index
+
+        Args:
+            callback: Callable receiving the AttendanceIndex
+        """
+        self.listeners.append(callback)
+
+    def is_stale(self) -> bool:
+        """Check whether the local copy needs a refresh"""
+        return (self._refreshed_monotonic is None or
+                time.monotonic() - self._refreshed_monotonic > self.max_age)
+
+    def ensure_fresh(self, force: bool = False) -> bool:
+        """
+        Refresh the local copy if it is older than max_age
+
+        Args:
+            force: Re-read the device even if the copy is fresh
+
+        Returns:
+            bool: True if an index is available
+        """
+        if force or self.is_stale():
+            with self._lock:
+                if force or self.is_stale():
+                    CACHE_REQUESTS.inc(device=self.device, cache='attendance_index', result='miss')
+                    device_data = self.loader()
+                    if device_data:
+                        self.load(device_data)
+                    return bool(self.indexes)
+        CACHE_REQUESTS.inc(device=self.device, cache='attendance_index', result='hit')
+        return bool(self.indexes)
+
+    def validate(self, force: bool = False) -> bool:
+        """
+        Make sure the most recent load still matches the device
+
+        Asks the device at most once per max_age, and then only for its size
+        table: the user and attendance counts are compared with those of the
+        last load, and the device is re-read only if they differ. The log is
+        append-only, so a new punch always changes the count. An edit that
+        keeps the user count (a rename) shows once the copy is reloaded.
+
+        Args:
+            force: Re-read the device without comparing
+
+        Returns:
+            bool: True if the most recent load matches the device; False if
+            the device could not be read
+        """
+        with self._lock:
+            if not force and self.latest is not None and self._validated_monotonic is not None and \
+                    time.monotonic() - self._validated_monotonic <= self.max_age:
+                CACHE_REQUESTS.inc(device=self.device, cache='attendance_index', result='hit')
+                return True
+
+            started = time.monotonic()
+            unchanged = False
+            if not force and self.latest is not None and self.prober:
+                probe = self.prober()
+                if probe is None:
+                    self._validated_monotonic = None
+                    return False
+                unchanged = tuple(probe) == self.marker
+
+            if unchanged:
+                CACHE_REQUESTS.inc(device=self.device, cache='attendance_index', result='hit')
+            else:
+                CACHE_REQUESTS.inc(device=self.device, cache='attendance_index', result='miss')
+                device_data = self.loader()
+                if not device_data:
+                    self._validated_monotonic = None
+                    return False
+                self.load(device_data)
+            self._validated_monotonic = started
+            return True
+
+    def load(self, device_data: Dict[str, Any]):
+        """
+        Replace a device's index from freshly read device data
+
+        Args:
+            device_data: Device data as returned by DeviceService.get_device_data()
+        """
+        device_info = device_data.get('device_status', {}).get('device_info', {})
+        index = AttendanceIndex(device_info, device_data.get('users', []), device_data.get('attendance', []))
+        self.indexes[index.device_id] = index
+        self.latest = (self.etag(), device_data)
+        self.marker = (len(device_data.get('users', [])), len(index))
+        self.refreshed_at = datetime.now()
+        self._refreshed_monotonic = time.monotonic()
+        logger.info(f"Attendance index built for device {index.device_id}: {len(index)} records")
+        for callback in self.listeners:
+            try:
+                callback(index)
+            except Exception as e:
+                logger.error(f"Error in attendance index listener: {e}")
+
+    def etag(self) -> Optional[str]:
+        """
+        Validator for the local copy
+
+        Derived only from each device's watermark and roster fingerprint, so
+        it stays the same across refreshes until a punch or user changes.
+        Read times in the data still differ between loads, so it is served
+        as a weak ETag.
+
+        Returns:
+            Hex digest or None if nothing is loaded
+        """
+        if not self.indexes:
+            return None
+        parts = [
+            f"{device_id}|{index.watermark}|{index.roster_fingerprint}"
+            for device_id, index in sorted(self.indexes.items())
+        ]
+        return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def snapshot(self) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Get the most recently loaded device data with its ETag
+
+        Returns:
+            Tuple of (etag, device_data); both None if nothing is loaded
+        """
+        return self.latest or (None, None)
+
+    def iter_records(self, query: AttendanceQuery) -> Iterator[Tuple[AttendanceIndex, tuple]]:
+        """
+        Iterate matching records of all selected devices in timestamp order
+
+        Args:
+            query: Attendance query (limit is ignored)
+
+        Yields:
+            Tuples of (index, record)
+        """
+        after_ts, after_device, after_ord = query.after if query.after else (None, None, None)
+        streams = []
+        for device_id in sorted(self.indexes):
+            index = self.indexes[device_id]
+            if not index.matches_device(query.device):
+                continue
+            after = None
+            if query.after:
+                # Records sharing the cursor timestamp are ordered by device, then ordinal
+                if device_id < after_device:
+                    after = (after_ts, float('inf'))
+                elif device_id == after_device:
+                    after = (after_ts, after_ord)
+                else:
+                    after = (after_ts, -1)
+            records = index.iter_range(query.start, query.end, query.user_ids, after)
+            streams.append(((record[REC_TIMESTAMP], device_id, record[REC_ORDINAL], index, record) for record in records))
+
+        for _, _, _, index, record in heapq.merge(*streams, key=lambda item: item[:3]):
+            yield index, record
+
+    def query(self, query: AttendanceQuery) -> Dict[str, Any]:
+        """
+        Run a paginated query
+
+        Args:
+            query: Attendance query
+
+        Returns:
+            Dict with records, count and next_cursor (None on the last page)
+        """
+        rows = []
+        last = None
+        has_more = False
+        for index, record in self.iter_records(query):
+            if len(rows) == query.limit:
+                has_more = True
+                break
+            rows.append(index.row(record, query.fields))
+            last = (record[REC_TIMESTAMP], index.device_id, record[REC_ORDINAL])
+
+        return {
+            'records': rows,
+            'count': len(rows),
+            'next_cursor': encode_cursor(last) if has_more else None,
+            'index_refreshed_at': self.refreshed_at.isoformat() if self.refreshed_at else None
+        }
+
+
+def roster_fingerprint(users: List[Dict[str, Any]]) -> str:
+    """
+    Fingerprint a user table independent of device ordering
+
+    Args:
+        users: User dicts as returned by ApiService.get_users_info()
+
+    Returns:
+        Hex digest of the sorted roster
+    """
+    roster = sorted(json.dumps(user, sort_keys=True, default=str) for user in users)
+    return hashlib.sha1('\n'.join(roster).encode('utf-8')).hexdigest()
+
+
+def encode_cursor(key: Tuple[str, str, int]) -> str:
+    """Encode a (timestamp, device_id, ordinal) key as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str, int]:
+    """
+    Decode a cursor produced by encode_cursor()
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        timestamp, device_id, ordinal = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(timestamp), str(device_id), int(ordinal)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _normalize_bound(value: str, end_of_day: bool) -> str:
+    """Validate a date or datetime bound and return it as a timestamp prefix"""
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if fmt == '%Y-%m-%d':
+            return parsed.strftime('%Y-%m-%d') if end_of_day else parsed.strftime('%Y-%m-%d 00:00:00')
+        return parsed.strftime('%Y-%m-%d %H:%M:%S')
+    raise ValueError(f"Invalid date: {value}")
+
+
+def _split_list(values: List[str]) -> Optional[List[str]]:
+    """Flatten repeated and comma-separated query parameters"""
+    items = [item.strip() for value in values for item in value.split(',') if item.strip()]
+    return items or None
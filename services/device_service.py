@@ -6,17 +6,152 @@ Main service for device data operations and server synchronization
 """
 
 import logging
-import requests
 import json
-from typing import Optional, Dict, Any, List
+import sqlite3
+from contextlib import nullcontext
+from typing import Optional, Dict, Any, List, Callable, Tuple
 from datetime import datetime, timedelta
 import time
 
 from .api_service import ApiService
+from .sync_lock import SyncLock, LOCK_MODES
+from .sync_stats import SyncStats, format_stats_line
+from .sync_profiler import SyncProfiler, profile_dir
+from .upload_ledger import UploadLedger, LedgerEntry, ledger_file
+from .log_setup import WarningLimiter
+from .metrics import FORMAT_SECONDS, SERIALIZE_SECONDS, UPLOAD_SECONDS, UPLOAD_BYTES, UPLOAD_RETRIES, SYNC_RUNS
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+def _no_progress(*args, **kwargs):
+    """Default progress callback that ignores updates"""
+    pass
+
+def new_day_group(date_str: str, user_id: str, user_name: str) -> Dict[str, Any]:
+    """
+    Create the accumulator for one user's punches on one day
+    
+    Args:
+        date_str: Date in YYYY-MM-DD format
+        user_id: Device user id
+        user_name: Display name of the user
+        
+    Returns:
+        Dict collecting times and attendance details
+    """
+    return {
+        'date': date_str,
+        'id_number': user_id,
+        'name': user_name,
+        'times': [],
+        'card': '0',
+        'attendance_details': []
+    }
+
+def add_punch(group: Dict[str, Any], time_str: str):
+    """
+    Add one punch (HH:MM:SS) to a day group created by new_day_group()
+    
+    Args:
+        group: Day group to update
+        time_str: Punch time in H:i:s format
+    """
+    # Add time to times array
+    if time_str not in group['times']:
+        group['times'].append(time_str)
+    
+    # Add detailed record
+    group['attendance_details'].append({
+        'date': group['date'],
+        'id_number': group['id_number'],
+        'name': group['name'],
+        'time': time_str,
+        'status': 'Check In' if len(group['times']) % 2 == 1 else 'Check Out',
+        'verification': 'Fingerprint'  # Default verification method
+    })
+
+def to_api_record(group: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a day group to a record in the server API format
+    
+    Args:
+        group: Day group built with new_day_group()/add_punch()
+        
+    Returns:
+        Dict in the attendance_records format
+    """
+    # Sort times chronologically
+    group['times'].sort()
+    
+    # Create the record in API format
+    record = {
+        'date': group['date'],
+        'id_number': group['id_number'],
+        'name': group['name'],
+        'times': group['times'],
+        'card': group['card']
+    }
+    
+    # Add daily details if there are multiple entries
+    if len(group['attendance_details']) > 1:
+        record['daily'] = {
+            'date': group['date'],
+            'user_id': group['id_number'],
+            'attendance_details': group['attendance_details']
+        }
+    
+    return record
+
+# User fields kept off every API response; only the device itself needs them
+USER_SECRET_FIELDS = ('password', 'card')
+
+def redact_device_data(device_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy device data without the users' passwords and card numbers
+    
+    Args:
+        device_data: Device data as returned by DeviceService.get_device_data()
+    
+    Returns:
+        Shallow copy whose users lack USER_SECRET_FIELDS; the input is unchanged
+    """
+    users = [
+        {key: value for key, value in user.items() if key not in USER_SECRET_FIELDS}
+        for user in device_data.get('users', [])
+    ]
+    return dict(device_data, users=users)
+
+class UploadBody:
+    """Request body that reports how many of its bytes were sent"""
+    
+    def __init__(self, body: bytes, on_sent: Callable[[int], None], chunk_size: int = 64 * 1024):
+        """
+        Initialize upload body
+        
+        Args:
+            body: Encoded request body
+            on_sent: Called with the bytes sent so far after each chunk
+            chunk_size: Largest chunk handed out per read
+        """
+        self.body = body
+        self.on_sent = on_sent
+        self.chunk_size = chunk_size
+        self.sent = 0
+    
+    def __len__(self) -> int:
+        # Lets requests send a Content-Length header instead of chunked encoding
+        return len(self.body)
+    
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = len(self.body) - self.sent
+        chunk = self.body[self.sent:self.sent + min(size, self.chunk_size)]
+        if chunk:
+            self.sent += len(chunk)
+            self.on_sent(self.sent)
+        return chunk
+
 class DeviceService:
     """Main service for device data operations and server synchronization"""
     
@@ -24,7 +159,19 @@ class DeviceService:
         """Initialize device service"""
         self.config = Config()
         self.api_service = None
+        # Created on first upload; reused so the server connection is kept alive
+        self._session = None
         self._initialize_api_service()
+        sync_config = self.config.get_sync_config()
+        self.sync_lock = SyncLock(sync_config['lock_file'], ttl=sync_config['lock_ttl'])
+    
+    @property
+    def session(self):
+        """HTTP session for the target server (requests is imported on first use)"""
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
     
     def _initialize_api_service(self):
         """Initialize API service with device configuration"""
@@ -32,30 +179,53 @@ class DeviceService:
         self.api_service = ApiService(
             device_ip=device_config['ip'],
             device_port=device_config['port'],
-            timeout=device_config['timeout']
+            timeout=device_config['timeout'],
+            force_udp=device_config['force_udp'],
+            skip_ping=device_config['skip_ping']
         )
     
-    def get_device_data(self) -> Optional[Dict[str, Any]]:
+    def get_device_data(self, progress_callback: Optional[Callable[..., None]] = None,
+                        stats: Optional[SyncStats] = None) -> Optional[Dict[str, Any]]:
         """
         Get comprehensive device data
         
+        Args:
+            progress_callback: Optional callable receiving stage updates
+            stats: Optional SyncStats receiving stage timings and record counts
+            
         Returns:
             Dict containing all device data or None if failed
         """
+        progress = progress_callback or _no_progress
+        stats = stats or SyncStats()
         try:
             logger.info("Starting device data retrieval")
             
             # Get device status
-            device_status = self.api_service.get_device_status()
+            progress('connecting')
+            with stats.stage('connect'):
+                device_status = self.api_service.get_device_status()
             if not device_status:
                 logger.error("Failed to get device status")
                 return None
+            records_total = device_status.get('attendance_count') or 0
+            progress(records_total=records_total, records_processed=0)
             
             # Get users information
-            users_info = self.api_service.get_users_info()
+            progress('reading_users')
+            with stats.stage('read_users'):
+                users_info = self.api_service.get_users_info()
+            stats.set_records('users', len(users_info) if users_info else 0)
             
             # Get attendance information
-            attendance_info = self.api_service.get_attendance_info()
+            progress('reading_attendance')
+            with stats.stage('read_attendance'):
+                attendance_info = self.api_service.get_attendance_info(
+                    progress_callback=lambda received: progress(records_processed=min(received, records_total))
+                )
+            stats.set_records('attendance', len(attendance_info) if attendance_info else 0)
+            records_read = len(attendance_info) if attendance_info else 0
+            progress(records_total=records_read, records_processed=records_read)
             
             # Compile complete data
             device_data = {
@@ -87,6 +257,7 @@ class DeviceService:
         Returns:
             Formatted data for server in the required API format
         """
+        started = time.perf_counter()
         try:
             # Get attendance records and users from device data
             attendance_records = device_data.get('attendance', [])
@@ -99,6 +270,7 @@ class DeviceService:
             
             # Group attendance records by date and user
             attendance_by_date_user = {}
+            parse_warnings = WarningLimiter(logger)
             
             for record in attendance_records:
                 # Extract date and user info from attendance record
@@ -118,33 +290,14 @@ class DeviceService:
                             attendance_by_date_user[date_str] = {}
                         
                         if user_id not in attendance_by_date_user[date_str]:
-                            attendance_by_date_user[date_str][user_id] = {
-                                'date': date_str,
-                                'id_number': user_id,
-                                'name': user_name,
-                                'times': [],
-                                'card': '0',
-                                'attendance_details': []
-                            }
+                            attendance_by_date_user[date_str][user_id] = new_day_group(date_str, user_id, user_name)
                         
-                        # Add time to times array
-                        if time_str not in attendance_by_date_user[date_str][user_id]['times']:
-                            attendance_by_date_user[date_str][user_id]['times'].append(time_str)
-                        
-                        # Add detailed record
-                        detail_record = {
-                            'date': date_str,
-                            'id_number': user_id,
-                            'name': user_name,
-                            'time': time_str,
-                            'status': 'Check In' if len(attendance_by_date_user[date_str][user_id]['times']) % 2 == 1 else 'Check Out',
-                            'verification': 'Fingerprint'  # Default verification method
-                        }
-                        attendance_by_date_user[date_str][user_id]['attendance_details'].append(detail_record)
+                        add_punch(attendance_by_date_user[date_str][user_id], time_str)
                         
                     except Exception as e:
-                        logger.warning(f"Error parsing attendance record: {e}")
+                        parse_warnings.warning(f"Error parsing attendance record: {e}")
                         continue
+            parse_warnings.summary('unparseable attendance records')
             
             # Convert to the required API format
             formatted_records = []
@@ -152,27 +305,7 @@ class DeviceService:
             
             for date_str in all_dates:
                 for user_id, user_data in attendance_by_date_user[date_str].items():
-                    # Sort times chronologically
-                    user_data['times'].sort()
-                    
-                    # Create the record in API format
-                    record = {
-                        'date': user_data['date'],
-                        'id_number': user_data['id_number'],
-                        'name': user_data['name'],
-                        'times': user_data['times'],
-                        'card': user_data['card']
-                    }
-                    
-                    # Add daily details if there are multiple entries
-                    if len(user_data['attendance_details']) > 1:
-                        record['daily'] = {
-                            'date': user_data['date'],
-                            'user_id': user_data['id_number'],
-                            'attendance_details': user_data['attendance_details']
-                        }
-                    
-                    formatted_records.append(record)
+                    formatted_records.append(to_api_record(user_data))
             
             # Determine period dates
             if all_dates:
@@ -193,6 +326,7 @@ class DeviceService:
                 'attendance_records': formatted_records
             }
             
+            FORMAT_SECONDS.observe(time.perf_counter() - started, device=self.config.DEVICE_IP)
             logger.info(f"Formatted {len(formatted_records)} attendance records for API")
             return api_data
             
@@ -200,18 +334,33 @@ class DeviceService:
             logger.error(f"Error formatting data for server: {e}")
             return None
     
-    def send_to_server(self, data: Dict[str, Any]) -> bool:
+    def send_to_server(self, data: Dict[str, Any], progress_callback: Optional[Callable[..., None]] = None,
+                       stats: Optional[SyncStats] = None) -> bool:
         """
         Send data to target server
         
         Args:
             data: Formatted data to send
+            progress_callback: Optional callable receiving upload progress
+            stats: Optional SyncStats receiving serialize/upload timings,
+                bytes and retries
             
         Returns:
             bool: True if successful, False otherwise
         """
+        from requests.exceptions import RequestException
+        
+        progress = progress_callback or _no_progress
+        stats = stats or SyncStats()
         try:
             server_config = self.config.get_server_config()
+            device = self.config.DEVICE_IP
+            with stats.stage('serialize'), SERIALIZE_SECONDS.time(device=device):
+                body = json.dumps(data).encode('utf-8')
+            records = len(data.get('attendance_records', []))
+            
+            def report_upload(sent: int):
+                progress(bytes_uploaded=sent, records_processed=records * sent // len(body))
             
             headers = {
                 'Content-Type': 'application/json',
@@ -223,22 +372,33 @@ class DeviceService:
             
             # Retry mechanism
             for attempt in range(server_config['retry_attempts']):
+                if attempt > 0:
+                    UPLOAD_RETRIES.inc(device=device)
+                    stats.add_retry('upload')
+                started = time.perf_counter()
+                progress(records_total=records, records_processed=0, bytes_total=len(body), bytes_uploaded=0)
                 try:
-                    response = requests.post(
-                        server_config['url'],
-                        json=data,
-                        headers=headers,
-                        timeout=server_config['timeout'],
-                        verify=False  # Disable SSL verification for internal devices
-                    )
+                    with stats.stage('upload'):
+                        response = self.session.post(
+                            server_config['url'],
+                            data=UploadBody(body, report_upload),
+                            headers=headers,
+                            timeout=server_config['timeout'],
+                            verify=False  # Disable SSL verification for internal devices
+                        )
+                    UPLOAD_SECONDS.observe(time.perf_counter() - started, device=device, outcome=str(response.status_code))
+                    stats.add_bytes('upload', len(body))
+                    stats.add_bytes('response', len(response.content))
                     
                     if response.status_code == 200:
                         logger.info(f"Data sent successfully to server. Response: {response.text}")
+                        UPLOAD_BYTES.inc(len(body), device=device)
                         return True
                     else:
                         logger.warning(f"Server returned status {response.status_code}: {response.text}")
                         
-                except requests.exceptions.RequestException as e:
+                except RequestException as e:
+                    UPLOAD_SECONDS.observe(time.perf_counter() - started, device=device, outcome='error')
                     logger.warning(f"Request attempt {attempt + 1} failed: {e}")
                     if attempt < server_config['retry_attempts'] - 1:
                         time.sleep(server_config['retry_delay'])
@@ -253,18 +413,91 @@ class DeviceService:
             logger.error(f"Error sending data to server: {e}")
             return False
     
-    def sync_device_data(self) -> Dict[str, Any]:
+    def sync_device_data(self, progress_callback: Optional[Callable[..., None]] = None,
+                         lock_mode: Optional[str] = None, trigger: str = 'sync',
+                         profile: bool = False, full_resend: bool = False) -> Dict[str, Any]:
         """
         Sync device data to server
         
+        Only one sync per device runs at a time across all processes on the
+        host; see services/sync_lock.py.
+        
+        Args:
+            progress_callback: Optional callable receiving stage name and
+                records_total/records_processed/bytes_uploaded updates
+            lock_mode: 'wait', 'attach' or 'skip' if another process is syncing
+                the device (SYNC_LOCK_MODE if None)
+            trigger: Who requested the sync, shown to waiting triggers
+            profile: Run the sync under cProfile, tracemalloc and a stack
+                sampler (see services/sync_profiler.py)
+            full_resend: Upload every day group, not only those the server
+                has not acknowledged unchanged (see services/upload_ledger.py)
+            
         Returns:
-            Dict containing sync result
+            Dict containing sync result with per-stage 'stats' (see
+            services/sync_stats.py) and the written files under 'profile'
+            when profiling; 'skipped' or 'attached' is set when another
+            process's sync was skipped or reused
         """
+        progress = progress_callback or _no_progress
+        sync_config = self.config.get_sync_config()
+        mode = lock_mode or sync_config['lock_mode']
+        if mode not in LOCK_MODES:
+            logger.error(f"Unknown sync lock mode {mode!r}, expected one of {LOCK_MODES}")
+            return {
+                'success': False,
+                'message': f'Unknown sync lock mode: {mode}',
+                'timestamp': datetime.now().isoformat()
+            }
+        
+        # A broken lock database does not stop syncing; SyncLock.run() then
+        # runs the sync once without the lease
+        result = self.sync_lock.run(
+            self.config.DEVICE_IP,
+            trigger,
+            lambda: self._run_sync(progress, trigger, profile, full_resend),
+            mode=mode,
+            wait_timeout=sync_config['lock_wait_timeout'],
+            on_wait=lambda holder: progress('waiting_for_lock')
+        )
+        
+        if result.get('skipped'):
+            outcome = 'skipped'
+        elif result.get('attached'):
+            outcome = 'attached'
+        else:
+            outcome = 'success' if result['success'] else 'failure'
+        SYNC_RUNS.inc(device=self.config.DEVICE_IP, result=outcome)
+        return result
+    
+    def _run_sync(self, progress: Callable[..., None], trigger: str, profile: bool = False,
+                  full_resend: bool = False) -> Dict[str, Any]:
+        """Run one sync, adding its stage timings, bytes, counts and retries to the result"""
+        stats = SyncStats()
+        self.api_service.stats = stats
+        profiler = nullcontext()
+        if profile:
+            output_dir = profile_dir(self.config.get_sync_config()['profile_dir'], self.config.LOG_FILE)
+            profiler = SyncProfiler(output_dir, f"sync-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{trigger}")
+        try:
+            with profiler:
+                result = self._sync_stages(progress, stats, full_resend)
+        finally:
+            self.api_service.stats = None
+        result['stats'] = stats.as_dict()
+        if profile and profiler.files:
+            result['profile'] = profiler.files
+        logger.info(format_stats_line(self.config.DEVICE_IP, trigger, result['success'], result['stats']))
+        return result
+    
+    def _sync_stages(self, progress: Callable[..., None], stats: SyncStats,
+                     full_resend: bool = False) -> Dict[str, Any]:
+        """Read, format and upload device data; see sync_device_data()"""
         try:
             logger.info("Starting device data sync")
             
             # Get device data
-            device_data = self.get_device_data()
+            device_data = self.get_device_data(progress_callback=progress, stats=stats)
             if not device_data:
                 return {
                     'success': False,
@@ -273,24 +506,50 @@ class DeviceService:
                 }
             
             # Format data for server
-            formatted_data = self.format_data_for_server(device_data)
+            progress('formatting')
+            with stats.stage('format'):
+                formatted_data = self.format_data_for_server(device_data)
             if not formatted_data:
                 return {
                     'success': False,
                     'message': 'Failed to format data for server',
                     'timestamp': datetime.now().isoformat()
                 }
+            stats.set_records('formatted', len(formatted_data['attendance_records']))
+            data_summary = {
+                'users_count': device_data['sync_info']['total_users'],
+                'attendance_count': device_data['sync_info']['total_attendance']
+            }
+            
+            # Leave out day groups the server already has
+            # Without delta uploads the ledger only records what was sent, for reconciliation
+            ledger = self.upload_ledger()
+            full = full_resend or not self.config.get_server_config()['delta']
+            payload, entries = self._select_changed(ledger, formatted_data, full)
+            stats.set_records('sent', len(payload['attendance_records']))
+            if not payload['attendance_records'] and formatted_data['attendance_records']:
+                logger.info("No new or changed attendance records, nothing to upload")
+                return {
+                    'success': True,
+                    'message': 'Device data already up to date on the server',
+                    'timestamp': datetime.now().isoformat(),
+                    'data_summary': dict(data_summary, records_sent=0, period=None)
+                }
             
             # Send to server
-            if self.send_to_server(formatted_data):
+            progress('uploading')
+            if self.send_to_server(payload, progress_callback=progress, stats=stats):
+                if ledger and entries:
+                    try:
+                        ledger.acknowledge(self.config.DEVICE_IP, entries)
+                    except sqlite3.Error as e:
+                        logger.warning(f"Could not update upload ledger, the next sync resends these records: {e}")
                 return {
                     'success': True,
                     'message': 'Device data synced successfully',
                     'timestamp': datetime.now().isoformat(),
-                    'data_summary': {
-                        'users_count': device_data['sync_info']['total_users'],
-                        'attendance_count': device_data['sync_info']['total_attendance']
-                    }
+                    'data_summary': dict(data_summary, records_sent=len(payload['attendance_records']),
+                                         period=payload['period'])
                 }
             else:
                 return {
@@ -307,6 +566,51 @@ class DeviceService:
                 'timestamp': datetime.now().isoformat()
             }
     
+    def upload_ledger(self) -> Optional[UploadLedger]:
+        """Ledger of acknowledged day groups, or None if delta uploads and reconciliation are both off"""
+        server_config = self.config.get_server_config()
+        if not server_config['delta'] and not server_config['reconcile']:
+            return None
+        return UploadLedger(ledger_file(server_config['ledger_file'], self.config.LOG_FILE))
+    
+    def _select_changed(self, ledger: Optional[UploadLedger], formatted_data: Dict[str, Any],
+                        full_resend: bool) -> Tuple[Dict[str, Any], List[LedgerEntry]]:
+        """
+        Drop the day groups the server acknowledged in their current form
+        
+        Args:
+            ledger: Upload ledger (None: send everything, record nothing)
+            formatted_data: Payload from format_data_for_server()
+            full_resend: Keep every day group but still record them
+            
+        Returns:
+            Tuple of (payload to send, ledger entries to acknowledge)
+        """
+        records = formatted_data['attendance_records']
+        if ledger is None:
+            return formatted_data, []
+        try:
+            selected, entries = ledger.pending(self.config.DEVICE_IP, records, full=full_resend)
+        except sqlite3.Error as e:
+            logger.warning(f"Upload ledger unavailable, sending all records: {e}")
+            return formatted_data, []
+        
+        if full_resend:
+            logger.info(f"Sending all {len(records)} attendance records")
+        else:
+            logger.info(f"Sending {len(selected)} new or changed of {len(records)} attendance records")
+        if len(selected) == len(records):
+            return formatted_data, entries
+        dates = [record['date'] for record in selected]
+        payload = {
+            'period': {
+                'start_date': min(dates) if dates else formatted_data['period']['start_date'],
+                'end_date': max(dates) if dates else formatted_data['period']['end_date']
+            },
+            'attendance_records': selected
+        }
+        return payload, entries
+    
     def test_connection(self) -> Dict[str, Any]:
         """
         Test device and server connections
@@ -329,28 +633,7 @@ class DeviceService:
                 logger.error("Device connection test failed")
             
             # Test server connection
-            server_config = self.config.get_server_config()
-            try:
-                headers = {
-                    'Authorization': f'Bearer {server_config["token"]}',
-                    'Accept': 'application/json'
-                }
-                
-                response = requests.get(
-                    server_config['url'].replace('/import', '/health'),
-                    headers=headers,
-                    timeout=server_config['timeout'],
-                    verify=False
-                )
-                
-                if response.status_code in [200, 404]:  # 404 is acceptable for health check
-                    results['server_connection'] = True
-                    logger.info("Server connection test successful")
-                else:
-                    logger.error(f"Server connection test failed: {response.status_code}")
-                    
-            except Exception as e:
-                logger.error(f"Server connection test failed: {e}")
+            results['server_connection'] = self.test_server_connection()
             
             return results
             
@@ -363,6 +646,60 @@ class DeviceService:
                 'timestamp': datetime.now().isoformat()
             }
     
+    def test_server_connection(self) -> bool:
+        """
+        Test target server connection only (no device traffic)
+        
+        Returns:
+            bool: True if the server answered, False otherwise
+        """
+        server_config = self.config.get_server_config()
+        try:
+            headers = {
+                'Authorization': f'Bearer {server_config["token"]}',
+                'Accept': 'application/json'
+            }
+            
+            response = self.session.get(
+                server_config['url'].replace('/import', '/health'),
+                headers=headers,
+                timeout=server_config['timeout'],
+                verify=False
+            )
+            
+            if response.status_code in [200, 404]:  # 404 is acceptable for health check
+                logger.info("Server connection test successful")
+                return True
+            
+            logger.error(f"Server connection test failed: {response.status_code}")
+            return False
+                
+        except Exception as e:
+            logger.error(f"Server connection test failed: {e}")
+            return False
+    
+    def close(self):
+        """Disconnect from the device and close pooled server connections"""
+        try:
+            self.api_service.disconnect()
+        finally:
+            if self._session is not None:
+                self._session.close()
+    
+    def get_change_marker(self) -> Optional[Tuple[int, int]]:
+        """
+        Read what is needed to tell whether device data changed, without
+        transferring the user table or the attendance log
+        
+        Returns:
+            Tuple of (user count, attendance record count) or None if failed
+        """
+        try:
+            return self.api_service.get_table_sizes()
+        except Exception as e:
+            logger.error(f"Error reading device change marker: {e}")
+            return None
+    
     def get_device_status_only(self) -> Optional[Dict[str, Any]]:
         """
         Get only device status information (lightweight)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Export Service for ZKTeco Device Information System
+Streams attendance exports (NDJSON/CSV) from the attendance index in constant memory
+"""
+
+import csv
+import io
+import json
+import logging
+from typing import Iterator
+
+from .attendance_index import AttendanceStore, AttendanceQuery, REC_TIMESTAMP, REC_USER
+from .device_service import new_day_group, add_punch, to_api_record
+
+logger = logging.getLogger(__name__)
+
+# Rows buffered per yielded chunk; keeps per-chunk overhead low without
+# holding more than a few hundred rows in memory
+CHUNK_ROWS = 500
+
+# Excel only detects UTF-8 (and thus Persian names) with a byte order mark
+UTF8_BOM = '\ufeff'
+
+
+def iter_ndjson(store: AttendanceStore, query: AttendanceQuery) -> Iterator[str]:
+    """
+    Stream matching punches as newline-delimited JSON
+
+    Args:
+        store: Attendance store to read from
+        query: Attendance query (limit and cursor are ignored)
+
+    Yields:
+        Chunks of NDJSON text
+    """
+    chunk = []
+    for index, record in store.iter_records(query):
+        chunk.append(json.dumps(index.row(record, query.fields), ensure_ascii=False))
+        if len(chunk) >= CHUNK_ROWS:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+def iter_csv(store: AttendanceStore, query: AttendanceQuery, bom: bool = False) -> Iterator[str]:
+    """
+    Stream matching punches as CSV with a header row
+
+    Args:
+        store: Attendance store to read from
+        query: Attendance query (limit and cursor are ignored)
+        bom: Prefix a UTF-8 byte order mark for Excel
+
+    Yields:
+        Chunks of CSV text
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if bom:
+        buffer.write(UTF8_BOM)
+    writer.writerow(query.fields)
+
+    rows = 0
+    for index, record in store.iter_records(query):
+        row = index.row(record, query.fields)
+        writer.writerow([row[field] for field in query.fields])
+        rows += 1
+        if rows % CHUNK_ROWS == 0:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def iter_formatted_ndjson(store: AttendanceStore, query: AttendanceQuery) -> Iterator[str]:
+    """
+    Stream records in the server API format (one date/user group per line)
+
+    Records arrive in timestamp order, so only the groups of the current
+    day are held in memory.
+
+    Args:
+        store: Attendance store to read from
+        query: Attendance query (fields, limit and cursor are ignored)
+
+    Yields:
+        Chunks of NDJSON text
+    """
+    current_date = None
+    groups = {}
+    for index, record in store.iter_records(query):
+        date_str = record[REC_TIMESTAMP][:10]
+        if date_str != current_date:
+            if groups:
+                yield _dump_groups(groups.values())
+            current_date = date_str
+            groups = {}
+
+        # Groups are per device, matching what each device would upload
+        key = (index.device_id, record[REC_USER])
+        if key not in groups:
+            user_name = index.names.get(record[REC_USER], f"User {record[REC_USER]}")
+            groups[key] = new_day_group(date_str, record[REC_USER], user_name)
+        add_punch(groups[key], record[REC_TIMESTAMP][11:19])
+
+    if groups:
+        yield _dump_groups(groups.values())
+
+
+def _dump_groups(groups) -> str:
+    """Serialize finished day groups as NDJSON lines"""
+    return ''.join(json.dumps(to_api_record(group), ensure_ascii=False) + '\n' for group in groups)
+
+
+def _drain(buffer: io.StringIO) -> str:
+    """Return and clear the contents of a StringIO buffer"""
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    return text
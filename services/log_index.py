@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Log Index for ZKTeco Device Information System
+Builds compact sidecar indexes over the sync log and its rotations
+(timestamp range, levels and device addresses per block) and answers
+time-window and keyword searches with memory-mapped reads; gzip-compressed
+rotations are indexed before they are compressed and stream-decompressed
+only up to the blocks a search reads
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Iterator, Tuple, Union
+
+from .log_service import RECORD_PATTERN, parse_records, record_header
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+INDEX_DIR_NAME = '.log_index'
+COMPRESSED_KEYS_NAME = 'compressed_keys.json'  # rotation name -> [size, mtime, key]
+BLOCK_SIZE = 64 * 1024  # bytes of log text summarized by one index entry
+READ_WINDOW = 4 * 1024 * 1024  # most decompressed bytes held while reading a gzip rotation
+
+IP_PATTERN = re.compile(rb'\b(?:\d{1,3}\.){3}\d{1,3}\b')
+
+# Positions in a block entry: [offset, length, first_ts, last_ts, levels, devices]
+BLOCK_OFFSET, BLOCK_LENGTH, BLOCK_FIRST, BLOCK_LAST, BLOCK_LEVELS, BLOCK_DEVICES = range(6)
+
+
+class LogQuery:
+    """Validated log search parameters"""
+
+    def __init__(self, start: Optional[str] = None, end: Optional[str] = None,
+                 device: Optional[str] = None, level: Optional[str] = None,
+                 keywords: Optional[List[str]] = None, limit: int = 100):
+        """
+        Initialize log query
+
+        Args:
+            start: Earliest timestamp (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS), inclusive
+            end: Latest timestamp, inclusive (whole day for a bare date)
+            device: Device IP address that must appear in the record
+            level: Log level (INFO, WARNING, ERROR, ...)
+            keywords: Case-insensitive terms that must all appear in the record
+            limit: Maximum records returned
+
+        Raises:
+            ValueError: If a bound is not a valid date
+        """
+        self.start = _parse_bound(start) if start else None
+        # Record timestamps carry milliseconds, so the end bound covers the whole second/day
+        self.end = _parse_bound(end) + '\uffff' if end else None
+        self.device = device
+        self.level = level.upper() if level else None
+        self.keywords = [keyword.lower() for keyword in (keywords or [])]
+        self.limit = limit
+
+    @classmethod
+    def from_args(cls, args, default_limit: int = 100, max_limit: int = 1000) -> 'LogQuery':
+        """
+        Build a query from request arguments (start, end, device, level, q, limit)
+
+        Args:
+            args: Mapping with get() (e.g. flask request.args)
+            default_limit: Result count when none is given
+            max_limit: Largest accepted result count
+
+        Returns:
+            LogQuery
+
+        Raises:
+            ValueError: If a parameter is invalid
+        """
+        try:
+            limit = int(args.get('limit', default_limit))
+        except (TypeError, ValueError):
+            raise ValueError("limit must be an integer")
+        if limit < 1 or limit > max_limit:
+            raise ValueError(f"limit must be between 1 and {max_limit}")
+
+        return cls(
+            start=args.get('start'),
+            end=args.get('end'),
+            device=args.get('device'),
+            level=args.get('level'),
+            keywords=(args.get('q') or '').split(),
+            limit=limit
+        )
+
+    def matches_block(self, block: List[Any]) -> bool:
+        """Whether a block may contain matching records, judged from its index entry"""
+        if block[BLOCK_FIRST] is None:
+            return False
+        if self.start and block[BLOCK_LAST] < self.start:
+            return False
+        if self.end and block[BLOCK_FIRST] > self.end:
+            return False
+        if self.level and self.level not in block[BLOCK_LEVELS]:
+            return False
+        if self.device and self.device not in block[BLOCK_DEVICES]:
+            return False
+        return True
+
+    def matches_text(self, text: bytes) -> bool:
+        """Cheap pre-filter on raw block bytes before parsing"""
+        if not self.keywords:
+            return True
+        lowered = text.lower()
+        return all(keyword.encode('utf-8') in lowered for keyword in self.keywords)
+
+    def matches_record(self, record: Dict[str, Any]) -> bool:
+        """Whether a parsed record satisfies the query"""
+        timestamp = record['timestamp']
+        if self.start and timestamp < self.start:
+            return False
+        if self.end and timestamp > self.end:
+            return False
+        if self.level and record['level'] != self.level:
+            return False
+        if self.device and self.device not in record['message']:
+            return False
+        if self.keywords:
+            message = record['message'].lower()
+            return all(keyword in message for keyword in self.keywords)
+        return True
+
+
+class LogIndex:
+    """Sidecar block indexes over a log file and its numbered rotations"""
+
+    def __init__(self, path: str, index_dir: Optional[str] = None, block_size: int = BLOCK_SIZE):
+        """
+        Initialize log index
+
+        Args:
+            path: Active log file path (rotations are path.1, path.2, ...,
+                or path.1.gz, path.2.gz, ... when compressed)
+            index_dir: Directory for sidecar files (default: .log_index next to the log)
+            block_size: Bytes of log text per index entry
+        """
+        self.path = path
+        self.index_dir = index_dir or os.path.join(os.path.dirname(os.path.abspath(path)), INDEX_DIR_NAME)
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        # Compressed rotations never change: name -> [size, mtime, key], persisted
+        self._compressed_keys = None
+
+    def log_files(self) -> List[str]:
+        """Log files newest first: the active file, then path.1, path.2, ..."""
+        rotated = []
+        for candidate in glob.glob(glob.escape(self.path) + '.*'):
+            suffix = candidate[len(self.path) + 1:]
+            if suffix.endswith('.gz'):
+                suffix = suffix[:-3]
+            if suffix.isdigit():
+                rotated.append((int(suffix), candidate))
+        files = [self.path] if os.path.exists(self.path) else []
+        return files + [candidate for _, candidate in sorted(rotated)]
+
+    def refresh(self) -> List[Dict[str, Any]]:
+        """
+        Bring the sidecar index of every log file up to date
+
+        Indexes are keyed by the file's first line, so renaming a file on
+        rotation keeps its index valid. Growing files are indexed
+        incrementally from where the previous pass stopped.
+
+        Returns:
+            List of index dicts (with 'path' added), newest file first
+        """
+        with self._lock:
+            indexes = []
+            for path in self.log_files():
+                try:
+                    index = self._refresh_file(path)
+                except OSError as e:
+                    logger.warning(f"Could not index log file {path}: {e}")
+                    continue
+                if index:
+                    indexes.append(dict(index, path=path))
+            self._prune({index['key'] for index in indexes})
+            self._prune_compressed_keys({os.path.basename(path) for path in self.log_files()})
+            return indexes
+
+    def index_file(self, path: str) -> Optional[str]:
+        """
+        Bring the sidecar index of one uncompressed file up to date
+
+        The log handler calls this on a rotated file just before compressing
+        it, so the compressed rotation never has to be indexed from scratch.
+
+        Args:
+            path: Uncompressed log file
+
+        Returns:
+            The file's index key, or None if it has no complete line
+        """
+        with self._lock:
+            index = self._refresh_file(path)
+            return index['key'] if index else None
+
+    def remember_compressed(self, path: str, key: str):
+        """
+        Record the index key of a compressed rotation by name, size and mtime
+
+        Args:
+            path: gzip-compressed log file
+            key: Index key of its content (see index_file())
+        """
+        with self._lock:
+            stat = os.stat(path)
+            self._load_compressed_keys()[os.path.basename(path)] = [stat.st_size, stat.st_mtime, key]
+            self._save_compressed_keys()
+
+    def search(self, query: LogQuery) -> Dict[str, Any]:
+        """
+        Search the logs, newest records first
+
+        Args:
+            query: Validated log query
+
+        Returns:
+            Dict with records, blocks_scanned, blocks_total and truncated
+        """
+        indexes = self.refresh()
+        records = []
+        scanned = 0
+        total = sum(len(index['blocks']) for index in indexes)
+        truncated = False
+
+        for index in indexes:
+            for record in self._search_file(index, query):
+                if record is None:
+                    scanned += 1
+                    continue
+                records.append(record)
+                if len(records) >= query.limit:
+                    truncated = True
+                    break
+            if truncated:
+                break
+
+        return {
+            'records': records,
+            'blocks_scanned': scanned,
+            'blocks_total': total,
+            'truncated': truncated
+        }
+
+    def _search_file(self, index: Dict[str, Any], query: LogQuery) -> Iterator[Optional[Dict[str, Any]]]:
+        """Yield matching records of one file newest first; None marks each block read"""
+        candidates = [block for block in index['blocks'] if query.matches_block(block)]
+        if not candidates:
+            return
+
+        for block, data in _read_blocks(index['path'], candidates):
+            yield None
+            if not query.matches_text(data):
+                continue
+            for record in reversed(parse_records(data)):
+                if query.matches_record(record):
+                    yield dict(record, file=os.path.basename(index['path']))
+
+    def _refresh_file(self, path: str) -> Optional[Dict[str, Any]]:
+        """Load, extend or rebuild the sidecar index of one file"""
+        stat = os.stat(path)
+        if stat.st_size == 0:
+            return None
+        if path.endswith('.gz'):
+            return self._refresh_compressed(path, stat)
+
+        with _map_log(path) as mapped:
+            first_newline = mapped.find(b'\n')
+            if first_newline < 0:
+                return None
+            key = hashlib.sha1(mapped[:first_newline + 1]).hexdigest()
+            # Only index complete lines; a partial last line is picked up next time
+            indexed_end = mapped.rfind(b'\n') + 1
+
+            index = self._load(key)
+            if index is None or index['size'] > indexed_end:
+                index = _new_index(key)
+            if index['size'] == indexed_end:
+                return index
+
+            index['blocks'].extend(self._index_range(mapped, index['size'], indexed_end))
+            index['size'] = indexed_end
+            index['indexed_at'] = datetime.now().isoformat()
+
+        self._save(index)
+        return index
+
+    def _refresh_compressed(self, path: str, stat: os.stat_result) -> Optional[Dict[str, Any]]:
+        """
+        Load the sidecar index of a gzip rotation
+
+        Normally the index was completed before the file was compressed and
+        nothing is decompressed. Otherwise (rotated by an older version, or
+        the index was lost) the missing part is indexed by streaming the
+        file from where the index stops.
+        """
+        key = self._compressed_key(path, stat)
+        if key is None:
+            return None
+        index = self._load(key) or _new_index(key)
+        if index.get('complete') or index['size'] % 2 ** 32 == _gzip_size(path):
+            return index
+
+        with gzip.open(path, 'rb') as compressed:
+            compressed.seek(index['size'])
+            blocks, indexed_end = self._index_stream(compressed, index['size'])
+        index['blocks'].extend(blocks)
+        index['size'] = indexed_end
+        index['complete'] = True
+        index['indexed_at'] = datetime.now().isoformat()
+        self._save(index)
+        return index
+
+    def _compressed_key(self, path: str, stat: os.stat_result) -> Optional[str]:
+        """Index key of a gzip rotation, decompressing only its first line if it is not known yet"""
+        known = self._load_compressed_keys().get(os.path.basename(path))
+        if known and known[:2] == [stat.st_size, stat.st_mtime]:
+            return known[2]
+        with gzip.open(path, 'rb') as compressed:
+            first_line = compressed.readline()
+        if not first_line.endswith(b'\n'):
+            return None
+        key = hashlib.sha1(first_line).hexdigest()
+        self._compressed_keys[os.path.basename(path)] = [stat.st_size, stat.st_mtime, key]
+        self._save_compressed_keys()
+        return key
+
+    def _index_stream(self, stream, start: int) -> Tuple[List[List[Any]], int]:
+        """Index a decompressing stream positioned at start, READ_WINDOW bytes at a time"""
+        blocks = []
+        base = start
+        pending = b''
+        while True:
+            chunk = stream.read(READ_WINDOW)
+            data = pending + chunk
+            # Cut at the last record start, so no record spans two windows
+            cut = _last_record_start(data) if chunk else data.rfind(b'\n') + 1
+            if cut > 0:
+                for block in self._index_range(data, 0, cut):
+                    block[BLOCK_OFFSET] += base
+                    blocks.append(block)
+                base += cut
+            pending = data[cut:]
+            if not chunk:
+                return blocks, base
+
+    def _index_range(self, mapped: Union[mmap.mmap, bytes], start: int, end: int) -> List[List[Any]]:
+        """Summarize [start, end) into blocks that begin at record boundaries"""
+        blocks = []
+        position = start
+        while position < end:
+            target = position + self.block_size
+            block_end = end
+            if target < end:
+                next_record = RECORD_PATTERN.search(mapped, target, end)
+                if next_record:
+                    block_end = next_record.start()
+
+            data = mapped[position:block_end]
+            stamps = [record_header(match) for match in RECORD_PATTERN.finditer(data)]
+            blocks.append([
+                position,
+                block_end - position,
+                stamps[0][0] if stamps else None,
+                stamps[-1][0] if stamps else None,
+                sorted({stamp[1] for stamp in stamps}),
+                sorted({address.decode('ascii') for address in IP_PATTERN.findall(data)})
+            ])
+            position = block_end
+        return blocks
+
+    def _sidecar_path(self, key: str) -> str:
+        return os.path.join(self.index_dir, f"{key}.json")
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Read a sidecar index, or None if missing, unreadable or outdated"""
+        try:
+            with open(self._sidecar_path(key), 'r', encoding='utf-8') as sidecar:
+                index = json.load(sidecar)
+        except (OSError, ValueError):
+            return None
+        if index.get('version') != INDEX_VERSION:
+            return None
+        return index
+
+    def _save(self, index: Dict[str, Any]):
+        """Write a sidecar index atomically"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        target = self._sidecar_path(index['key'])
+        temporary = f"{target}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as sidecar:
+            json.dump(index, sidecar, separators=(',', ':'))
+        os.replace(temporary, target)
+
+    def _load_compressed_keys(self) -> Dict[str, List[Any]]:
+        if self._compressed_keys is None:
+            try:
+                with open(os.path.join(self.index_dir, COMPRESSED_KEYS_NAME), 'r', encoding='utf-8') as keys:
+                    self._compressed_keys = json.load(keys)
+            except (OSError, ValueError):
+                self._compressed_keys = {}
+        return self._compressed_keys
+
+    def _save_compressed_keys(self):
+        """Write the compressed rotation keys atomically"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        target = os.path.join(self.index_dir, COMPRESSED_KEYS_NAME)
+        temporary = f"{target}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as keys:
+            json.dump(self._compressed_keys, keys, separators=(',', ':'))
+        os.replace(temporary, target)
+
+    def _prune_compressed_keys(self, names: set):
+        """Forget the keys of rotations that were renamed or deleted"""
+        known = self._load_compressed_keys()
+        stale = [name for name in known if name not in names]
+        if stale:
+            for name in stale:
+                del known[name]
+            try:
+                self._save_compressed_keys()
+            except OSError:
+                pass
+
+    def _prune(self, keep: set):
+        """Delete sidecars whose log file no longer exists"""
+        for sidecar in glob.glob(os.path.join(glob.escape(self.index_dir), '*.json')):
+            if os.path.basename(sidecar) == COMPRESSED_KEYS_NAME:
+                continue
+            if os.path.splitext(os.path.basename(sidecar))[0] not in keep:
+                try:
+                    os.remove(sidecar)
+                except OSError:
+                    pass
+
+
+@contextmanager
+def _map_log(path: str) -> Iterator[mmap.mmap]:
+    """Memory-map an uncompressed log file"""
+    with open(path, 'rb') as log_file:
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def _read_blocks(path: str, blocks: List[List[Any]]) -> Iterator[Tuple[List[Any], bytes]]:
+    """
+    Yield (block, bytes) for the given blocks of a log file, newest first
+
+    Uncompressed files are memory-mapped. gzip rotations are read in batches
+    of up to READ_WINDOW bytes of blocks: each batch seeks forward through
+    the stream from its oldest block, so nothing past the newest block read
+    is decompressed and the file is never held in memory as a whole.
+    """
+    if not path.endswith('.gz'):
+        with _map_log(path) as mapped:
+            for block in reversed(blocks):
+                start = block[BLOCK_OFFSET]
+                yield block, mapped[start:start + block[BLOCK_LENGTH]]
+        return
+
+    with gzip.open(path, 'rb') as compressed:
+        end = len(blocks)
+        while end > 0:
+            begin = end - 1
+            size = blocks[begin][BLOCK_LENGTH]
+            while begin > 0 and size + blocks[begin - 1][BLOCK_LENGTH] <= READ_WINDOW:
+                begin -= 1
+                size += blocks[begin][BLOCK_LENGTH]
+            batch = []
+            for block in blocks[begin:end]:
+                compressed.seek(block[BLOCK_OFFSET])
+                batch.append((block, compressed.read(block[BLOCK_LENGTH])))
+            yield from reversed(batch)
+            end = begin
+
+
+def _last_record_start(data: bytes) -> int:
+    """Offset of the last record that starts after offset 0, or 0 if there is none"""
+    position = data.rfind(b'\n')
+    while position >= 0:
+        if RECORD_PATTERN.match(data, position + 1):
+            return position + 1
+        position = data.rfind(b'\n', 0, position)
+    return 0
+
+
+def _gzip_size(path: str) -> int:
+    """Uncompressed size modulo 2**32, from the gzip trailer"""
+    with open(path, 'rb') as compressed:
+        compressed.seek(-4, os.SEEK_END)
+        return int.from_bytes(compressed.read(4), 'little')
+
+
+def _new_index(key: str) -> Dict[str, Any]:
+    return {'version': INDEX_VERSION, 'key': key, 'size': 0, 'blocks': []}
+
+
+def _parse_bound(value: str) -> str:
+    """Validate a date or datetime bound and return it as a log timestamp prefix"""
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return parsed.strftime('%Y-%m-%d') if fmt == '%Y-%m-%d' else parsed.strftime('%Y-%m-%d %H:%M:%S')
+    raise ValueError(f"Invalid date: {value}")
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Log Service for ZKTeco Device Information System
+Reads the most recent sync log records by seeking backward from the end of
+the file, and follows the file from a cached byte offset
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Matches the start of a record in either log format (see services/log_setup.py):
+# text, '%(asctime)s - %(name)s - %(levelname)s - %(message)s' (groups 1-3), or
+# a JSON line beginning {"timestamp": ..., "level": ... (groups 4-5)
+RECORD_PATTERN = re.compile(
+    rb'^(?:(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - (\S+) - ([A-Z]+) - '
+    rb'|\{"timestamp": "(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3})", "level": "([A-Z]+)")', re.MULTILINE)
+
+BLOCK_SIZE = 8192
+MAX_TAIL_BYTES = 1024 * 1024  # never scan more than this from the end
+MAX_FOLLOW_BYTES = 256 * 1024  # never return more than this per follow call
+
+
+def record_header(match: re.Match) -> Tuple[str, str]:
+    """Timestamp and level of a RECORD_PATTERN match, whichever the format"""
+    if match.group(1):
+        return match.group(1).decode('ascii'), match.group(3).decode('ascii')
+    return match.group(4).decode('ascii'), match.group(5).decode('ascii')
+
+
+def parse_records(data: bytes) -> List[Dict[str, Any]]:
+    """
+    Split raw log bytes into records
+
+    Text and JSON-lines records may be mixed (e.g. a log written before
+    and after LOG_FORMAT changed). Continuation lines of text records
+    (e.g. tracebacks) are appended to the preceding record's message.
+    Text before the first record start is ignored.
+
+    Args:
+        data: Raw log bytes starting at a line boundary
+
+    Returns:
+        List of dicts with timestamp, logger, level and message
+    """
+    matches = list(RECORD_PATTERN.finditer(data))
+    records = []
+    for position, match in enumerate(matches):
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(data)
+        if match.group(1):
+            message = data[match.end():end].rstrip(b'\r\n')
+            records.append({
+                'timestamp': match.group(1).decode('ascii'),
+                'logger': match.group(2).decode('utf-8', errors='replace'),
+                'level': match.group(3).decode('ascii'),
+                'message': message.decode('utf-8', errors='replace')
+            })
+            continue
+
+        line = data[match.start():end].strip()
+        try:
+            fields = json.loads(line)
+        except ValueError:
+            fields = {}
+        timestamp, level = record_header(match)
+        records.append({
+            'timestamp': timestamp,
+            'logger': str(fields.get('logger', '')),
+            'level': level,
+            'message': str(fields.get('message', line.decode('utf-8', errors='replace')))
+        })
+    return records
+
+
+def tail_records(path: str, count: int = 50) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Read the last records of a log file without reading the whole file
+
+    Args:
+        path: Log file path
+        count: Number of records to return
+
+    Returns:
+        Tuple of (records oldest first, end offset of the data read)
+    """
+    if not os.path.exists(path):
+        return [], 0
+
+    with open(path, 'rb') as log_file:
+        log_file.seek(0, os.SEEK_END)
+        end = log_file.tell()
+        position = end
+        data = b''
+        # Read one more record start than needed so the oldest record is complete
+        while position > 0 and end - position < MAX_TAIL_BYTES:
+            step = min(BLOCK_SIZE, position)
+            position -= step
+            log_file.seek(position)
+            data = log_file.read(step) + data
+            if len(RECORD_PATTERN.findall(data)) > count:
+                break
+
+    if position > 0:
+        # Drop the partial first line
+        newline = data.find(b'\n')
+        data = data[newline + 1:] if newline >= 0 else b''
+
+    return parse_records(data)[-count:], end
+
+
+class LogTailer:
+    """Follows a log file from a cached byte offset"""
+
+    def __init__(self, path: str):
+        """
+        Initialize log tailer
+
+        Args:
+            path: Log file path
+        """
+        self.path = path
+        self.offset = None
+        self._lock = threading.Lock()
+
+    def tail(self, count: int = 50) -> Dict[str, Any]:
+        """
+        Get the last records and remember the end offset
+
+        Args:
+            count: Number of records
+
+        Returns:
+            Dict with records and offset
+        """
+        records, end = tail_records(self.path, count)
+        with self._lock:
+            self.offset = end
+        return {'records': records, 'offset': end}
+
+    def follow(self, offset: Optional[int] = None, count: int = 50) -> Dict[str, Any]:
+        """
+        Get records appended since an offset
+
+        Only the bytes after the offset are read. If the file shrank
+        (rotated or truncated), the tail of the new file is returned.
+
+        Args:
+            offset: Byte offset from a previous call (the cached one if None)
+            count: Maximum records to return
+
+        Returns:
+            Dict with records, offset and reset (True if the file was rotated)
+        """
+        with self._lock:
+            if offset is None:
+                offset = self.offset
+        if offset is None or not os.path.exists(self.path):
+            return dict(self.tail(count), reset=True)
+
+        size = os.path.getsize(self.path)
+        if size < offset:
+            return dict(self.tail(count), reset=True)
+
+        with open(self.path, 'rb') as log_file:
+            log_file.seek(offset)
+            data = log_file.read(min(size - offset, MAX_FOLLOW_BYTES))
+
+        # Only hand out complete lines; the rest is read next time
+        complete = data.rfind(b'\n') + 1
+        new_offset = offset + complete
+        with self._lock:
+            self.offset = new_offset
+        return {
+            'records': parse_records(data[:complete])[-count:],
+            'offset': new_offset,
+            'reset': False
+        }
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Logging Setup for ZKTeco Device Information System
+One logging configuration for every entry point: log calls only put the
+record on a queue, and a background listener writes it to the console and
+to a size- and time-rotated, optionally gzip-compressed log file in JSON
+lines or text format
+"""
+
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from config import Config
+from .log_index import LogIndex
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+ROTATE_WHEN = ('midnight', 'hourly', 'never')
+# A rollover that failed (on Windows: another process has the file open) is
+# retried after this many seconds; records are appended in the meantime
+ROLLOVER_RETRY_SECONDS = 60
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; timestamp and level come first so readers can match them cheaply"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            message = f"{message}\n{record.exc_text}"
+        if record.stack_info:
+            message = f"{message}\n{self.formatStack(record.stack_info)}"
+        return json.dumps({
+            'timestamp': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': message,
+            'pid': record.process
+        }, ensure_ascii=False)
+
+
+def _gzip_name(name: str) -> str:
+    return name + '.gz'
+
+
+def _gzip_rotate(source: str, dest: str):
+    # Renaming first fails cleanly while another process holds the file open,
+    # instead of leaving a compressed copy next to a file that is still live
+    staged = source + '.rotating'
+    os.replace(source, staged)
+    # Index the plain file now, so searches never decompress the rotation to index it
+    log_index = LogIndex(source)
+    try:
+        key = log_index.index_file(staged)
+    except (OSError, ValueError):
+        key = None
+    with open(staged, 'rb') as plain, gzip.open(dest, 'wb') as compressed:
+        shutil.copyfileobj(plain, compressed)
+    if key:
+        try:
+            log_index.remember_compressed(dest, key)
+        except (OSError, ValueError):
+            pass
+    os.remove(staged)
+
+
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotates on size and at midnight or every hour, keeping path.1, path.2, ...
+    (path.1.gz, ... when compressing). If another process already rotated
+    the file, the handler reopens it instead of rotating again. If the
+    rollover itself fails, the handler keeps appending to the current file
+    and retries after ROLLOVER_RETRY_SECONDS.
+
+    With rotate=False the handler never rotates and only follows rotations
+    done by another process, like a plain append-mode FileHandler.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 0, when: str = 'midnight',
+                 backup_count: int = 14, compress: bool = True, rotate: bool = True):
+        """
+        Initialize rotating log handler
+
+        Args:
+            filename: Log file path
+            max_bytes: Rotate when the file would grow beyond this size (0: never)
+            when: 'midnight', 'hourly' or 'never'
+            backup_count: Rotated files kept
+            compress: gzip rotated files
+            rotate: False to only append, leaving rotation to another process
+
+        Raises:
+            ValueError: If when is unknown
+        """
+        if when not in ROTATE_WHEN:
+            raise ValueError(f"LOG_ROTATE_WHEN must be one of {ROTATE_WHEN}")
+        if not rotate:
+            max_bytes, when = 0, 'never'
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.when = when
+        self.retry_at = None
+        self.rollover_errors = 0
+        if compress:
+            self.namer = _gzip_name
+            self.rotator = _gzip_rotate
+        # A file last written in an earlier period is rotated on the first record
+        started = os.path.getmtime(self.baseFilename) if os.path.exists(self.baseFilename) else time.time()
+        self.rollover_at = self._next_rollover(started)
+
+    def _next_rollover(self, now: float) -> Optional[float]:
+        moment = datetime.fromtimestamp(now)
+        if self.when == 'hourly':
+            return (moment.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)).timestamp()
+        if self.when == 'midnight':
+            return (moment.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp()
+        return None
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            rotated_elsewhere = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except OSError:
+            rotated_elsewhere = True
+        if rotated_elsewhere:
+            self.stream.close()
+            self.stream = self._open()
+            self.rollover_at = self._next_rollover(time.time())
+            return False
+        if self.retry_at and time.time() < self.retry_at:
+            return False
+        if self.rollover_at and time.time() >= self.rollover_at and self.stream.tell() > 0:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        try:
+            super().doRollover()
+        except OSError as e:
+            # Keep logging to the unrotated file rather than failing every record
+            if self.stream is None:
+                self.stream = self._open()
+            self.rollover_errors += 1
+            self.retry_at = time.time() + ROLLOVER_RETRY_SECONDS
+            if self.rollover_errors == 1:
+                sys.stderr.write(f"Log rotation of {self.baseFilename} failed, appending instead: {e}\n")
+            return
+        self.retry_at = None
+        self.rollover_at = self._next_rollover(time.time())
+
+
+class WarningLimiter:
+    """Logs the first few occurrences of a repeated warning and counts the rest"""
+
+    def __init__(self, log: logging.Logger, limit: int = 5):
+        """
+        Initialize warning limiter
+
+        Args:
+            log: Logger to write to
+            limit: Warnings logged before the rest are only counted
+        """
+        self.log = log
+        self.limit = limit
+        self.count = 0
+
+    def warning(self, message: str):
+        self.count += 1
+        if self.count <= self.limit:
+            self.log.warning(message)
+
+    def summary(self, what: str):
+        """Log how many warnings were suppressed, if any"""
+        if self.count > self.limit:
+            self.log.warning(f"{self.count} {what} in total, {self.count - self.limit} not logged individually")
+
+
+def setup_logging(log_file: Optional[str] = None, level: Optional[str] = None, process: str = '',
+                  rotate: Optional[bool] = None) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a queue to the console and the rotating log file
+
+    Safe to call more than once; only the first call configures logging.
+    Several entry points share LOG_FILE, and on Windows a file cannot be
+    renamed while another process has it open, so only the entry point named
+    by LOG_ROTATE_PROCESS rotates it; the others append.
+
+    Args:
+        log_file: Log file path (LOG_FILE if None)
+        level: Level name (LOG_LEVEL if None)
+        process: Entry point name, e.g. 'api_server'
+        rotate: Override whether this process rotates (None: compare process
+            with LOG_ROTATE_PROCESS)
+
+    Returns:
+        The running QueueListener
+    """
+    global _listener, _queue_handler
+    if _listener:
+        return _listener
+
+    log_config = Config.get_logging_config()
+    file_handler = RotatingLogHandler(
+        log_file or log_config['file'],
+        max_bytes=log_config['max_bytes'],
+        when=log_config['rotate_when'],
+        backup_count=log_config['backup_count'],
+        compress=log_config['compress'],
+        rotate=process == log_config['rotate_process'] if rotate is None else rotate
+    )
+    file_handler.setFormatter(JsonFormatter() if log_config['format'] == 'json' else logging.Formatter(TEXT_FORMAT))
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.Queue(-1)
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(getattr(logging, (level or log_config['level']).upper(), logging.INFO))
+    return _listener
+
+
+def stop_logging():
+    """Write out queued records and close the log file"""
+    global _listener, _queue_handler
+    if _listener:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
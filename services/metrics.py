@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Metrics for ZKTeco Device Information System
+Minimal in-process counters, gauges and histograms rendered in the
+Prometheus text exposition format (no external dependency)
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Tuple, List, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds; device reads on large logs take minutes, so the tail is wide
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class _Metric:
+    """Base class for labeled metrics"""
+
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        """Turn label kwargs into an ordered key"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Optional[Dict[str, str]] = None) -> str:
+        """Render a label set as {a="1",b="2"}"""
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.extend(extra.items())
+        if not pairs:
+            return ''
+        rendered = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+        return '{' + rendered + '}'
+
+    def render(self) -> List[str]:
+        """Render HELP/TYPE header and samples"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items) -> List[str]:
+        return [f"{self.name}{self._format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    metric_type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase the counter for a label set"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """Current value for a label set"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, optionally computed at scrape time"""
+
+    metric_type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._callback = None
+
+    def set(self, value: float, **labels):
+        """Set the gauge for a label set"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        """
+        Compute the gauge at scrape time
+
+        Args:
+            callback: Returns {label value tuple: value}
+        """
+        self._callback = callback
+
+    def render(self) -> List[str]:
+        if self._callback:
+            try:
+                values = self._callback()
+                with self._lock:
+                    self._values = dict(values)
+            except Exception as e:
+                logger.error(f"Error computing gauge {self.name}: {e}")
+        return super().render()
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        """Record one observation for a label set"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][position] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager observing the elapsed monotonic time"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_samples(self, items) -> List[str]:
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': '+Inf'})} {state['count']}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = metric_class(name, documentation, labelnames, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        """Get or create a counter"""
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        """Get or create a gauge"""
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram"""
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format"""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    """Escape a label value"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    """Render a sample value"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# Process-wide registry and the metrics recorded by the sync pipeline
+REGISTRY = MetricsRegistry()
+
+DEVICE_CONNECT_SECONDS = REGISTRY.histogram(
+    'zk_device_connect_seconds', 'Time to open a session with the device', ('device',))
+DEVICE_READ_SECONDS = REGISTRY.histogram(
+    'zk_device_read_seconds', 'Time to read a table from the device', ('device', 'table'))
+DEVICE_READ_BYTES = REGISTRY.counter(
+    'zk_device_read_bytes_total', 'Bytes read from the device, estimated from protocol record sizes', ('device', 'table'))
+DEVICE_READ_RECORDS = REGISTRY.counter(
+    'zk_device_read_records_total', 'Records read from the device', ('device', 'table'))
+DEVICE_ERRORS = REGISTRY.counter(
+    'zk_device_errors_total', 'Device operations that failed', ('device', 'operation'))
+FORMAT_SECONDS = REGISTRY.histogram(
+    'zk_sync_format_seconds', 'Time to format device data for the server', ('device',))
+SERIALIZE_SECONDS = REGISTRY.histogram(
+    'zk_sync_serialize_seconds', 'Time to JSON-encode the upload payload', ('device',))
+UPLOAD_SECONDS = REGISTRY.histogram(
+    'zk_sync_upload_seconds', 'Latency of each upload attempt', ('device', 'outcome'))
+UPLOAD_BYTES = REGISTRY.counter(
+    'zk_sync_upload_bytes_total', 'Payload bytes accepted by the server', ('device',))
+UPLOAD_RETRIES = REGISTRY.counter(
+    'zk_sync_upload_retries_total', 'Upload attempts beyond the first', ('device',))
+SYNC_RUNS = REGISTRY.counter(
+    'zk_sync_runs_total', 'Completed sync runs', ('device', 'result'))
+SYNC_QUEUE_DEPTH = REGISTRY.gauge(
+    'zk_sync_queue_depth', 'Sync jobs queued or running plus triggers attached to them', ('device',))
+CACHE_REQUESTS = REGISTRY.counter(
+    'zk_cache_requests_total', 'Cache lookups by result', ('device', 'cache', 'result'))
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    'zk_cache_hit_ratio', 'Share of cache lookups that were hits', ('device', 'cache'))
+
+
+def _cache_hit_ratios() -> Dict[Tuple[str, ...], float]:
+    """Derive hit ratios from the cache request counter"""
+    totals = {}
+    with CACHE_REQUESTS._lock:
+        items = list(CACHE_REQUESTS._values.items())
+    for (device, cache, result), count in items:
+        hits, total = totals.get((device, cache), (0, 0))
+        totals[(device, cache)] = (hits + (count if result == 'hit' else 0), total + count)
+    return {key: round(hits / total, 4) for key, (hits, total) in totals.items() if total}
+
+
+CACHE_HIT_RATIO.set_function(_cache_hit_ratios)
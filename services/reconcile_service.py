@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reconcile Service for ZKTeco Device Information System
+Finds the days where what the server stored differs from what it
+acknowledged, by comparing per-month and then per-day digests with the
+server's digest check (see services/upload_ledger.py), and gets only those
+days uploaded again
+"""
+
+import logging
+from typing import Optional, Dict, Any, List
+from datetime import datetime
+
+from .upload_ledger import UploadLedger, digest_tree
+from .sync_lock import LOCK_ATTACH, LOCK_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+def _check_date(value: Optional[str], name: str) -> Optional[str]:
+    """
+    Validate an optional YYYY-MM-DD date
+
+    Raises:
+        ValueError: If the date is malformed
+    """
+    if value:
+        try:
+            datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f"{name} must be YYYY-MM-DD") from None
+    return value or None
+
+
+def _differing(local: Dict[str, str], server: Dict[str, str]) -> List[str]:
+    """Keys whose digests differ, including keys only the ledger has"""
+    return sorted(key for key in local if local[key] != server.get(key))
+
+
+def _server_only(local: Dict[str, str], server: Dict[str, str]) -> List[str]:
+    """Keys only the server has; nothing acknowledged there, so a resend cannot change them"""
+    return sorted(key for key in server if key not in local)
+
+
+def resend_lock_mode(lock_mode: Optional[str], config) -> str:
+    """Lock mode for the resend: like lock_mode (or SYNC_LOCK_MODE), but never attach"""
+    mode = lock_mode or config.get_sync_config()['lock_mode']
+    return LOCK_WAIT if mode == LOCK_ATTACH else mode
+
+
+class ReconcileService:
+    """Compares acknowledged uploads with the server's digests and resends differing days"""
+
+    def __init__(self, device_service):
+        """
+        Initialize reconcile service
+
+        Args:
+            device_service: DeviceService whose configuration, server session
+                and upload ledger are used
+        """
+        self.device_service = device_service
+        self.config = device_service.config
+
+    def _ledger(self) -> UploadLedger:
+        ledger = self.device_service.upload_ledger()
+        if ledger is None:
+            raise ValueError('Reconciliation is off (RECONCILE_ENABLED=false), there is no ledger to reconcile')
+        return ledger
+
+    def _server_digests(self, granularity: str, start: str, end: str, transfer: Dict[str, int]) -> Dict[str, str]:
+        """
+        Ask the server's digest check for day or month digests
+
+        Args:
+            granularity: 'day' or 'month'
+            start: First date (inclusive)
+            end: Last date (inclusive)
+            transfer: Counters of requests and response bytes, updated in place
+
+        Returns:
+            Dict of day (YYYY-MM-DD) or month (YYYY-MM) -> digest
+
+        Raises:
+            requests.exceptions.RequestException: If the server cannot be reached or fails
+            ValueError: If the response is not a digest response
+        """
+        server_config = self.config.get_server_config()
+        response = self.device_service.session.get(
+            server_config['digest_url'],
+            params={'device': self.config.DEVICE_IP, 'start': start, 'end': end, 'granularity': granularity},
+            headers={
+                'Authorization': f'Bearer {server_config["token"]}',
+                'Accept': 'application/json'
+            },
+            timeout=server_config['timeout'],
+            verify=False
+        )
+        transfer['requests'] += 1
+        transfer['bytes'] += len(response.content)
+        response.raise_for_status()
+        digests = response.json().get('digests')
+        if not isinstance(digests, dict):
+            raise ValueError('digest check response has no digests object')
+        return digests
+
+    def compare(self, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Find the days whose digests differ between the ledger and the server
+
+        Months are compared first; only differing months are compared day by
+        day. Months and days that only the server has are reported under
+        months_server_only and days_server_only and not resent: the ledger
+        has nothing to upload for them, so resending could never make them
+        match.
+
+        Args:
+            start: First date to check (default: oldest acknowledged day)
+            end: Last date to check (default: newest acknowledged day)
+
+        Returns:
+            Dict with start, end, months_checked, months_differing,
+            days_differing, months_server_only, days_server_only and the
+            requests and bytes the check cost
+
+        Raises:
+            ValueError: If a date is malformed or reconciliation is off
+            requests.exceptions.RequestException: If the digest check fails
+        """
+        start = _check_date(start, 'start')
+        end = _check_date(end, 'end')
+        device = self.config.DEVICE_IP
+        entries = self._ledger().entries(device, start, end)
+        start = start or (entries[0][0] if entries else None)
+        end = end or (entries[-1][0] if entries else None)
+        report = {
+            'start': start,
+            'end': end,
+            'months_checked': 0,
+            'months_differing': [],
+            'days_differing': [],
+            'months_server_only': [],
+            'days_server_only': [],
+            'requests': 0,
+            'bytes': 0
+        }
+        if not start or not end:
+            logger.info(f"Nothing acknowledged for {device} yet, nothing to reconcile")
+            return report
+
+        local = digest_tree(entries)
+        transfer = {'requests': 0, 'bytes': 0}
+        server_months = self._server_digests('month', start, end, transfer)
+        months = _differing(local['months'], server_months)
+        days = []
+        server_only = []
+        for month in months:
+            server_days = self._server_digests('day', max(start, f"{month}-01"), min(end, f"{month}-31"), transfer)
+            local_days = {day: digest for day, digest in local['days'].items() if day.startswith(month)}
+            days.extend(_differing(local_days, server_days))
+            server_only.extend(_server_only(local_days, server_days))
+
+        report.update({
+            'months_checked': len(set(local['months']) | set(server_months)),
+            'months_differing': months,
+            'days_differing': days,
+            'months_server_only': _server_only(local['months'], server_months),
+            'days_server_only': server_only,
+            'requests': transfer['requests'],
+            'bytes': transfer['bytes']
+        })
+        logger.info(f"Reconciliation {start}..{end}: {report['months_checked']} months checked, "
+                    f"{len(days)} days differ, {len(server_only)} days only on the server, "
+                    f"{transfer['bytes']} bytes in {transfer['requests']} requests")
+        return report
+
+    def forget(self, days: List[str]) -> int:
+        """
+        Drop the ledger entries of some days so the next sync uploads them again
+
+        Returns:
+            Number of ledger entries removed
+        """
+        return self._ledger().forget(self.config.DEVICE_IP, days)
+
+    def reconcile(self, start: Optional[str] = None, end: Optional[str] = None, dry_run: bool = False,
+                  lock_mode: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Compare with the server and sync again if any day differs
+
+        A sync already running in another process chose what to upload
+        before the differing days were forgotten, so attaching to it would
+        not resend them; 'attach' waits for it and then syncs instead.
+
+        Args:
+            start: First date to check
+            end: Last date to check
+            dry_run: Only report the differing days
+            lock_mode: Behaviour if another process is syncing the device
+                ('wait' or 'skip'; SYNC_LOCK_MODE if None)
+
+        Returns:
+            Dict with success, message, the comparison under 'data' and,
+            if days were resent, the sync result under 'sync'
+        """
+        report = self.compare(start, end)
+        days = report['days_differing']
+        if not days:
+            message = 'Server matches the acknowledged uploads'
+            if report['months_server_only'] or report['days_server_only']:
+                message += '; it also has records that were never acknowledged'
+            return {'success': True, 'message': message, 'data': report}
+        if dry_run:
+            return {'success': True, 'message': f'{len(days)} days differ', 'data': report}
+
+        removed = self.forget(days)
+        logger.info(f"Resending {len(days)} days ({removed} acknowledged day groups forgotten)")
+        sync = self.device_service.sync_device_data(lock_mode=resend_lock_mode(lock_mode, self.config),
+                                                    trigger='reconcile')
+        message = f"{len(days)} days differ; {sync['message']}"
+        if sync.get('skipped'):
+            message += '; the next sync resends them'
+        return {
+            'success': sync['success'],
+            'message': message,
+            'data': report,
+            'sync': sync
+        }
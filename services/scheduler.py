@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sync Scheduler for ZKTeco Device Information System
+Fires sync runs at wall-clock-aligned instants inside the configured sync
+window, sleeping until the next run instead of polling
+"""
+
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Callable, Any
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# What to do with a run that falls outside the sync window
+OUTSIDE_WINDOW_SKIP = 'skip'    # wait for the first aligned slot inside the window
+OUTSIDE_WINDOW_DEFER = 'defer'  # run once as soon as the window opens
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+class SyncScheduler:
+    """Drift-free interval scheduler restricted to a daily time window"""
+
+    def __init__(self, interval: float, start_time: str = '00:00', end_time: str = '23:59',
+                 outside_window: str = OUTSIDE_WINDOW_SKIP):
+        """
+        Initialize scheduler
+
+        Runs are aligned to multiples of the interval counted from local
+        midnight (an hourly interval fires at :00), so the sync duration
+        never shifts the schedule. A window whose end is before its start
+        spans midnight (e.g. 22:00-06:00).
+
+        Args:
+            interval: Seconds between runs
+            start_time: Window start (HH:MM, inclusive)
+            end_time: Window end (HH:MM, inclusive to the end of that minute)
+            outside_window: 'skip' or 'defer'
+
+        Raises:
+            ValueError: If the interval, times or policy are invalid
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if outside_window not in (OUTSIDE_WINDOW_SKIP, OUTSIDE_WINDOW_DEFER):
+            raise ValueError(f"outside_window must be '{OUTSIDE_WINDOW_SKIP}' or '{OUTSIDE_WINDOW_DEFER}'")
+        self.interval = interval
+        self.start_minute = _parse_time(start_time)
+        self.end_minute = _parse_time(end_time)
+        self.outside_window = outside_window
+
+    @classmethod
+    def from_config(cls) -> 'SyncScheduler':
+        """Create a scheduler from the sync configuration"""
+        sync_config = Config.get_sync_config()
+        return cls(
+            interval=sync_config['interval'],
+            start_time=sync_config['start_time'],
+            end_time=sync_config['end_time'],
+            outside_window=sync_config['outside_window']
+        )
+
+    def in_window(self, moment: Optional[datetime] = None) -> bool:
+        """
+        Check whether a moment is inside the sync window
+
+        Args:
+            moment: Local time (now if None)
+
+        Returns:
+            bool: True if syncing is allowed at that moment
+        """
+        moment = moment or datetime.now()
+        minute = moment.hour * 60 + moment.minute
+        if self.start_minute <= self.end_minute:
+            return self.start_minute <= minute <= self.end_minute
+        return minute >= self.start_minute or minute <= self.end_minute
+
+    def window_opens(self, moment: datetime) -> datetime:
+        """Earliest time at or after moment that is inside the window"""
+        if self.in_window(moment):
+            return moment
+        opens = moment.replace(hour=self.start_minute // 60, minute=self.start_minute % 60,
+                               second=0, microsecond=0)
+        if opens <= moment:
+            opens += timedelta(days=1)
+        return opens
+
+    def next_aligned(self, after: datetime) -> datetime:
+        """First interval-aligned instant strictly after a moment"""
+        midnight = after.replace(hour=0, minute=0, second=0, microsecond=0)
+        elapsed = (after - midnight).total_seconds()
+        due = midnight + timedelta(seconds=(math.floor(elapsed / self.interval) + 1) * self.interval)
+        # Alignment restarts every midnight when the interval does not divide a day
+        if self.interval < SECONDS_PER_DAY:
+            due = min(due, midnight + timedelta(days=1))
+        return due
+
+    def next_run(self, after: Optional[datetime] = None) -> datetime:
+        """
+        Get the next run time
+
+        Args:
+            after: Local time the run must follow (now if None)
+
+        Returns:
+            datetime of the next run inside the window
+        """
+        due = self.next_aligned(after or datetime.now())
+        if self.in_window(due):
+            return due
+
+        opens = self.window_opens(due)
+        if self.outside_window == OUTSIDE_WINDOW_DEFER:
+            return opens
+        # The aligned slot right before the opening time may land on it exactly
+        due = self.next_aligned(opens - timedelta(microseconds=1))
+        return due if self.in_window(due) else opens
+
+    def idle_seconds(self, now: Optional[datetime] = None) -> float:
+        """Seconds until the next run"""
+        now = now or datetime.now()
+        return max((self.next_run(now) - now).total_seconds(), 0.0)
+
+    def sleep_until(self, due: datetime, stop_event: Optional[threading.Event] = None) -> bool:
+        """
+        Sleep until a wall-clock time
+
+        The sleep itself is measured on the monotonic clock; the wall clock
+        is checked again on waking so clock adjustments cannot fire a run early.
+
+        Args:
+            due: Local time to wake at
+            stop_event: Event that interrupts the sleep when set
+
+        Returns:
+            bool: True when due, False if interrupted by stop_event
+        """
+        stop_event = stop_event or threading.Event()
+        while True:
+            remaining = (due - datetime.now()).total_seconds()
+            if remaining <= 0:
+                return True
+            deadline = time.monotonic() + remaining
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                if stop_event.wait(left):
+                    return False
+
+    def run_forever(self, job: Callable[[], Any], stop_event: Optional[threading.Event] = None,
+                    run_immediately: bool = True):
+        """
+        Run a job on schedule until stopped
+
+        Runs missed because the previous run overran are skipped, not queued.
+
+        Args:
+            job: Callable executed for every run
+            stop_event: Event that stops the loop when set
+            run_immediately: Run once at startup if inside the window
+        """
+        stop_event = stop_event or threading.Event()
+        if run_immediately and self.in_window():
+            self._run_job(job)
+
+        while not stop_event.is_set():
+            due = self.next_run()
+            logger.info(f"Next sync scheduled at {due.strftime('%Y-%m-%d %H:%M:%S')}")
+            if not self.sleep_until(due, stop_event):
+                break
+            self._run_job(job)
+
+            overrun = (datetime.now() - due).total_seconds()
+            if overrun > self.interval:
+                logger.warning(f"Sync took {overrun:.0f}s, longer than the {self.interval}s interval; "
+                               f"skipping {int(overrun // self.interval)} missed run(s)")
+
+    def _run_job(self, job: Callable[[], Any]):
+        """Run the job, logging instead of raising so the schedule keeps going"""
+        try:
+            job()
+        except Exception as e:
+            logger.error(f"Error in scheduled job: {e}")
+
+
+class AdaptiveInterval:
+    """Chooses the sync interval from the punch arrival rate of each device"""
+
+    def __init__(self, min_interval: float, max_interval: float, target_punches: float,
+                 smoothing: float = 0.5):
+        """
+        Initialize adaptive interval
+
+        The interval is chosen so that about target_punches new records
+        accumulate between syncs at the busiest device's rate, clamped to
+        [min_interval, max_interval]. Besides the recent rate, an hour-of-day
+        profile is kept so the interval shrinks ahead of a shift change that
+        happened at the same hour before.
+
+        Args:
+            min_interval: Shortest interval in seconds
+            max_interval: Longest interval in seconds
+            target_punches: New records per device that may wait for the next sync
+            smoothing: Weight of the newest rate sample (0-1)
+
+        Raises:
+            ValueError: If the bounds or parameters are invalid
+        """
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("intervals must satisfy 0 < min_interval <= max_interval")
+        if target_punches <= 0 or not 0 < smoothing <= 1:
+            raise ValueError("target_punches must be positive and smoothing in (0, 1]")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_punches = target_punches
+        self.smoothing = smoothing
+        self.devices = {}
+
+    @classmethod
+    def from_config(cls) -> 'AdaptiveInterval':
+        """Create an adaptive interval from the sync configuration"""
+        sync_config = Config.get_sync_config()
+        return cls(
+            min_interval=sync_config['adaptive_min_interval'],
+            max_interval=sync_config['adaptive_max_interval'],
+            target_punches=sync_config['adaptive_target_punches']
+        )
+
+    def record(self, device: str, attendance_count: int, moment: Optional[datetime] = None):
+        """
+        Record the attendance log size seen by a sync
+
+        Args:
+            device: Device identifier (IP address)
+            attendance_count: Total records in the device log
+            moment: When the count was taken (now if None)
+        """
+        moment = moment or datetime.now()
+        state = self.devices.get(device)
+        if state is None:
+            self.devices[device] = {'count': attendance_count, 'at': moment, 'rate': None, 'hourly': {}}
+            return
+
+        elapsed = (moment - state['at']).total_seconds()
+        if elapsed <= 0:
+            return
+        new_records = attendance_count - state['count']
+        if new_records < 0:
+            # The device log was cleared; everything in it is new
+            new_records = attendance_count
+        rate = new_records / elapsed
+
+        state['rate'] = rate if state['rate'] is None else self._smooth(state['rate'], rate)
+        hour = state['at'].hour
+        previous = state['hourly'].get(hour)
+        state['hourly'][hour] = rate if previous is None else self._smooth(previous, rate)
+        state['count'] = attendance_count
+        state['at'] = moment
+
+    def rate(self, device: str, moment: Optional[datetime] = None, horizon: Optional[float] = None) -> float:
+        """
+        Expected punch rate of a device (records per second)
+
+        Args:
+            device: Device identifier
+            moment: Start of the period (now if None)
+            horizon: Length of the period in seconds (max_interval if None)
+
+        Returns:
+            The larger of the recent rate and the hourly profile over the period
+        """
+        state = self.devices.get(device)
+        if state is None:
+            return 0.0
+        moment = moment or datetime.now()
+        horizon = self.max_interval if horizon is None else horizon
+        hours = {moment.hour, (moment + timedelta(seconds=horizon)).hour}
+        rates = [state['rate'] or 0.0] + [state['hourly'].get(hour, 0.0) for hour in hours]
+        return max(rates)
+
+    def next_interval(self, moment: Optional[datetime] = None) -> float:
+        """
+        Choose the interval until the next sync
+
+        Args:
+            moment: Current time (now if None)
+
+        Returns:
+            Seconds, a whole number of minutes within the bounds
+        """
+        peak = max((self.rate(device, moment) for device in self.devices), default=0.0)
+        if peak <= 0:
+            return int(self.max_interval)
+        interval = self.target_punches / peak
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        # Whole minutes keep the aligned run times readable
+        return int(max(self.min_interval, interval // 60 * 60))
+
+    def _smooth(self, previous: float, sample: float) -> float:
+        return self.smoothing * sample + (1 - self.smoothing) * previous
+
+
+def _parse_time(value: str) -> int:
+    """Convert HH:MM to minutes after midnight"""
+    try:
+        parsed = datetime.strptime(value.strip(), '%H:%M')
+    except ValueError:
+        raise ValueError(f"Invalid time (expected HH:MM): {value}")
+    return parsed.hour * 60 + parsed.minute
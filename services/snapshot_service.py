@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Snapshot Service for ZKTeco Device Information System
+Keeps a background-refreshed, in-memory snapshot of device and server state
+so dashboard views never talk to the device themselves. The snapshot is also
+kept on disk, so a restarted process serves the last known state at once.
+"""
+
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, Callable
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE_NAME = 'device_snapshot.json'
+STATE_FORMAT = 1  # bump when the persisted fields change meaning
+
+# Snapshot fields written to the state file and restored at startup
+PERSISTED_FIELDS = (
+    'device_online', 'device_info', 'users_count', 'attendance_count', 'server_online',
+    'roster_fingerprint', 'watermark', 'last_sync', 'refreshed_at'
+)
+
+
+class SnapshotService:
+    """Periodically refreshes a device/server status snapshot in a background thread"""
+
+    def __init__(self, service_factory: Callable[[], Any], interval: float = 60,
+                 state_file: Optional[str] = None, device: Optional[str] = None):
+        """
+        Initialize snapshot service
+
+        Args:
+            service_factory: Callable returning a DeviceService owned by the refresher
+            interval: Seconds between refreshes
+            state_file: JSON file the snapshot is persisted to and restored from
+                (None: memory only)
+            device: Device the snapshot describes; a state file written for
+                another device is ignored
+        """
+        self.service_factory = service_factory
+        self.interval = interval
+        self.state_file = state_file
+        self.device = device
+        self.device_service = None
+        self.last_sync = None
+        self._snapshot = {
+            'device_online': False,
+            'device_info': {},
+            'users_count': 0,
+            'attendance_count': 0,
+            'server_online': False,
+            'roster_fingerprint': None,
+            'watermark': None,
+            'last_sync': None,
+            'sync': None,
+            'refreshed_at': None,
+            'refresh_seconds': None,
+            'restored': False,
+            'error': None,
+            'version': 0
+        }
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._persist_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        if state_file:
+            self._restore()
+
+    def start(self):
+        """Start the background refresher (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='snapshot-refresher', daemon=True)
+        self._thread.start()
+        logger.info(f"Snapshot refresher started ({self.interval}s interval)")
+
+    def stop(self):
+        """Stop the background refresher"""
+        self._stop.set()
+        self._wake.set()
+
+    def request_refresh(self):
+        """Wake the refresher to refresh as soon as possible"""
+        self._wake.set()
+
+    def record_sync(self, result: Dict[str, Any]):
+        """
+        Store the outcome of a finished sync and schedule a refresh
+
+        Args:
+            result: Sync result dict (success, message, timestamp, ...)
+        """
+        self.last_sync = {
+            'success': result.get('success', False),
+            'message': result.get('message', ''),
+            'timestamp': result.get('timestamp', datetime.now().isoformat()),
+            'stats': result.get('stats')
+        }
+        self._persist(self._update({'last_sync': self.last_sync}))
+        self.request_refresh()
+
+    def record_index(self, watermark: str, roster_fingerprint: str):
+        """
+        Store the change detectors of the latest full attendance read
+
+        Args:
+            watermark: Attendance log watermark (see AttendanceIndex)
+            roster_fingerprint: Fingerprint of the user table
+        """
+        self._persist(self._update({'watermark': watermark, 'roster_fingerprint': roster_fingerprint}))
+
+    def record_sync_state(self, state: Optional[Dict[str, Any]]):
+        """
+        Publish the state of the running sync job (None when idle)
+
+        Args:
+            state: Small dict with job_id and status
+        """
+        self._update({'sync': state})
+
+    def wait_for_change(self, version: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Block until the snapshot version moves past the given one
+
+        Args:
+            version: Last version the caller has seen
+            timeout: Maximum seconds to wait
+
+        Returns:
+            New snapshot, or None on timeout
+        """
+        with self._changed:
+            if not self._changed.wait_for(lambda: self._snapshot['version'] != version, timeout):
+                return None
+            return copy.deepcopy(self._snapshot)
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        """Get a copy of the current snapshot"""
+        with self._lock:
+            return copy.deepcopy(self._snapshot)
+
+    def refresh(self) -> Dict[str, Any]:
+        """
+        Refresh the snapshot once from the device and server
+
+        Returns:
+            The new snapshot
+        """
+        started = time.monotonic()
+        update = {'error': None}
+        try:
+            if self.device_service is None:
+                self.device_service = self.service_factory()
+
+            status = self.device_service.get_device_status_only()
+            update['device_online'] = bool(status)
+            if status:
+                update['device_info'] = status.get('device_info', {})
+                update['users_count'] = status.get('users_count', 0)
+                update['attendance_count'] = status.get('attendance_count', 0)
+
+            update['server_online'] = self.device_service.test_server_connection()
+        except Exception as e:
+            logger.error(f"Error refreshing snapshot: {e}")
+            update['device_online'] = False
+            update['error'] = str(e)
+
+        update['refreshed_at'] = datetime.now().isoformat()
+        update['refresh_seconds'] = round(time.monotonic() - started, 2)
+        update['restored'] = False
+        snapshot = self._update(update)
+        if snapshot['device_online']:
+            self._persist(snapshot)
+        return snapshot
+
+    def _update(self, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply changes to the snapshot and bump its version"""
+        with self._changed:
+            self._snapshot.update(changes)
+            self._snapshot['version'] += 1
+            self._changed.notify_all()
+            return copy.deepcopy(self._snapshot)
+
+    def _restore(self):
+        """Load the persisted snapshot, if there is one for this device"""
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as state_file:
+                state = json.load(state_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable snapshot file {self.state_file}: {e}")
+            return
+
+        if not isinstance(state, dict) or state.get('format') != STATE_FORMAT:
+            logger.warning(f"Ignoring snapshot file {self.state_file}: unknown format")
+            return
+        if self.device and state.get('device') != self.device:
+            logger.info(f"Ignoring snapshot file {self.state_file}: written for device {state.get('device')}")
+            return
+
+        restored = {field: state[field] for field in PERSISTED_FIELDS if field in state}
+        self._snapshot.update(restored)
+        self._snapshot['restored'] = True
+        self.last_sync = restored.get('last_sync')
+        logger.info(f"Snapshot restored from {self.state_file} (refreshed at {restored.get('refreshed_at')})")
+
+    def _persist(self, snapshot: Dict[str, Any]):
+        """Atomically write the persisted fields of a snapshot to the state file"""
+        if not self.state_file:
+            return
+        state = {field: snapshot.get(field) for field in PERSISTED_FIELDS}
+        state['format'] = STATE_FORMAT
+        state['device'] = self.device
+        temporary = f"{self.state_file}.{os.getpid()}.tmp"
+        try:
+            with self._persist_lock:
+                with open(temporary, 'w', encoding='utf-8') as state_file:
+                    json.dump(state, state_file, ensure_ascii=False, default=str)
+                os.replace(temporary, self.state_file)
+        except OSError as e:
+            logger.warning(f"Could not write snapshot file {self.state_file}: {e}")
+
+    def _run(self):
+        """Refresh loop; sleeps between refreshes unless woken"""
+        while not self._stop.is_set():
+            self.refresh()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+def snapshot_file(configured: Optional[str], log_file: str) -> str:
+    """Snapshot state file: the configured one, or device_snapshot.json next to the log file"""
+    return configured or os.path.join(os.path.dirname(os.path.abspath(log_file)), SNAPSHOT_FILE_NAME)
+
+
+def snapshot_delta(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compute the fields that changed between two snapshots
+
+    Args:
+        previous: Snapshot the client already has
+        current: Newer snapshot
+
+    Returns:
+        Dict of changed fields plus version; includes new_punches when the
+        attendance count grew. Empty if nothing but the version changed.
+    """
+    delta = {
+        key: value for key, value in current.items()
+        if key != 'version' and previous.get(key) != value
+    }
+    if not delta:
+        return {}
+    if current.get('attendance_count', 0) > previous.get('attendance_count', 0) and previous.get('refreshed_at'):
+        delta['new_punches'] = current['attendance_count'] - previous['attendance_count']
+    delta['version'] = current['version']
+    return delta
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sync Daemon for ZKTeco Device Information System
+Long-running scheduled sync with a warm device session and HTTP pool,
+hot configuration reload and graceful shutdown
+"""
+
+import logging
+import os
+import signal
+import threading
+from typing import Optional, Dict, Any
+
+from config import Config
+from .device_service import DeviceService
+from .scheduler import SyncScheduler, AdaptiveInterval
+from .sync_lock import LOCK_SKIP
+from .sync_stats import summarize_stats
+
+logger = logging.getLogger(__name__)
+
+
+class SyncDaemon:
+    """Runs scheduled syncs until told to stop, reloading configuration on demand"""
+
+    def __init__(self, env_file: Optional[str] = None, adaptive: bool = False,
+                 lock_mode: str = LOCK_SKIP, watch_interval: float = 5):
+        """
+        Initialize sync daemon
+
+        Args:
+            env_file: Env file to load at start and on reload (watched for changes)
+            adaptive: Adjust the interval to the punch arrival rate
+            lock_mode: Behaviour if another process is syncing the device
+            watch_interval: Seconds between checks of the env file's modification time
+        """
+        self.env_file = env_file
+        self.adaptive = adaptive
+        self.lock_mode = lock_mode
+        self.watch_interval = watch_interval
+        self.device_service = None
+        self.scheduler = None
+        self.adaptive_interval = None
+        self.device_config = None
+        self.syncing = False
+        self._stop = threading.Event()
+        self._reload = threading.Event()
+        self._wake = threading.Event()
+
+    def request_stop(self):
+        """Stop after the running sync (if any) has finished"""
+        self._stop.set()
+        self._wake.set()
+
+    def request_reload(self):
+        """Reload configuration before the next sync"""
+        self._reload.set()
+        self._wake.set()
+
+    def install_signal_handlers(self):
+        """SIGTERM/SIGINT drain and stop (a second one exits at once); SIGHUP reloads"""
+        def on_stop(signum, frame):
+            if self._stop.is_set():
+                logger.warning("Second stop signal received, exiting immediately")
+                raise SystemExit(1)
+            logger.info(f"Received signal {signum}, "
+                        f"{'finishing the running sync before stopping' if self.syncing else 'stopping'}")
+            self.request_stop()
+
+        def on_reload(signum, frame):
+            logger.info("Received SIGHUP, reloading configuration")
+            self.request_reload()
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, on_reload)
+
+    def load_config(self):
+        """(Re)load configuration, keeping the device session if the device did not change"""
+        Config.reload(self.env_file)
+        sync_config = Config.get_sync_config()
+
+        device_config = (Config.get_device_config(), sync_config['lock_file'], sync_config['lock_ttl'])
+        if device_config != self.device_config:
+            if self.device_service:
+                logger.info("Device configuration changed, opening a new device session")
+                self.device_service.close()
+            self.device_service = DeviceService()
+            self.device_config = device_config
+
+        scheduler = SyncScheduler.from_config()
+        if self.adaptive:
+            adaptive_interval = AdaptiveInterval.from_config()
+            if self.adaptive_interval:
+                # Keep the learned punch rates across reloads
+                adaptive_interval.devices = self.adaptive_interval.devices
+            self.adaptive_interval = adaptive_interval
+            scheduler.interval = self.adaptive_interval.next_interval()
+        self.scheduler = scheduler
+
+        logger.info(f"Daemon schedule: every {scheduler.interval}s inside "
+                    f"{sync_config['start_time']}-{sync_config['end_time']} "
+                    f"(device {Config.DEVICE_IP}:{Config.DEVICE_PORT})")
+
+    def run(self) -> int:
+        """
+        Run until stopped
+
+        Returns:
+            Process exit code
+        """
+        self.load_config()
+        watcher = threading.Thread(target=self._watch_env_file, name='config-watcher', daemon=True)
+        watcher.start()
+        logger.info(f"Sync daemon started (pid {os.getpid()})")
+
+        try:
+            if self.scheduler.in_window():
+                self.run_once()
+            while not self._stop.is_set():
+                due = self.scheduler.next_run()
+                logger.info(f"Next sync scheduled at {due.strftime('%Y-%m-%d %H:%M:%S')}")
+                self._wake.clear()
+                woke_on_time = self.scheduler.sleep_until(due, self._wake)
+                if self._stop.is_set():
+                    break
+                if self._reload.is_set():
+                    self._reload.clear()
+                    try:
+                        self.load_config()
+                    except Exception as e:
+                        logger.error(f"Configuration reload failed, keeping the previous settings: {e}")
+                    continue
+                if woke_on_time:
+                    self.run_once()
+        finally:
+            self.shutdown()
+        return 0
+
+    def run_once(self) -> Dict[str, Any]:
+        """
+        Run one sync with the warm device service
+
+        Returns:
+            Sync result dict
+        """
+        self.syncing = True
+        try:
+            result = self.device_service.sync_device_data(lock_mode=self.lock_mode, trigger='daemon')
+        except Exception as e:
+            logger.error(f"Error in daemon sync: {e}")
+            result = {'success': False, 'message': str(e)}
+        finally:
+            self.syncing = False
+
+        if result.get('skipped'):
+            logger.info(f"Sync skipped: {result['message']}")
+        elif result['success']:
+            logger.info(f"Sync completed successfully: {result.get('data_summary', {})}")
+        else:
+            logger.error(f"Sync failed: {result['message']}")
+        if 'stats' in result:
+            logger.info(f"Timings: {summarize_stats(result['stats'])}")
+
+        if self.adaptive_interval and 'data_summary' in result:
+            self.adaptive_interval.record(Config.DEVICE_IP, result['data_summary']['attendance_count'])
+            interval = self.adaptive_interval.next_interval()
+            if interval != self.scheduler.interval:
+                logger.info(f"Adaptive interval: {self.scheduler.interval} -> {interval} seconds "
+                            f"({self.adaptive_interval.rate(Config.DEVICE_IP) * 3600:.1f} punches/hour)")
+                self.scheduler.interval = interval
+        return result
+
+    def shutdown(self):
+        """Close the device session and HTTP pool"""
+        logger.info("Sync daemon stopping")
+        if self.device_service:
+            try:
+                self.device_service.close()
+            except Exception as e:
+                logger.error(f"Error closing device service: {e}")
+
+    def _watch_env_file(self):
+        """Request a reload when the env file's modification time changes"""
+        if not self.env_file:
+            return
+        last_mtime = _mtime(self.env_file)
+        while not self._stop.wait(self.watch_interval):
+            mtime = _mtime(self.env_file)
+            if mtime != last_mtime:
+                last_mtime = mtime
+                logger.info(f"{self.env_file} changed, reloading configuration")
+                self.request_reload()
+
+
+def _mtime(path: str) -> Optional[float]:
+    """Modification time of a file, or None if it does not exist"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sync Job Service for ZKTeco Device Information System
+Runs device synchronization as background jobs with progress tracking
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, Tuple, List
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Job states
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_SKIPPED = 'skipped'  # another process was already syncing the device
+
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+
+class SyncJob:
+    """State of a single background sync job"""
+
+    def __init__(self, job_id: str, trigger: str):
+        """
+        Initialize sync job
+
+        Args:
+            job_id: Unique job identifier
+            trigger: Who started the job (api, web, cli, ...)
+        """
+        self.job_id = job_id
+        self.trigger = trigger
+        self.status = JOB_QUEUED
+        self.stage = 'queued'
+        # Progress of the current stage: records read from the device while
+        # reading, records sent while uploading
+        self.records_total = 0
+        self.records_processed = 0
+        self.bytes_total = 0
+        self.bytes_uploaded = 0
+        self.stage_started_monotonic = None
+        self.attached_triggers = 0
+        self.created_at = datetime.now()
+        self.started_monotonic = None
+        self.finished_monotonic = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.expected_duration = None
+        self.done = threading.Event()
+
+    def update(self, stage: Optional[str] = None, **fields):
+        """
+        Update job progress
+
+        Args:
+            stage: New stage name
+            **fields: records_total, records_processed, bytes_total or bytes_uploaded
+        """
+        if stage and stage != self.stage:
+            self.stage = stage
+            self.stage_started_monotonic = time.monotonic()
+        for key in ('records_total', 'records_processed', 'bytes_total', 'bytes_uploaded'):
+            if key in fields and fields[key] is not None:
+                setattr(self, key, fields[key])
+
+    def elapsed_seconds(self) -> float:
+        """Seconds spent running so far (or in total once finished)"""
+        if self.started_monotonic is None:
+            return 0.0
+        end = self.finished_monotonic if self.finished_monotonic is not None else time.monotonic()
+        return end - self.started_monotonic
+
+    def eta_seconds(self) -> Optional[float]:
+        """
+        Estimate remaining time
+
+        While uploading, the rate of bytes sent so far in the upload stage
+        gives the remaining time. In earlier stages the duration of the
+        previous successful job is used, or, without one, the rate of
+        records read so far (which leaves out the upload).
+
+        Returns:
+            Remaining seconds or None if no estimate is possible
+        """
+        if self.status not in ACTIVE_STATES:
+            return 0.0 if self.status == JOB_SUCCEEDED else None
+
+        if self.stage == 'uploading' and self.bytes_total and self.bytes_uploaded:
+            return _remaining(self.stage_seconds(), self.bytes_uploaded, self.bytes_total)
+
+        elapsed = self.elapsed_seconds()
+        if self.expected_duration:
+            return round(max(self.expected_duration - elapsed, 0.0), 1)
+        if self.stage == 'reading_attendance' and self.records_total and self.records_processed:
+            return _remaining(self.stage_seconds(), self.records_processed, self.records_total)
+        return None
+
+    def stage_seconds(self) -> float:
+        """Seconds spent in the current stage"""
+        if self.stage_started_monotonic is None:
+            return self.elapsed_seconds()
+        return time.monotonic() - self.stage_started_monotonic
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert job state to a JSON-serializable dict"""
+        return {
+            'job_id': self.job_id,
+            'trigger': self.trigger,
+            'status': self.status,
+            'stage': self.stage,
+            'records_total': self.records_total,
+            'records_processed': self.records_processed,
+            'bytes_total': self.bytes_total,
+            'bytes_uploaded': self.bytes_uploaded,
+            'attached_triggers': self.attached_triggers,
+            'elapsed_seconds': round(self.elapsed_seconds(), 1),
+            'eta_seconds': self.eta_seconds(),
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'result': self.result,
+            'error': self.error
+        }
+
+
+def _remaining(seconds: float, done: int, total: int) -> float:
+    """Seconds left at the rate that did done of total units in seconds"""
+    done = min(done, total)
+    return round(seconds / done * (total - done), 1)
+
+
+class SyncJobService:
+    """Service that runs device syncs in background threads, one at a time"""
+
+    def __init__(self, service_factory: Callable[[], Any], history_limit: int = 50):
+        """
+        Initialize sync job service
+
+        Args:
+            service_factory: Callable returning a fresh DeviceService for each job
+            history_limit: Number of finished jobs kept for status queries
+        """
+        self.service_factory = service_factory
+        self.history_limit = history_limit
+        self.jobs = OrderedDict()
+        self.active_job = None
+        self.last_duration = None
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback: Callable[[SyncJob], None]):
+        """
+        Register a callback invoked with each job when it starts and when it finishes
+
+        Args:
+            callback: Callable receiving the finished SyncJob
+        """
+        self.listeners.append(callback)
+
+    def start_sync(self, trigger: str = 'api', profile: bool = False,
+                   full_resend: bool = False, lock_mode: Optional[str] = None,
+                   attach: bool = True) -> Tuple[SyncJob, bool]:
+        """
+        Start a sync job, or attach to the one already running
+
+        Args:
+            trigger: Who requested the sync
+            profile: Profile the sync (ignored when attaching to a running job)
+            full_resend: Upload every day group (ignored when attaching)
+            lock_mode: Behaviour if another process is syncing the device
+                (SYNC_LOCK_MODE if None; ignored when attaching)
+            attach: Attach to a running job; if False, a running job is
+                returned untouched and no job is started
+
+        Returns:
+            Tuple of (job, created) where created is False when a job was
+            already running
+        """
+        with self._lock:
+            if self.active_job and self.active_job.status in ACTIVE_STATES:
+                if not attach:
+                    return self.active_job, False
+                self.active_job.attached_triggers += 1
+                logger.info(f"Sync requested by {trigger} attached to running job {self.active_job.job_id}")
+                return self.active_job, False
+
+            job = SyncJob(uuid.uuid4().hex[:12], trigger)
+            job.expected_duration = self.last_duration
+            self.jobs[job.job_id] = job
+            self.active_job = job
+            self._trim_history()
+
+        thread = threading.Thread(target=self._run_job, args=(job, profile, full_resend, lock_mode), name=f"sync-job-{job.job_id}", daemon=True)
+        thread.start()
+        logger.info(f"Started sync job {job.job_id} (trigger: {trigger})")
+        return job, True
+
+    def get_job(self, job_id: str) -> Optional[SyncJob]:
+        """
+        Get job by id
+
+        Args:
+            job_id: Job identifier
+
+        Returns:
+            SyncJob or None if unknown
+        """
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Get all known jobs, newest first"""
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def queue_depth(self) -> int:
+        """Number of queued or running jobs plus triggers attached to them"""
+        with self._lock:
+            return sum(1 + job.attached_triggers for job in self.jobs.values() if job.status in ACTIVE_STATES)
+
+    def wait(self, job: SyncJob, timeout: Optional[float] = None) -> bool:
+        """
+        Block until a job finishes
+
+        Args:
+            job: Job to wait for
+            timeout: Maximum seconds to wait (None waits forever)
+
+        Returns:
+            bool: True if the job finished within the timeout
+        """
+        return job.done.wait(timeout)
+
+    def _run_job(self, job: SyncJob, profile: bool = False, full_resend: bool = False,
+                 lock_mode: Optional[str] = None):
+        """Execute a sync job in the current (background) thread"""
+        job.status = JOB_RUNNING
+        job.started_monotonic = time.monotonic()
+        self._notify(job)
+        try:
+            device_service = self.service_factory()
+            result = device_service.sync_device_data(progress_callback=job.update, lock_mode=lock_mode,
+                                                     trigger=job.trigger, profile=profile,
+                                                     full_resend=full_resend)
+            job.result = result
+            if result.get('skipped'):
+                job.status = JOB_SKIPPED
+            else:
+                job.status = JOB_SUCCEEDED if result.get('success') else JOB_FAILED
+            if not result.get('success'):
+                job.error = result.get('message')
+        except Exception as e:
+            logger.error(f"Sync job {job.job_id} failed: {e}")
+            job.status = JOB_FAILED
+            job.error = str(e)
+        finally:
+            job.finished_monotonic = time.monotonic()
+            job.finished_at = datetime.now()
+            job.stage = 'done'
+            if job.status == JOB_SUCCEEDED:
+                self.last_duration = job.elapsed_seconds()
+            with self._lock:
+                if self.active_job is job:
+                    self.active_job = None
+            job.done.set()
+            logger.info(f"Sync job {job.job_id} finished with status {job.status} in {job.elapsed_seconds():.1f}s")
+            self._notify(job)
+
+    def _notify(self, job: SyncJob):
+        """Call listeners with a job whose status changed"""
+        for callback in self.listeners:
+            try:
+                callback(job)
+            except Exception as e:
+                logger.error(f"Error in sync job listener: {e}")
+
+    def _trim_history(self):
+        """Drop the oldest finished jobs beyond the history limit"""
+        while len(self.jobs) > self.history_limit:
+            oldest_id = next(iter(self.jobs))
+            if self.jobs[oldest_id].status in ACTIVE_STATES:
+                break
+            del self.jobs[oldest_id]
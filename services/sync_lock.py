@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sync Lock for ZKTeco Device Information System
+Cross-process, per-device sync lease stored in SQLite, so the web interface,
+API server, command-line scheduler and tray app never sync one device at once
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional, Dict, Any, Callable, Tuple
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# What a trigger does when another process holds the device's lease
+LOCK_WAIT = 'wait'      # wait for the lease, then run a sync of its own
+LOCK_ATTACH = 'attach'  # wait for the running sync and return its result
+LOCK_SKIP = 'skip'      # return at once with a skipped result
+
+LOCK_MODES = (LOCK_WAIT, LOCK_ATTACH, LOCK_SKIP)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_leases (
+    device TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    host TEXT NOT NULL,
+    trigger TEXT NOT NULL,
+    acquired_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_results (
+    device TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    result TEXT NOT NULL
+);
+"""
+
+
+class SyncLease:
+    """A held per-device lease"""
+
+    def __init__(self, device: str, owner: str, trigger: str):
+        self.device = device
+        self.owner = owner
+        self.trigger = trigger
+
+
+class SyncLock:
+    """Per-device sync leases with expiry, shared by all processes on the host"""
+
+    def __init__(self, path: str, ttl: float = 600, poll_interval: float = 1.0):
+        """
+        Initialize sync lock
+
+        Args:
+            path: SQLite database file shared by all processes
+            ttl: Lease lifetime in seconds; the holder renews it while syncing,
+                so only a crashed holder's lease ever expires
+            poll_interval: Seconds between checks while waiting for a lease
+        """
+        self.path = path
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection in autocommit mode with the schema in place"""
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.executescript(SCHEMA)
+        return connection
+
+    def try_acquire(self, device: str, trigger: str) -> Tuple[Optional[SyncLease], Optional[Dict[str, Any]]]:
+        """
+        Take the device's lease if it is free or expired
+
+        Args:
+            device: Device identifier (IP address)
+            trigger: Who wants to sync (web, api, cli, ...)
+
+        Returns:
+            Tuple of (lease, None) on success or (None, holder info)
+        """
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT * FROM sync_leases WHERE device = ?', (device,)).fetchone()
+            if row and row['expires_at'] > now:
+                connection.execute('ROLLBACK')
+                return None, _holder_info(row)
+            if row:
+                logger.warning(f"Taking over expired sync lease of {row['owner']} for {device}")
+            connection.execute(
+                'INSERT OR REPLACE INTO sync_leases VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (device, owner, os.getpid(), socket.gethostname(), trigger, now, now + self.ttl)
+            )
+            connection.execute('COMMIT')
+            return SyncLease(device, owner, trigger), None
+        finally:
+            connection.close()
+
+    def holder(self, device: str) -> Optional[Dict[str, Any]]:
+        """Get the current, unexpired lease holder of a device"""
+        connection = self._connect()
+        try:
+            row = connection.execute('SELECT * FROM sync_leases WHERE device = ?', (device,)).fetchone()
+        finally:
+            connection.close()
+        if row and row['expires_at'] > time.time():
+            return _holder_info(row)
+        return None
+
+    def renew(self, lease: SyncLease) -> bool:
+        """Extend a held lease; False if it was lost (expired and taken over)"""
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                'UPDATE sync_leases SET expires_at = ? WHERE device = ? AND owner = ?',
+                (time.time() + self.ttl, lease.device, lease.owner)
+            )
+            return cursor.rowcount == 1
+        finally:
+            connection.close()
+
+    def release(self, lease: SyncLease, result: Optional[Dict[str, Any]] = None):
+        """
+        Release a lease and publish the sync result to attached triggers
+
+        Args:
+            lease: Lease to release
+            result: Sync result dict (must be JSON-serializable)
+        """
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            if result is not None:
+                connection.execute(
+                    'INSERT OR REPLACE INTO sync_results VALUES (?, ?, ?, ?)',
+                    (lease.device, lease.owner, time.time(), json.dumps(result, default=str))
+                )
+            connection.execute('DELETE FROM sync_leases WHERE device = ? AND owner = ?', (lease.device, lease.owner))
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+
+    def result_of(self, device: str, owner: str) -> Optional[Dict[str, Any]]:
+        """Get the published result of a finished lease holder"""
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                'SELECT result FROM sync_results WHERE device = ? AND owner = ?', (device, owner)
+            ).fetchone()
+        finally:
+            connection.close()
+        return json.loads(row['result']) if row else None
+
+    def run(self, device: str, trigger: str, work: Callable[[], Dict[str, Any]],
+            mode: str = LOCK_ATTACH, wait_timeout: float = 1800,
+            on_wait: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Run a sync under the device's lease
+
+        work() runs at most once. If the lease database fails before anyone
+        was seen holding the lease, work() runs without it, so a broken
+        database does not stop syncing; if it fails while waiting for
+        another process's sync, the sync is skipped instead of overlapping.
+        Exceptions raised by work() propagate unchanged.
+
+        Args:
+            device: Device identifier
+            trigger: Who wants to sync
+            work: Callable performing the sync and returning its result dict
+            mode: 'wait', 'attach' or 'skip' when the lease is held elsewhere
+            wait_timeout: Maximum seconds to wait in 'wait'/'attach' mode
+            on_wait: Called once with the holder info when the caller has to wait
+
+        Returns:
+            The sync result; attached results carry 'attached': True and
+            skipped ones 'skipped': True
+
+        Raises:
+            ValueError: If mode is unknown
+        """
+        if mode not in LOCK_MODES:
+            raise ValueError(f"Unknown lock mode: {mode}")
+
+        deadline = time.monotonic() + wait_timeout
+        waited_for = None
+        while True:
+            try:
+                lease, holder = self.try_acquire(device, trigger)
+                attached = None
+                if not lease and waited_for and waited_for['owner'] != holder['owner'] and mode == LOCK_ATTACH:
+                    # The sync we attached to finished and another one started; attach to it
+                    attached = self.result_of(device, waited_for['owner'])
+            except sqlite3.Error as e:
+                if waited_for is None:
+                    logger.error(f"Sync lock database unavailable, syncing {device} without it: {e}")
+                    return work()
+                logger.error(f"Sync lock database failed while waiting for the sync of {device}: {e}")
+                return {
+                    'success': False,
+                    'skipped': True,
+                    'message': f"Sync lock database failed while another sync was running: {e}",
+                    'lock_holder': waited_for,
+                    'timestamp': datetime.now().isoformat()
+                }
+            if lease:
+                return self._run_leased(lease, work)
+            if attached is not None:
+                return dict(attached, attached=True, attached_to=waited_for)
+
+            if mode == LOCK_SKIP or time.monotonic() >= deadline:
+                reason = 'already running' if mode == LOCK_SKIP else 'still running after waiting'
+                logger.info(f"Sync of {device} by {trigger} skipped: sync {reason} "
+                            f"(trigger {holder['trigger']}, pid {holder['pid']} on {holder['host']})")
+                return {
+                    'success': False,
+                    'skipped': True,
+                    'message': f"Sync {reason} in another process "
+                               f"(trigger {holder['trigger']}, pid {holder['pid']}, since {holder['acquired_at']})",
+                    'lock_holder': holder,
+                    'timestamp': datetime.now().isoformat()
+                }
+
+            if waited_for is None:
+                logger.info(f"Sync of {device} by {trigger} waiting for running sync "
+                            f"(trigger {holder['trigger']}, pid {holder['pid']}, mode {mode})")
+                if on_wait:
+                    on_wait(holder)
+            waited_for = holder
+
+            if mode == LOCK_ATTACH:
+                try:
+                    result = self._wait_for_result(device, holder, deadline)
+                except sqlite3.Error as e:
+                    logger.error(f"Sync lock database failed while waiting for the sync of {device}: {e}")
+                    result = None
+                if result is not None:
+                    return dict(result, attached=True, attached_to=holder)
+                continue
+            time.sleep(self.poll_interval)
+
+    def _wait_for_result(self, device: str, holder: Dict[str, Any], deadline: float) -> Optional[Dict[str, Any]]:
+        """Wait until a holder releases its lease and return the result it published"""
+        while time.monotonic() < deadline:
+            current = self.holder(device)
+            if current is None or current['owner'] != holder['owner']:
+                return self.result_of(device, holder['owner'])
+            time.sleep(self.poll_interval)
+        return None
+
+    def _run_leased(self, lease: SyncLease, work: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Run work while a heartbeat thread keeps the lease alive"""
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(self.ttl / 3):
+                try:
+                    renewed = self.renew(lease)
+                except sqlite3.Error as e:
+                    logger.error(f"Could not renew sync lease for {lease.device}: {e}")
+                    continue
+                if not renewed:
+                    logger.error(f"Lost sync lease for {lease.device}")
+                    return
+
+        thread = threading.Thread(target=heartbeat, name=f"sync-lease-{lease.device}", daemon=True)
+        thread.start()
+        result = None
+        try:
+            result = work()
+            return result
+        finally:
+            stop.set()
+            try:
+                self.release(lease, result)
+            except sqlite3.Error as e:
+                logger.error(f"Error releasing sync lease for {lease.device}: {e}")
+
+
+def _holder_info(row: sqlite3.Row) -> Dict[str, Any]:
+    """Describe a lease row for status messages"""
+    return {
+        'owner': row['owner'],
+        'pid': row['pid'],
+        'host': row['host'],
+        'trigger': row['trigger'],
+        'acquired_at': datetime.fromtimestamp(row['acquired_at']).isoformat(),
+        'expires_at': datetime.fromtimestamp(row['expires_at']).isoformat()
+    }
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sync Profiler for ZKTeco Device Information System
+Wraps one sync in cProfile, tracemalloc and a stack sampler and writes
+files a field engineer can send back without installing anything:
+
+    <label>.prof        cProfile data (python -m pstats, snakeviz)
+    <label>.alloc.txt   top allocations by line, with tracebacks
+    <label>.collapsed   sampled stacks for flamegraph.pl or speedscope
+"""
+
+import cProfile
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+TOP_ALLOCATIONS = 25
+TRACEBACK_FRAMES = 10
+SNAPSHOT_GROWTH = 1.1  # retake the allocation snapshot when traced memory grew by 10%
+
+# cProfile and tracemalloc are process-wide; profile one sync at a time
+_active = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval and counts collapsed stacks"""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL,
+                 on_sample: Optional[Callable[[], None]] = None):
+        """
+        Initialize stack sampler
+
+        Args:
+            thread_id: Thread to sample (threading.get_ident() of the sync thread)
+            interval: Seconds between samples
+            on_sample: Called from the sampler thread after each sample
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.on_sample = on_sample
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+            if self.on_sample:
+                self.on_sample()
+
+    def write(self, path: str):
+        """Write 'root;...;leaf count' lines"""
+        with open(path, 'w', encoding='utf-8') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f"{stack} {count}\n")
+
+
+class SyncProfiler:
+    """Context manager profiling the code run inside it"""
+
+    def __init__(self, output_dir: str, label: str, sample_interval: float = SAMPLE_INTERVAL,
+                 top: int = TOP_ALLOCATIONS):
+        """
+        Initialize sync profiler
+
+        Args:
+            output_dir: Directory receiving the profile files
+            label: File name prefix, e.g. sync-20240101-120000-cli
+            sample_interval: Seconds between stack samples
+            top: Allocation sites listed in the report
+        """
+        self.output_dir = output_dir
+        self.label = label
+        self.sample_interval = sample_interval
+        self.top = top
+        self.files = {}
+        self._profile = None
+        self._sampler = None
+        self._owns_tracemalloc = False
+        self._acquired = False
+        self._snapshot = None
+        self._snapshot_size = 0
+
+    def __enter__(self) -> 'SyncProfiler':
+        self._acquired = _active.acquire(blocking=False)
+        if not self._acquired:
+            logger.warning("Another sync is being profiled, running this one without profiling")
+            return self
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEBACK_FRAMES)
+            self._owns_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._sampler = StackSampler(threading.get_ident(), self.sample_interval, self._track_peak)
+        self._sampler.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._acquired:
+            return False
+        try:
+            self._profile.disable()
+            self._sampler.stop()
+            self._track_peak()
+            current, peak = tracemalloc.get_traced_memory()
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+            self._write(self._snapshot, current, peak)
+        except Exception as e:
+            logger.error(f"Error writing sync profile: {e}")
+        finally:
+            _active.release()
+        return False
+
+    def _track_peak(self):
+        """Keep a snapshot of the allocations near the highest traced memory"""
+        current, _ = tracemalloc.get_traced_memory()
+        if self._snapshot is None or current > self._snapshot_size * SNAPSHOT_GROWTH:
+            self._snapshot = tracemalloc.take_snapshot()
+            self._snapshot_size = current
+
+    def _write(self, snapshot: tracemalloc.Snapshot, current: int, peak: int):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, self.label)
+        files = {
+            'profile': base + '.prof',
+            'allocations': base + '.alloc.txt',
+            'stacks': base + '.collapsed'
+        }
+
+        self._profile.dump_stats(files['profile'])
+        self._sampler.write(files['stacks'])
+
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        with open(files['allocations'], 'w', encoding='utf-8') as output:
+            output.write(f"Peak traced memory: {peak / 1048576:.1f} MiB, "
+                         f"still allocated at the end: {current / 1048576:.1f} MiB\n")
+            output.write(f"Snapshot taken at {self._snapshot_size / 1048576:.1f} MiB\n\n")
+            output.write(f"Top {self.top} allocation sites:\n")
+            for stat in snapshot.statistics('lineno')[:self.top]:
+                output.write(f"{stat.size / 1024:10.1f} KiB {stat.count:8} blocks  {stat.traceback[0]}\n")
+            output.write("\nTracebacks of the 5 largest:\n")
+            for stat in snapshot.statistics('traceback')[:5]:
+                output.write(f"\n{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+                for line in stat.traceback.format():
+                    output.write(f"{line}\n")
+
+        self.files = files
+        logger.info(f"Sync profile written to {base}.{{prof,alloc.txt,collapsed}} "
+                    f"({sum(self._sampler.stacks.values())} stack samples)")
+
+
+def profile_dir(configured: Optional[str], log_file: str) -> str:
+    """Profile directory: the configured one, or the log file's directory"""
+    return configured or os.path.dirname(os.path.abspath(log_file))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sync Statistics for ZKTeco Device Information System
+Per-run stage timings, byte and record counts and retries of one sync,
+returned in the sync result (the process-wide totals live in metrics.py)
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from typing import Dict, Any
+
+# Stages in pipeline order; the dashboard and CLI show them in this order
+STAGES = ('connect', 'read_users', 'read_attendance', 'format', 'serialize', 'upload')
+
+
+class SyncStats:
+    """Figures collected while one sync runs"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.bytes = {}
+        self.records = {}
+        self.retries = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage; repeated stages add up"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def add_bytes(self, name: str, amount: int):
+        """Add transferred bytes (device, upload, response)"""
+        self.bytes[name] = self.bytes.get(name, 0) + int(amount)
+
+    def set_records(self, name: str, count: int):
+        """Set a record count (users, attendance, formatted)"""
+        self.records[name] = int(count)
+
+    def add_retry(self, name: str, count: int = 1):
+        """Count a retried operation (device reconnects, upload attempts)"""
+        self.retries[name] = self.retries.get(name, 0) + count
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Get the figures for the sync result
+
+        Returns:
+            Dict with total_seconds, stages (seconds), bytes, records and retries
+        """
+        return {
+            'total_seconds': round(time.perf_counter() - self.started, 3),
+            'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            'bytes': dict(self.bytes),
+            'records': dict(self.records),
+            'retries': dict(self.retries)
+        }
+
+
+def format_stats_line(device: str, trigger: str, success: bool, stats: Dict[str, Any]) -> str:
+    """
+    Render stats as one structured log line (prefix plus compact JSON)
+
+    Args:
+        device: Device identifier
+        trigger: Who requested the sync
+        success: Sync outcome
+        stats: Dict from SyncStats.as_dict()
+
+    Returns:
+        Line such as: sync_stats {"device": "...", "total_seconds": 12.3, ...}
+    """
+    fields = {'device': device, 'trigger': trigger, 'success': success}
+    fields.update(stats)
+    return 'sync_stats ' + json.dumps(fields, separators=(',', ':'))
+
+
+def summarize_stats(stats: Dict[str, Any]) -> str:
+    """
+    Render stats for people, e.g. 'total 12.3s: connect 0.4s, read_users 1.1s, ...'
+
+    Args:
+        stats: Dict from SyncStats.as_dict()
+
+    Returns:
+        One-line human readable summary
+    """
+    stages = stats.get('stages', {})
+    ordered = [name for name in STAGES if name in stages] + [name for name in stages if name not in STAGES]
+    parts = [f"{name} {stages[name]:.2f}s" for name in ordered]
+    summary = f"total {stats.get('total_seconds', 0):.2f}s: " + ', '.join(parts)
+    extra = [f"{name} {count}" for name, count in stats.get('records', {}).items()]
+    extra += [f"{name} {_format_bytes(amount)}" for name, amount in stats.get('bytes', {}).items()]
+    extra += [f"{name} retries {count}" for name, count in stats.get('retries', {}).items() if count]
+    if extra:
+        summary += ' (' + ', '.join(extra) + ')'
+    return summary
+
+
+def _format_bytes(amount: int) -> str:
+    """Render a byte count with a binary unit"""
+    for unit in ('B', 'KiB', 'MiB'):
+        if amount < 1024 or unit == 'MiB':
+            return f"{amount:.0f}{unit}" if unit == 'B' else f"{amount:.1f}{unit}"
+        amount /= 1024
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Upload Ledger for ZKTeco Device Information System
+Remembers a content hash of every attendance_records entry the server
+acknowledged, keyed by (device, date, id_number), so a sync uploads only
+the day groups that are new or changed since the last successful upload.
+The same hashes roll up into per-day and per-month digests that the server
+can report too, so whole months can be compared at a few bytes each.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Any, List, Tuple, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FILE_NAME = 'upload_ledger.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploaded_groups (
+    device TEXT NOT NULL,
+    date TEXT NOT NULL,
+    id_number TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    acknowledged_at REAL NOT NULL,
+    PRIMARY KEY (device, date, id_number)
+) WITHOUT ROWID;
+"""
+
+# (date, id_number, digest) of one attendance_records entry
+LedgerEntry = Tuple[str, str, str]
+
+
+def record_digest(record: Dict[str, Any]) -> str:
+    """
+    Content hash of an attendance_records entry, independent of key order
+
+    Args:
+        record: Entry as built by to_api_record()
+
+    Returns:
+        Hex digest
+    """
+    canonical = json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def _combine(lines: Iterable[str]) -> str:
+    return hashlib.sha1('\n'.join(sorted(lines)).encode('utf-8')).hexdigest()
+
+
+def digest_tree(entries: Iterable[LedgerEntry]) -> Dict[str, Dict[str, str]]:
+    """
+    Per-day and per-month digests of acknowledged entries
+
+    A day's digest covers the 'id_number:record digest' lines of that day,
+    a month's the 'date:day digest' lines of its days, both sorted, so the
+    server can compute the same values from the records it stored.
+
+    Args:
+        entries: (date, id_number, record digest) tuples
+
+    Returns:
+        Dict with 'days' (YYYY-MM-DD -> digest) and 'months' (YYYY-MM -> digest)
+    """
+    by_day = {}
+    for date, id_number, digest in entries:
+        by_day.setdefault(date, []).append(f"{id_number}:{digest}")
+    days = {date: _combine(lines) for date, lines in by_day.items()}
+
+    by_month = {}
+    for date, digest in days.items():
+        by_month.setdefault(date[:7], []).append(f"{date}:{digest}")
+    months = {month: _combine(lines) for month, lines in by_month.items()}
+    return {'days': days, 'months': months}
+
+
+class UploadLedger:
+    """Content hashes of acknowledged day groups, shared by all processes on the host"""
+
+    def __init__(self, path: str):
+        """
+        Initialize upload ledger
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection in autocommit mode with the schema in place"""
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.executescript(SCHEMA)
+        return connection
+
+    def pending(self, device: str, records: List[Dict[str, Any]],
+                full: bool = False) -> Tuple[List[Dict[str, Any]], List[LedgerEntry]]:
+        """
+        Select the records the server has not acknowledged in their current form
+
+        Args:
+            device: Device identifier (IP address)
+            records: attendance_records entries of the sync
+            full: Select every record (full resend)
+
+        Returns:
+            Tuple of (records to send, their ledger entries to acknowledge
+            once the server accepted them)
+        """
+        entries = [(record['date'], str(record['id_number']), record_digest(record)) for record in records]
+        if full or not records:
+            return list(records), entries
+
+        known = {}
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                'SELECT date, id_number, digest FROM uploaded_groups WHERE device = ? AND date BETWEEN ? AND ?',
+                (device, min(entry[0] for entry in entries), max(entry[0] for entry in entries))
+            )
+            for date, id_number, digest in rows:
+                known[(date, id_number)] = digest
+        finally:
+            connection.close()
+
+        selected = [
+            (record, entry) for record, entry in zip(records, entries)
+            if known.get(entry[:2]) != entry[2]
+        ]
+        return [record for record, _ in selected], [entry for _, entry in selected]
+
+    def acknowledge(self, device: str, entries: List[LedgerEntry]):
+        """
+        Record entries the server accepted
+
+        Args:
+            device: Device identifier (IP address)
+            entries: Ledger entries returned by pending()
+        """
+        if not entries:
+            return
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(
+                'INSERT OR REPLACE INTO uploaded_groups VALUES (?, ?, ?, ?, ?)',
+                [(device, date, id_number, digest, now) for date, id_number, digest in entries]
+            )
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+
+    def entries(self, device: str, start: Optional[str] = None,
+                end: Optional[str] = None) -> List[LedgerEntry]:
+        """
+        Acknowledged entries of a device, optionally limited to a date range
+
+        Args:
+            device: Device identifier (IP address)
+            start: First date (YYYY-MM-DD, inclusive)
+            end: Last date (YYYY-MM-DD, inclusive)
+
+        Returns:
+            (date, id_number, digest) tuples ordered by date
+        """
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                'SELECT date, id_number, digest FROM uploaded_groups '
+                'WHERE device = ? AND date >= ? AND date <= ? ORDER BY date',
+                (device, start or '0000-00-00', end or '9999-99-99')
+            )
+            return [tuple(row) for row in rows]
+        finally:
+            connection.close()
+
+    def forget(self, device: str, dates: List[str]) -> int:
+        """
+        Drop the entries of some days, so the next sync uploads those days again
+
+        Args:
+            device: Device identifier (IP address)
+            dates: Days to forget (YYYY-MM-DD)
+
+        Returns:
+            Number of entries removed
+        """
+        if not dates:
+            return 0
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            removed = sum(
+                connection.execute('DELETE FROM uploaded_groups WHERE device = ? AND date = ?', (device, date)).rowcount
+                for date in dates
+            )
+            connection.execute('COMMIT')
+            return removed
+        finally:
+            connection.close()
+
+
+def ledger_file(configured: str, log_file: str) -> str:
+    """Ledger database: the configured one, or upload_ledger.db next to the log file"""
+    return configured or os.path.join(os.path.dirname(os.path.abspath(log_file)), LEDGER_FILE_NAME)
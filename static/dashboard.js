@@ -0,0 +1,161 @@
+// Dashboard behaviour. The page shell is static; all device data arrives as
+// JSON from /events (or /status), /jobs/<id> and /logs.
+
+var page = document.body.dataset;
+
+function showLoading() {
+    document.getElementById('loading').style.display = 'block';
+}
+
+// Poll a running sync job and show its progress
+function pollJob(jobId) {
+    showLoading();
+    fetch('/jobs/' + jobId)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                return;
+            }
+            var job = data.data;
+            var text = job.stage + ' - ' + job.records_processed + '/' + job.records_total;
+            if (job.eta_seconds !== null) {
+                text += ' (~' + Math.round(job.eta_seconds) + 's)';
+            }
+            document.getElementById('job-progress').textContent = text;
+            if (job.status === 'queued' || job.status === 'running') {
+                setTimeout(function() { pollJob(jobId); }, 2000);
+            } else {
+                var message = job.status === 'succeeded' ? 'همگام‌سازی موفق' : 'خطا در همگام‌سازی: ' + (job.error || '');
+                if (job.status === 'skipped') {
+                    message = 'همگام‌سازی دیگری در حال اجراست: ' + (job.error || '');
+                }
+                var type = job.status === 'succeeded' ? 'success' : 'error';
+                location.href = '/?message=' + encodeURIComponent(message) + '&type=' + type;
+            }
+        });
+}
+
+document.getElementById('sync-button').addEventListener('click', showLoading);
+
+if (page.jobId) {
+    pollJob(page.jobId);
+}
+
+// Patch the page in place from snapshot fields pushed by the server
+function setText(id, value) {
+    var element = document.getElementById(id);
+    if (element && value !== undefined && value !== null) {
+        element.textContent = value;
+    }
+}
+
+// e.g. "42.1s: connect 0.8s, read_users 3.2s, ... | 1.2 MB, 2 retries"
+var STAGES = ['connect', 'read_users', 'read_attendance', 'format', 'serialize', 'upload'];
+
+function formatStats(stats) {
+    var parts = STAGES.filter(function(name) { return name in stats.stages; })
+        .map(function(name) { return name + ' ' + stats.stages[name].toFixed(1) + 's'; });
+    var bytes = Object.values(stats.bytes).reduce(function(sum, value) { return sum + value; }, 0);
+    var retries = Object.values(stats.retries).reduce(function(sum, value) { return sum + value; }, 0);
+    var text = stats.total_seconds.toFixed(1) + 's: ' + parts.join(', ');
+    text += ' | ' + (bytes / 1048576).toFixed(1) + ' MB';
+    if (retries) {
+        text += ', ' + retries + ' retries';
+    }
+    return text;
+}
+
+function applySnapshot(data) {
+    if ('device_online' in data) {
+        document.getElementById('device-indicator').className =
+            'status-indicator status-' + (data.device_online ? 'online' : 'offline');
+    }
+    if (data.device_info) {
+        setText('device-name', data.device_info.device_name || 'نامشخص');
+        setText('serial-number', data.device_info.serial_number || 'نامشخص');
+    }
+    setText('users-count', data.users_count);
+    setText('attendance-count', data.attendance_count);
+    if (data.new_punches) {
+        setText('new-punches', '(+' + data.new_punches + ')');
+    }
+    if ('server_online' in data) {
+        setText('server-status', data.server_online ? 'متصل' : 'قطع');
+    }
+    if (data.last_sync) {
+        setText('last-sync', data.last_sync.timestamp.substring(0, 19).replace('T', ' '));
+        if (data.last_sync.stats) {
+            setText('sync-stats', formatStats(data.last_sync.stats));
+        }
+    }
+    if (data.refreshed_at) {
+        // A restored snapshot is shown until the first refresh after a restart
+        setText('refreshed-at', data.refreshed_at.substring(0, 19).replace('T', ' ') +
+                (data.restored ? ' (ذخیره‌شده)' : ''));
+    }
+    if ('sync' in data && !page.jobId) {
+        document.getElementById('loading').style.display = data.sync ? 'block' : 'none';
+    }
+}
+
+function fetchSnapshot() {
+    fetch('/status')
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                applySnapshot(data.data);
+            }
+        });
+}
+
+if (window.EventSource) {
+    // The first event carries the full snapshot, later ones only changes
+    var events = new EventSource('/events');
+    events.addEventListener('snapshot', function(event) { applySnapshot(JSON.parse(event.data)); });
+    events.addEventListener('delta', function(event) { applySnapshot(JSON.parse(event.data)); });
+} else {
+    // Fallback: poll the in-memory snapshot, still without reloading
+    fetchSnapshot();
+    setInterval(fetchSnapshot, 30000);
+}
+
+// Show the log tail, then follow the file from the byte offset read so far
+var logPanel = document.getElementById('recent-logs');
+var logLimit = parseInt(page.logLimit, 10);
+var logOffset = null;
+
+function renderLog(log) {
+    var entry = document.createElement('div');
+    entry.className = 'log-entry log-' + log.level.toLowerCase();
+    var time = document.createElement('strong');
+    time.textContent = log.timestamp;
+    entry.appendChild(time);
+    entry.appendChild(document.createTextNode(' ' + log.level));
+    entry.appendChild(document.createElement('br'));
+    entry.appendChild(document.createTextNode(log.message));
+    return entry;
+}
+
+function followLogs() {
+    var url = logOffset === null ? '/logs?lines=' + logLimit : '/logs?after=' + logOffset;
+    fetch(url)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                return;
+            }
+            if (logOffset === null || data.data.reset) {
+                logPanel.innerHTML = '';
+            }
+            data.data.records.forEach(function(log) {
+                logPanel.insertBefore(renderLog(log), logPanel.firstChild);
+            });
+            while (logPanel.children.length > logLimit) {
+                logPanel.removeChild(logPanel.lastChild);
+            }
+            logOffset = data.data.offset;
+        });
+}
+
+followLogs();
+setInterval(followLogs, 10000);
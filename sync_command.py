@@ -7,50 +7,78 @@ Command-line script for scheduled device data synchronization
 
 import argparse
 import logging
+import os
 import sys
-import time
 from datetime import datetime
 
-from services.device_service import DeviceService
+from services.sync_lock import LOCK_MODES, LOCK_SKIP
+from services.log_setup import setup_logging
 from config import Config
 
-# Configure logging
-logging.basicConfig(
-    level=getattr(logging, Config.LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(Config.LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+# The scheduler runs this script thousands of times a day: the device and
+# server stack is imported inside each command, so --help and argument
+# errors cost little more than the interpreter start
+
+# Configure logging (queued, rotated; see services/log_setup.py)
+setup_logging(process='sync_command')
 
 logger = logging.getLogger(__name__)
 
-def sync_device_data():
+def run_device_sync(lock_mode=None, trigger='cli', profile=False, full_resend=False):
     """
     Sync device data to server
     
+    Args:
+        lock_mode: 'wait', 'attach' or 'skip' if another process is syncing
+            the device (SYNC_LOCK_MODE if None)
+        trigger: Name shown to other processes while this sync runs
+        profile: Write cProfile, allocation and stack sample files for the sync
+        full_resend: Upload every day group, not only new or changed ones
+    
     Returns:
-        bool: True if successful, False otherwise
+        Dict: Sync result (success, message, data_summary, ...)
     """
+    from services.device_service import DeviceService
+    from services.sync_stats import summarize_stats
+    
     try:
         logger.info("Starting scheduled device data sync")
         
         device_service = DeviceService()
-        result = device_service.sync_device_data()
+        result = device_service.sync_device_data(lock_mode=lock_mode, trigger=trigger, profile=profile,
+                                                 full_resend=full_resend)
         
-        if result['success']:
+        if result.get('skipped'):
+            logger.info(f"Sync skipped: {result['message']}")
+        elif result['success']:
             logger.info(f"Sync completed successfully: {result['message']}")
             if 'data_summary' in result:
                 logger.info(f"Data summary: {result['data_summary']}")
-            return True
         else:
             logger.error(f"Sync failed: {result['message']}")
-            return False
+        if 'stats' in result:
+            logger.info(f"Timings: {summarize_stats(result['stats'])}")
+        if 'profile' in result:
+            logger.info(f"Profile files: {', '.join(result['profile'].values())}")
+        return result
             
     except Exception as e:
         logger.error(f"Error in sync_device_data: {e}")
-        return False
+        return {'success': False, 'message': str(e)}
+
+def sync_device_data(lock_mode=None, profile=False, full_resend=False):
+    """
+    Sync device data to server
+    
+    Args:
+        lock_mode: Behaviour if another process is syncing the device
+        profile: Profile the sync
+        full_resend: Upload every day group
+    
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    return run_device_sync(lock_mode=lock_mode, profile=profile, full_resend=full_resend)['success']
 
 def test_connections():
     """
@@ -59,6 +87,8 @@ def test_connections():
     Returns:
         bool: True if all connections successful, False otherwise
     """
+    from services.device_service import DeviceService
+    
     try:
         logger.info("Testing device and server connections")
         
@@ -91,6 +121,8 @@ def get_device_status():
     Returns:
         bool: True if successful, False otherwise
     """
+    from services.device_service import DeviceService
+    
     try:
         logger.info("Getting device status")
         
@@ -112,39 +144,144 @@ def get_device_status():
         logger.error(f"Error in get_device_status: {e}")
         return False
 
-def continuous_sync():
+def reconcile_uploads(start=None, end=None, dry_run=False, lock_mode=None):
     """
-    Run continuous sync with specified interval
+    Compare acknowledged uploads with the server's digests and resend the
+    days that differ
+    
+    Args:
+        start: First date to check (YYYY-MM-DD, default: oldest acknowledged)
+        end: Last date to check (YYYY-MM-DD, default: newest acknowledged)
+        dry_run: Only report the differing days
+        lock_mode: Behaviour if another process is syncing the device
+    
+    Returns:
+        bool: True if the server matches or the differing days were resent
     """
+    from services.device_service import DeviceService
+    from services.reconcile_service import ReconcileService
+    
     try:
+        logger.info("Reconciling uploads with the server")
+        
+        device_service = DeviceService()
+        result = ReconcileService(device_service).reconcile(start, end, dry_run=dry_run, lock_mode=lock_mode)
+        report = result['data']
+        logger.info(f"Checked {report['start']}..{report['end']}: {report['months_checked']} months, "
+                    f"{report['requests']} requests, {report['bytes']} bytes")
+        if report['days_differing']:
+            logger.info(f"Days differing: {', '.join(report['days_differing'])}")
+        server_only = report['months_server_only'] + report['days_server_only']
+        if server_only:
+            logger.warning(f"Only on the server, not resent: {', '.join(server_only)}")
+        if result['success']:
+            logger.info(result['message'])
+        else:
+            logger.error(result['message'])
+        return result['success']
+        
+    except Exception as e:
+        logger.error(f"Error in reconcile_uploads: {e}")
+        return False
+
+def continuous_sync(adaptive=False, lock_mode=LOCK_SKIP):
+    """
+    Run continuous sync at wall-clock-aligned times inside the sync window
+    
+    Args:
+        adaptive: Adjust the interval to the punch arrival rate
+        lock_mode: Behaviour if another process is syncing the device
+            (by default the scheduled run is skipped)
+    """
+    from services.scheduler import SyncScheduler, AdaptiveInterval
+    
+    try:
+        scheduler = SyncScheduler.from_config()
         sync_config = Config.get_sync_config()
-        interval = sync_config['interval']
+        adaptive_interval = AdaptiveInterval.from_config() if adaptive else None
+        if adaptive_interval:
+            scheduler.interval = adaptive_interval.max_interval
+            logger.info(f"Adaptive interval enabled: {adaptive_interval.min_interval}-"
+                        f"{adaptive_interval.max_interval} seconds, "
+                        f"target {adaptive_interval.target_punches} new punches per sync")
         
-        logger.info(f"Starting continuous sync with {interval} second interval")
+        logger.info(f"Starting continuous sync with {scheduler.interval} second interval "
+                    f"(window {sync_config['start_time']}-{sync_config['end_time']}, "
+                    f"outside window: {scheduler.outside_window})")
         
-        while True:
+        def scheduled_sync():
             logger.info("Running scheduled sync...")
             
-            if sync_device_data():
+            result = run_device_sync(lock_mode=lock_mode, trigger='continuous')
+            if result['success']:
                 logger.info("Sync completed successfully")
-            else:
+            elif not result.get('skipped'):
                 logger.error("Sync failed")
             
-            logger.info(f"Waiting {interval} seconds until next sync...")
-            time.sleep(interval)
+            if adaptive_interval and 'data_summary' in result:
+                adaptive_interval.record(Config.DEVICE_IP, result['data_summary']['attendance_count'])
+                interval = adaptive_interval.next_interval()
+                if interval != scheduler.interval:
+                    logger.info(f"Adaptive interval: {scheduler.interval} -> {interval} seconds "
+                                f"({adaptive_interval.rate(Config.DEVICE_IP) * 3600:.1f} punches/hour)")
+                    scheduler.interval = interval
+        
+        scheduler.run_forever(scheduled_sync)
             
     except KeyboardInterrupt:
         logger.info("Continuous sync interrupted by user")
     except Exception as e:
         logger.error(f"Error in continuous sync: {e}")
 
+def run_daemon(env_file=None, adaptive=False, lock_mode=LOCK_SKIP, watch_interval=5):
+    """
+    Run the long-lived sync daemon
+    
+    Unlike continuous, the device session and server connections stay open
+    between runs, SIGHUP or an edit of the env file reloads the settings and
+    SIGTERM/Ctrl-C lets the running sync finish before exiting.
+    
+    Args:
+        env_file: Env file to load and watch (.env if it exists)
+        adaptive: Adjust the interval to the punch arrival rate
+        lock_mode: Behaviour if another process is syncing the device
+        watch_interval: Seconds between env file checks
+        
+    Returns:
+        Process exit code
+    """
+    from services.sync_daemon import SyncDaemon
+    
+    if env_file is None and os.path.exists('.env'):
+        env_file = '.env'
+    daemon = SyncDaemon(env_file=env_file, adaptive=adaptive, lock_mode=lock_mode,
+                        watch_interval=watch_interval)
+    daemon.install_signal_handlers()
+    return daemon.run()
+
 def main():
     """Main function"""
     parser = argparse.ArgumentParser(description='ZKTeco Device Information Sync Tool')
-    parser.add_argument('command', choices=['sync', 'test', 'status', 'continuous'], 
+    parser.add_argument('command', choices=['sync', 'test', 'status', 'reconcile', 'continuous', 'daemon'], 
                        help='Command to execute')
     parser.add_argument('--verbose', '-v', action='store_true', 
                        help='Enable verbose logging')
+    parser.add_argument('--adaptive', action='store_true',
+                       help='continuous/daemon: adapt the interval to the punch arrival rate')
+    parser.add_argument('--lock-mode', choices=LOCK_MODES,
+                       help='What to do if another process is syncing the device '
+                            '(default: SYNC_LOCK_MODE, or skip for continuous/daemon)')
+    parser.add_argument('--env-file',
+                       help='daemon: env file to load and watch for changes (default: .env if present)')
+    parser.add_argument('--watch-interval', type=float, default=5,
+                       help='daemon: seconds between env file checks (default: 5)')
+    parser.add_argument('--profile', action='store_true',
+                       help='sync: write cProfile, allocation and stack sample files next to the log')
+    parser.add_argument('--full-resend', action='store_true',
+                       help='sync: upload every day group, not only those new or changed since the last upload')
+    parser.add_argument('--start', help='reconcile: first date to check (YYYY-MM-DD, default: oldest uploaded)')
+    parser.add_argument('--end', help='reconcile: last date to check (YYYY-MM-DD, default: newest uploaded)')
+    parser.add_argument('--dry-run', action='store_true', help='reconcile: only report the days that differ')
     
     args = parser.parse_args()
     
@@ -156,7 +293,7 @@ def main():
     
     try:
         if args.command == 'sync':
-            success = sync_device_data()
+            success = sync_device_data(lock_mode=args.lock_mode, profile=args.profile, full_resend=args.full_resend)
             sys.exit(0 if success else 1)
             
         elif args.command == 'test':
@@ -167,8 +304,18 @@ def main():
             success = get_device_status()
             sys.exit(0 if success else 1)
             
+        elif args.command == 'reconcile':
+            success = reconcile_uploads(start=args.start, end=args.end, dry_run=args.dry_run,
+                                        lock_mode=args.lock_mode)
+            sys.exit(0 if success else 1)
+            
         elif args.command == 'continuous':
-            continuous_sync()
+            continuous_sync(adaptive=args.adaptive, lock_mode=args.lock_mode or LOCK_SKIP)
+            
+        elif args.command == 'daemon':
+            sys.exit(run_daemon(env_file=args.env_file, adaptive=args.adaptive,
+                                lock_mode=args.lock_mode or LOCK_SKIP,
+                                watch_interval=args.watch_interval))
             
     except Exception as e:
         logger.error(f"Command execution failed: {e}")
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures: a ZK simulator and a mock import server running in-process,
+with Config pointed at them and every file the services write kept in a
+temporary directory
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# Config reads the environment at import time; keep the test run's log out
+# of the working tree
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.mkdtemp(prefix='zk-tests-'), 'device_sync.log'))
+
+import pytest
+
+from config import Config
+from tools.mock_import_server import MockImportServer
+from tools.zk_simulator import ZKSimulator, DeviceTables
+
+USERS = [
+    {'user_id': '1001', 'name': 'Ali', 'card': '12345', 'password': '9999', 'privilege': 0},
+    {'user_id': '1002', 'name': 'Sara', 'card': '0', 'password': '', 'privilege': 0},
+    {'user_id': '1003', 'name': 'Reza', 'card': '777', 'password': '1234', 'privilege': 14}
+]
+
+
+def punches(days, users=('1001', '1002', '1003'), month='2024-01'):
+    """Two punches per user per day of the given month"""
+    attendance = []
+    for day in range(1, days + 1):
+        for user_id in users:
+            for moment in ('08:00:00', '17:00:00'):
+                attendance.append({'user_id': user_id, 'timestamp': f'{month}-{day:02d} {moment}',
+                                   'status': 0, 'punch': 0})
+    return attendance
+
+
+@pytest.fixture
+def simulator():
+    device = ZKSimulator(DeviceTables(USERS, punches(5)), port=0, udp=False).start()
+    yield device
+    device.stop()
+
+
+@pytest.fixture
+def mock_server():
+    server = MockImportServer(port=0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def configured(simulator, mock_server, tmp_path, monkeypatch):
+    """Point the services at the simulator and the mock server"""
+    monkeypatch.setattr(Config, 'DEVICE_IP', simulator.host)
+    monkeypatch.setattr(Config, 'DEVICE_PORT', simulator.port)
+    monkeypatch.setattr(Config, 'DEVICE_SKIP_PING', True)
+    monkeypatch.setattr(Config, 'TARGET_SERVER_URL', mock_server.url)
+    monkeypatch.setattr(Config, 'API_TIMEOUT', 5)
+    monkeypatch.setattr(Config, 'API_RETRY_DELAY', 0)
+    monkeypatch.setattr(Config, 'SYNC_LOCK_FILE', str(tmp_path / 'locks.db'))
+    monkeypatch.setattr(Config, 'UPLOAD_LEDGER_FILE', str(tmp_path / 'upload_ledger.db'))
+    monkeypatch.setattr(Config, 'SNAPSHOT_FILE', str(tmp_path / 'device_snapshot.json'))
+    return tmp_path
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ETag / If-None-Match behaviour of /api/device/data and /api/device/formatted
+"""
+
+import pytest
+
+import api_server
+from controllers.device_controller import DeviceController
+from tools.zk_simulator import DeviceTables
+from conftest import USERS, punches
+
+
+@pytest.fixture
+def client(configured, monkeypatch):
+    controller = DeviceController()
+    loads = []
+    loader = controller.attendance_store.loader
+    controller.attendance_store.loader = lambda: loads.append(1) or loader()
+    monkeypatch.setattr(api_server, 'get_device_controller', lambda: controller)
+    monkeypatch.setattr(api_server, '_response_cache', {})
+    client = api_server.app.test_client()
+    client.loads = loads
+    yield client
+    controller.device_service.close()
+
+
+def test_etag_is_weak_and_matching_tag_gets_304(client):
+    first = client.get('/api/device/data')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/"data-')
+
+    second = client.get('/api/device/data', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.headers['ETag'] == etag
+    assert client.loads == [1]
+
+
+@pytest.fixture
+def expired(client, monkeypatch):
+    """Validate against the device on every request"""
+    monkeypatch.setattr(api_server.get_device_controller().attendance_store, 'max_age', 0)
+    return client
+
+
+@pytest.fixture
+def device_reads(client, monkeypatch):
+    """Names of the device reads made through the ApiService"""
+    api_service = api_server.get_device_controller().device_service.api_service
+    reads = []
+    for name in ('get_users_info', 'get_attendance_info', 'get_table_sizes'):
+        method = getattr(api_service, name)
+        monkeypatch.setattr(api_service, name, lambda *args, _name=name, _method=method, **kwargs:
+                            reads.append(_name) or _method(*args, **kwargs))
+    return reads
+
+
+def test_matching_tag_after_max_age_only_probes_sizes(expired, simulator, device_reads):
+    etag = expired.get('/api/device/data').headers['ETag']
+    del device_reads[:]
+    simulator.reset_stats()
+
+    response = expired.get('/api/device/data', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert device_reads == ['get_table_sizes']
+    # No user table or log transfer reached the device
+    assert set(simulator.stats()['commands']) == {'CMD_GET_FREE_SIZES'}
+    assert expired.loads == [1]
+
+
+def test_validation_is_throttled_to_max_age(client, simulator, device_reads):
+    etag = client.get('/api/device/data').headers['ETag']
+    del device_reads[:]
+    simulator.tables = DeviceTables(USERS, punches(6))
+
+    response = client.get('/api/device/data', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert device_reads == []
+
+
+def test_new_punch_changes_tag(expired, simulator):
+    client = expired
+    etag = client.get('/api/device/data').headers['ETag']
+    simulator.tables = DeviceTables(USERS, punches(6))
+
+    response = client.get('/api/device/data', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['data']['sync_info']['total_attendance'] == len(punches(6))
+    assert client.loads == [1, 1]
+
+
+def test_new_user_changes_tag(expired, simulator):
+    etag = expired.get('/api/device/data').headers['ETag']
+    added = USERS + [{'user_id': '1004', 'name': 'Mina', 'card': '0', 'password': '', 'privilege': 0}]
+    simulator.tables = DeviceTables(added, punches(5))
+
+    response = expired.get('/api/device/data', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.get_json()['data']['users']) == 4
+
+
+def test_rename_shows_after_refresh(client, simulator):
+    etag = client.get('/api/device/formatted').headers['ETag']
+    renamed = [dict(user, name='Ali Reza') if user['user_id'] == '1001' else user for user in USERS]
+    simulator.tables = DeviceTables(renamed, punches(5))
+
+    response = client.get('/api/device/formatted?refresh=1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    names = {record['name'] for record in response.get_json()['data']['attendance_records']}
+    assert 'Ali Reza' in names
+
+
+def test_refresh_forces_device_read(client):
+    etag = client.get('/api/device/data').headers['ETag']
+    response = client.get('/api/device/data?refresh=1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert client.loads == [1, 1]
+
+
+def test_unreachable_device_is_an_error(expired, simulator):
+    client = expired
+    client.get('/api/device/data')
+    simulator.stop()
+    api_server.get_device_controller().device_service.api_service.disconnect()
+
+    response = client.get('/api/device/data')
+    assert response.status_code == 500
+
+
+def test_device_data_leaves_out_user_secrets(client):
+    users = client.get('/api/device/data').get_json()['data']['users']
+    assert [user['user_id'] for user in users] == ['1001', '1002', '1003']
+    assert not any('password' in user or 'card' in user for user in users)
+    # The shared local copy keeps them for the device-facing code
+    device_data = api_server.get_device_controller().attendance_store.latest[1]
+    assert 'password' in device_data['users'][0]
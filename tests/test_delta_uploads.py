@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Delta uploads against the mock import server: partial-day payloads and what
+they do to an upserting and a period-replacing server
+"""
+
+import pytest
+
+from config import Config
+from services.device_service import DeviceService
+from tools.zk_simulator import DeviceTables
+from conftest import USERS, punches
+
+EXTRA_PUNCH = {'user_id': '1002', 'timestamp': '2024-01-03 12:00:00', 'status': 0, 'punch': 0}
+
+
+@pytest.fixture
+def service(configured):
+    device_service = DeviceService()
+    yield device_service
+    device_service.close()
+
+
+def edit_one_day(simulator):
+    """Give user 1002 one more punch on 2024-01-03"""
+    simulator.tables = DeviceTables(USERS, punches(5) + [EXTRA_PUNCH])
+
+
+def test_delta_is_off_by_default(service, simulator, mock_server):
+    assert service.sync_device_data()['success']
+    edit_one_day(simulator)
+    result = service.sync_device_data()
+    assert result['success']
+    assert result['data_summary']['records_sent'] == 15
+    assert result['data_summary']['period'] == {'start_date': '2024-01-01', 'end_date': '2024-01-05'}
+    assert [request['records'] for request in mock_server.requests_snapshot()] == [15, 15]
+
+
+def test_partial_day_payload_is_upserted(service, simulator, mock_server, monkeypatch):
+    monkeypatch.setattr(Config, 'UPLOAD_DELTA', True)
+    assert service.sync_device_data()['data_summary']['records_sent'] == 15
+    edit_one_day(simulator)
+    result = service.sync_device_data()
+    assert result['success']
+    assert result['data_summary']['records_sent'] == 1
+    assert result['data_summary']['period'] == {'start_date': '2024-01-03', 'end_date': '2024-01-03'}
+    assert result['data_summary']['attendance_count'] == 31
+    assert len(mock_server.records) == 15
+    assert mock_server.records[('2024-01-03', '1002')]['times'] == ['08:00:00', '12:00:00', '17:00:00']
+    assert ('2024-01-03', '1001') in mock_server.records
+
+    result = service.sync_device_data()
+    assert result['data_summary']['records_sent'] == 0
+    assert result['data_summary']['period'] is None
+    assert len(mock_server.requests_snapshot()) == 2
+
+
+def test_period_replacing_server_loses_records(service, simulator, mock_server, monkeypatch):
+    """Why UPLOAD_DELTA stays off until the server confirms it upserts"""
+    monkeypatch.setattr(Config, 'UPLOAD_DELTA', True)
+    mock_server.replace_period = True
+    service.sync_device_data()
+    edit_one_day(simulator)
+    assert service.sync_device_data()['data_summary']['records_sent'] == 1
+    assert sorted(key for key in mock_server.records if key[0] == '2024-01-03') == [('2024-01-03', '1002')]
+    assert len(mock_server.records) == 13
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming attendance exports (api_server /api/export/<filename>)
+"""
+
+import json
+
+import pytest
+
+import api_server
+from controllers.device_controller import DeviceController
+
+
+@pytest.fixture
+def client(configured, monkeypatch):
+    controller = DeviceController()
+    monkeypatch.setattr(api_server, 'get_device_controller', lambda: controller)
+    yield api_server.app.test_client()
+    controller.device_service.close()
+
+
+def test_export_ignores_limit_and_cursor(client):
+    page = client.get('/api/attendance?limit=2').get_json()
+    cursor = page['paging']['next_cursor']
+
+    response = client.get(f'/api/export/attendance.ndjson?limit=5000&cursor={cursor}')
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(rows) == 30
+    assert rows[0]['timestamp'] == '2024-01-01 08:00:00'
+
+
+def test_export_still_validates_filters(client):
+    response = client.get('/api/export/attendance.csv?start=2024-01-05&end=2024-01-01')
+    assert response.status_code == 400
+
+
+def test_attendance_query_still_limits_pages(client):
+    assert client.get('/api/attendance?limit=5000').status_code == 400
+
+
+def test_repeated_user_id_returns_each_punch_once(client):
+    page = client.get('/api/attendance?user_id=1001&user_id=1001,1002&user_id=1001').get_json()
+    assert page['paging']['count'] == 20
+    timestamps = [(row['user_id'], row['timestamp']) for row in page['data']]
+    assert len(timestamps) == len(set(timestamps)) == 20
+
+    response = client.get('/api/export/attendance.ndjson?user_id=1002&user_id=1002')
+    assert len(response.get_data(as_text=True).splitlines()) == 10
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Log search over gzip-compressed rotations (services/log_index.py): indexed
+before compression, keys persisted, blocks read by streaming
+"""
+
+import gzip
+import logging
+import os
+
+import pytest
+
+from services import log_index
+from services.log_index import LogIndex, LogQuery
+from services.log_setup import RotatingLogHandler
+
+
+def lines(count, day='2024-01-01', first=0):
+    return [f"{day} {(first + number) // 3600 % 24:02d}:{(first + number) // 60 % 60:02d}:{(first + number) % 60:02d},000"
+            f" - sync - {'ERROR' if number % 50 == 0 else 'INFO'} - record {first + number} device 10.0.0.{number % 3}\n"
+            for number in range(count)]
+
+
+@pytest.fixture
+def no_whole_reads(monkeypatch):
+    """Fail any read of a gzip rotation that asks for the rest of the file"""
+    read = gzip.GzipFile.read
+
+    def bounded(self, size=-1):
+        assert size is not None and size >= 0, 'gzip rotation read as a whole'
+        return read(self, size)
+
+    monkeypatch.setattr(gzip.GzipFile, 'read', bounded)
+
+
+def rotate_once(path, text):
+    handler = RotatingLogHandler(str(path), when='never', compress=True)
+    with open(path, 'w', encoding='utf-8') as log:
+        log.writelines(text)
+    handler.doRollover()
+    handler.close()
+
+
+def test_rotation_is_indexed_before_compression(tmp_path, monkeypatch, no_whole_reads):
+    path = tmp_path / 'device_sync.log'
+    text = lines(3000)
+    rotate_once(path, text)
+    assert (tmp_path / 'device_sync.log.1.gz').exists()
+
+    # A fresh process finds the key and the sidecar without decompressing anything
+    def refuse(*args, **kwargs):
+        raise AssertionError('gzip rotation opened while refreshing')
+
+    monkeypatch.setattr(log_index.gzip, 'open', refuse)
+    indexes = LogIndex(str(path), block_size=4096).refresh()
+    assert [os.path.basename(index['path']) for index in indexes] == ['device_sync.log.1.gz']
+    assert indexes[0]['size'] == len(''.join(text).encode())
+
+
+def test_search_streams_compressed_blocks(tmp_path, monkeypatch, no_whole_reads):
+    path = tmp_path / 'device_sync.log'
+    rotate_once(path, lines(3000))
+    with open(path, 'w', encoding='utf-8') as log:
+        log.writelines(lines(10, day='2024-01-02'))
+    monkeypatch.setattr(log_index, 'READ_WINDOW', 16 * 1024)
+
+    result = LogIndex(str(path), block_size=4096).search(LogQuery(level='ERROR', limit=1000))
+    numbers = [int(record['message'].split()[1]) for record in result['records']]
+    assert numbers == [0] + list(range(2950, -1, -50))
+    assert result['records'][0]['file'] == 'device_sync.log'
+    assert result['records'][1]['file'] == 'device_sync.log.1.gz'
+
+    newest = LogIndex(str(path), block_size=4096).search(LogQuery(start='2024-01-01', end='2024-01-01', limit=2))
+    assert [record['message'].split()[1] for record in newest['records']] == ['2999', '2998']
+    assert newest['truncated']
+
+
+def test_unindexed_rotation_is_indexed_by_streaming(tmp_path, monkeypatch, no_whole_reads):
+    path = tmp_path / 'device_sync.log'
+    text = ''.join(lines(3000)).encode()
+    with gzip.open(str(path) + '.1.gz', 'wb') as compressed:
+        compressed.write(text)
+    monkeypatch.setattr(log_index, 'READ_WINDOW', 10000)
+
+    index = LogIndex(str(path), block_size=4096)
+    indexes = index.refresh()
+    assert indexes[0]['size'] == len(text)
+    assert indexes[0]['complete']
+    offsets = [block[0] for block in indexes[0]['blocks']]
+    assert offsets[0] == 0 and offsets == sorted(offsets)
+    assert sum(block[1] for block in indexes[0]['blocks']) == len(text)
+
+    result = index.search(LogQuery(device='10.0.0.2', limit=5000))
+    assert len(result['records']) == 1000
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Several processes writing one log file (services/log_setup.py): one rotates,
+the others append, and a failed rollover never stops logging
+"""
+
+import gzip
+import logging
+import os
+
+from services import log_setup
+from services.log_setup import RotatingLogHandler
+
+
+def record(message):
+    return logging.LogRecord('test', logging.INFO, __file__, 0, message, None, None)
+
+
+def handler(path, rotate):
+    log_handler = RotatingLogHandler(str(path), max_bytes=200, when='never', backup_count=3, rotate=rotate)
+    log_handler.setFormatter(logging.Formatter('%(message)s'))
+    errors = []
+    log_handler.handleError = errors.append
+    return log_handler, errors
+
+
+def all_lines(path):
+    lines = []
+    for name in sorted(os.listdir(path.parent)):
+        full = path.parent / name
+        if full.is_dir():
+            continue
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(full, 'rt', encoding='utf-8') as log:
+            lines.extend(log.read().splitlines())
+    return lines
+
+
+def test_two_handlers_share_one_file(tmp_path):
+    path = tmp_path / 'device_sync.log'
+    owner, owner_errors = handler(path, rotate=True)
+    other, other_errors = handler(path, rotate=False)
+    messages = [f'record {number:03d} ' + 'x' * 20 for number in range(40)]
+    for number, message in enumerate(messages):
+        (owner if number % 2 else other).handle(record(message))
+    owner.close()
+    other.close()
+
+    assert owner_errors == [] and other_errors == []
+    assert (tmp_path / 'device_sync.log.1.gz').exists()
+    assert not (tmp_path / 'device_sync.log.1').exists()
+    # Only the rotations beyond backup_count are gone; nothing is duplicated
+    lines = all_lines(path)
+    assert len(lines) == len(set(lines))
+    assert lines and set(lines) <= set(messages)
+    assert messages[-1] in lines
+
+
+def test_failed_rollover_keeps_appending(tmp_path, monkeypatch):
+    path = tmp_path / 'device_sync.log'
+    owner, errors = handler(path, rotate=True)
+    rename = os.replace
+
+    def locked(source, dest):
+        # What Windows does while another process has the file open
+        if source == str(path):
+            raise PermissionError(32, 'The process cannot access the file', source)
+        return rename(source, dest)
+
+    monkeypatch.setattr(log_setup.os, 'replace', locked)
+    for number in range(20):
+        owner.handle(record(f'held {number:02d} ' + 'x' * 20))
+    assert errors == []
+    assert owner.rollover_errors == 1
+    with open(path, encoding='utf-8') as log:
+        assert len(log.read().splitlines()) == 20
+
+    monkeypatch.setattr(log_setup.os, 'replace', rename)
+    owner.retry_at = 0
+    owner.handle(record('released'))
+    owner.close()
+    assert errors == []
+    with gzip.open(str(path) + '.1.gz', 'rt', encoding='utf-8') as rotated:
+        assert len(rotated.read().splitlines()) == 20
+    with open(path, encoding='utf-8') as log:
+        assert log.read().splitlines() == ['released']
+
+
+def test_appending_handler_never_rotates(tmp_path):
+    path = tmp_path / 'device_sync.log'
+    other, errors = handler(path, rotate=False)
+    for number in range(30):
+        other.handle(record(f'plain {number:02d} ' + 'x' * 20))
+    other.close()
+    assert errors == []
+    assert os.listdir(tmp_path) == ['device_sync.log']
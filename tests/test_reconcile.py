@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Upload ledger and digest reconciliation against the mock import server
+(services/upload_ledger.py, services/reconcile_service.py)
+"""
+
+import pytest
+
+import api_server
+from config import Config
+from controllers.device_controller import DeviceController
+from services.device_service import DeviceService
+from services.reconcile_service import ReconcileService, resend_lock_mode
+from services.sync_job_service import SyncJob, JOB_RUNNING
+from services.upload_ledger import UploadLedger, digest_tree, record_digest
+from tools.zk_simulator import DeviceTables
+from conftest import USERS, punches
+
+
+def record(date, id_number, times):
+    return {'date': date, 'id_number': id_number, 'name': 'Ali', 'times': times, 'card': '0'}
+
+
+@pytest.fixture
+def delta(configured, simulator, monkeypatch):
+    """Two months of punches and delta uploads on"""
+    monkeypatch.setattr(Config, 'UPLOAD_DELTA', True)
+    simulator.tables = DeviceTables(USERS, punches(5) + punches(4, month='2024-02'))
+    return configured
+
+
+@pytest.fixture
+def service(delta):
+    device_service = DeviceService()
+    yield device_service
+    device_service.close()
+
+
+def test_record_digest_ignores_key_order():
+    first = record('2024-01-01', '1001', ['08:00:00'])
+    second = dict(reversed(list(first.items())))
+    assert record_digest(first) == record_digest(second)
+
+
+def test_digest_tree_is_order_independent():
+    entries = [('2024-01-01', '1001', 'a'), ('2024-01-01', '1002', 'b'), ('2024-02-03', '1001', 'c')]
+    tree = digest_tree(entries)
+    assert tree == digest_tree(reversed(entries))
+    assert sorted(tree['days']) == ['2024-01-01', '2024-02-03']
+    assert sorted(tree['months']) == ['2024-01', '2024-02']
+    assert digest_tree(entries[1:])['months']['2024-01'] != tree['months']['2024-01']
+    assert digest_tree(entries[1:])['months']['2024-02'] == tree['months']['2024-02']
+
+
+def test_ledger_pending_selects_new_and_changed(tmp_path):
+    ledger = UploadLedger(str(tmp_path / 'ledger.db'))
+    records = [record('2024-01-01', '1001', ['08:00:00']), record('2024-01-01', '1002', ['08:05:00'])]
+    selected, entries = ledger.pending('dev', records)
+    assert selected == records
+    ledger.acknowledge('dev', entries)
+
+    changed = [records[0], record('2024-01-01', '1002', ['08:05:00', '17:00:00']), record('2024-01-02', '1001', [])]
+    selected, entries = ledger.pending('dev', changed)
+    assert selected == changed[1:]
+    assert [entry[:2] for entry in entries] == [('2024-01-01', '1002'), ('2024-01-02', '1001')]
+    assert len(ledger.pending('dev', changed, full=True)[0]) == 3
+    assert ledger.pending('other-device', records[:1])[0] == records[:1]
+
+    assert ledger.forget('dev', ['2024-01-01']) == 2
+    assert ledger.entries('dev') == []
+
+
+def test_unchanged_server_costs_one_request(service, mock_server):
+    assert service.sync_device_data(trigger='test')['success']
+    report = ReconcileService(service).compare()
+    assert report['days_differing'] == [] and report['months_differing'] == []
+    assert report['requests'] == 1
+    assert (report['start'], report['end']) == ('2024-01-01', '2024-02-04')
+
+
+def test_reconcile_resends_only_differing_days(service, mock_server):
+    assert service.sync_device_data(trigger='test')['success']
+    tampered = mock_server.records[('2024-01-03', '1002')]
+    mock_server.records[('2024-01-03', '1002')] = dict(tampered, times=['09:00:00'])
+    del mock_server.records[('2024-01-04', '1001')]
+
+    reconcile = ReconcileService(service)
+    report = reconcile.compare()
+    assert report['months_differing'] == ['2024-01']
+    assert report['days_differing'] == ['2024-01-03', '2024-01-04']
+    assert report['requests'] == 2  # months, then the days of January only
+
+    received = len(mock_server.requests_snapshot())
+    result = reconcile.reconcile()
+    assert result['success']
+    resent = mock_server.requests_snapshot()[received:]
+    assert len(resent) == 1
+    assert resent[0]['records'] == 6  # three users on each of the two days
+    assert mock_server.records[('2024-01-03', '1002')] == tampered
+    assert reconcile.compare()['days_differing'] == []
+
+
+def test_resend_never_attaches():
+    assert resend_lock_mode('attach', Config) == 'wait'
+    assert resend_lock_mode('skip', Config) == 'skip'
+    assert resend_lock_mode(None, Config) == ('wait' if Config.SYNC_LOCK_MODE == 'attach' else Config.SYNC_LOCK_MODE)
+
+
+def test_dry_run_leaves_ledger_alone(service, mock_server):
+    assert service.sync_device_data(trigger='test')['success']
+    del mock_server.records[('2024-02-02', '1003')]
+    ledger = service.upload_ledger()
+    before = ledger.entries(Config.DEVICE_IP)
+
+    result = ReconcileService(service).reconcile(dry_run=True)
+    assert result['data']['days_differing'] == ['2024-02-02']
+    assert ledger.entries(Config.DEVICE_IP) == before
+
+
+def test_reconcile_can_be_turned_off(configured, monkeypatch):
+    monkeypatch.setattr(Config, 'UPLOAD_DELTA', False)
+    monkeypatch.setattr(Config, 'RECONCILE_ENABLED', False)
+    device_service = DeviceService()
+    try:
+        assert device_service.upload_ledger() is None
+        with pytest.raises(ValueError):
+            ReconcileService(device_service).compare()
+    finally:
+        device_service.close()
+
+
+def test_reconcile_without_delta_uploads(configured, mock_server):
+    """The default install: full uploads, still recorded in the ledger"""
+    assert not Config.UPLOAD_DELTA
+    device_service = DeviceService()
+    try:
+        assert device_service.sync_device_data(trigger='test')['data_summary']['records_sent'] == 15
+        del mock_server.records[('2024-01-02', '1001')]
+
+        reconcile = ReconcileService(device_service)
+        result = reconcile.reconcile()
+        assert result['data']['days_differing'] == ['2024-01-02']
+        assert result['success'] and result['sync']['data_summary']['records_sent'] == 15
+        assert ('2024-01-02', '1001') in mock_server.records
+        assert reconcile.compare()['days_differing'] == []
+    finally:
+        device_service.close()
+
+
+def test_server_only_days_are_reported_not_resent(service, mock_server):
+    assert service.sync_device_data(trigger='test')['success']
+    mock_server.records[('2024-01-10', '1001')] = record('2024-01-10', '1001', ['08:00:00'])
+    mock_server.records[('2024-02-20', '1002')] = record('2024-02-20', '1002', ['08:00:00'])
+    mock_server.records[('2024-03-01', '1003')] = record('2024-03-01', '1003', ['08:00:00'])
+
+    reconcile = ReconcileService(service)
+    received = len(mock_server.requests_snapshot())
+    result = reconcile.reconcile(end='2024-03-31')
+    report = result['data']
+    assert report['days_differing'] == []
+    assert report['days_server_only'] == ['2024-01-10', '2024-02-20']
+    assert report['months_server_only'] == ['2024-03']
+    assert result['success'] and 'sync' not in result
+    assert 'never acknowledged' in result['message']
+    # Only digest checks, no upload; the next run reports the same without resending
+    assert len(mock_server.requests_snapshot()) == received
+    assert reconcile.reconcile(end='2024-03-31')['data']['days_differing'] == []
+
+
+@pytest.fixture
+def client(delta, monkeypatch):
+    controller = DeviceController()
+    monkeypatch.setattr(api_server, 'get_device_controller', lambda: controller)
+    yield api_server.app.test_client(), controller
+    controller.device_service.close()
+
+
+def test_api_refuses_while_sync_job_runs(client, mock_server):
+    client, controller = client
+    assert controller.device_service.sync_device_data(trigger='test')['success']
+    del mock_server.records[('2024-01-02', '1001')]
+    running = SyncJob('running', 'api')
+    running.status = JOB_RUNNING
+    controller.sync_jobs.active_job = running
+    before = controller.device_service.upload_ledger().entries(Config.DEVICE_IP)
+
+    response = client.post('/api/device/reconcile')
+    assert response.status_code == 409
+    assert response.get_json()['data']['days_differing'] == ['2024-01-02']
+    assert controller.device_service.upload_ledger().entries(Config.DEVICE_IP) == before
+    assert running.attached_triggers == 0
+
+
+def test_api_starts_resend_job(client, mock_server):
+    client, controller = client
+    assert controller.device_service.sync_device_data(trigger='test')['success']
+    del mock_server.records[('2024-01-02', '1001')]
+
+    response = client.post('/api/device/reconcile')
+    assert response.status_code == 202
+    job = controller.sync_jobs.get_job(response.get_json()['job']['job_id'])
+    assert controller.sync_jobs.wait(job, 30) and job.result['success']
+    assert job.result['data_summary']['records_sent'] == 3
+    assert client.post('/api/device/reconcile?dry_run=1').get_json()['data']['days_differing'] == []
+
+
+def test_api_rejects_bad_dates(client):
+    client, _ = client
+    assert client.post('/api/device/reconcile?start=2024-13-01').status_code == 400
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cross-process per-device sync lease (services/sync_lock.py)
+"""
+
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from services.sync_lock import SyncLock, LOCK_WAIT, LOCK_ATTACH, LOCK_SKIP
+from conftest import ROOT_DIR
+
+DEVICE = '10.0.0.5'
+
+
+@pytest.fixture
+def lock_file(tmp_path):
+    return str(tmp_path / 'locks.db')
+
+
+def lock(path, ttl=60):
+    return SyncLock(path, ttl=ttl, poll_interval=0.02)
+
+
+def hold_in_thread(path, result, started, finish):
+    """Run a sync in a thread that holds the lease until finish is set"""
+    def work():
+        started.set()
+        finish.wait(10)
+        return result
+
+    thread = threading.Thread(target=lambda: lock(path).run(DEVICE, 'holder', work))
+    thread.start()
+    assert started.wait(5)
+    return thread
+
+
+def test_second_acquire_sees_holder(lock_file):
+    lease, _ = lock(lock_file).try_acquire(DEVICE, 'api')
+    assert lease
+
+    other, holder = lock(lock_file).try_acquire(DEVICE, 'cli')
+    assert other is None
+    assert holder['trigger'] == 'api'
+
+    lock(lock_file).release(lease)
+    assert lock(lock_file).holder(DEVICE) is None
+
+
+def test_leases_are_per_device(lock_file):
+    first, _ = lock(lock_file).try_acquire(DEVICE, 'api')
+    second, _ = lock(lock_file).try_acquire('10.0.0.6', 'api')
+    assert first and second
+
+
+def test_expired_lease_is_taken_over(lock_file):
+    stale, _ = lock(lock_file, ttl=0.05).try_acquire(DEVICE, 'crashed')
+    time.sleep(0.1)
+    lease, holder = lock(lock_file).try_acquire(DEVICE, 'cli')
+    assert lease and holder is None
+    assert not lock(lock_file).renew(stale)
+
+
+def test_skip_mode_returns_at_once(lock_file):
+    started, finish = threading.Event(), threading.Event()
+    thread = hold_in_thread(lock_file, {'success': True}, started, finish)
+    calls = []
+
+    result = lock(lock_file).run(DEVICE, 'cli', lambda: calls.append(1) or {'success': True}, mode=LOCK_SKIP)
+    finish.set()
+    thread.join()
+    assert result['skipped'] and not result['success']
+    assert result['lock_holder']['trigger'] == 'holder'
+    assert calls == []
+
+
+def test_attach_mode_returns_holder_result(lock_file):
+    started, finish = threading.Event(), threading.Event()
+    thread = hold_in_thread(lock_file, {'success': True, 'message': 'done by holder'}, started, finish)
+    calls = []
+    threading.Timer(0.1, finish.set).start()
+
+    result = lock(lock_file).run(DEVICE, 'web', lambda: calls.append(1) or {'success': True}, mode=LOCK_ATTACH)
+    thread.join()
+    assert result['attached'] and result['message'] == 'done by holder'
+    assert calls == []
+
+
+def test_wait_mode_runs_own_sync_after_holder(lock_file):
+    started, finish = threading.Event(), threading.Event()
+    thread = hold_in_thread(lock_file, {'success': True}, started, finish)
+    waits = []
+    threading.Timer(0.1, finish.set).start()
+
+    result = lock(lock_file).run(DEVICE, 'cli', lambda: {'success': True, 'message': 'own'}, mode=LOCK_WAIT,
+                                 on_wait=waits.append)
+    thread.join()
+    assert result['message'] == 'own' and 'attached' not in result
+    assert len(waits) == 1
+
+
+def test_wait_timeout_skips(lock_file):
+    started, finish = threading.Event(), threading.Event()
+    thread = hold_in_thread(lock_file, {'success': True}, started, finish)
+
+    result = lock(lock_file).run(DEVICE, 'cli', lambda: {'success': True}, mode=LOCK_WAIT, wait_timeout=0.1)
+    finish.set()
+    thread.join()
+    assert result['skipped']
+
+
+def test_lease_held_by_another_process(lock_file):
+    script = ('import sys, time; sys.path.insert(0, sys.argv[1]);'
+              'from services.sync_lock import SyncLock;'
+              'lease, _ = SyncLock(sys.argv[2]).try_acquire(sys.argv[3], "other-process");'
+              'print("held", flush=True); time.sleep(30)')
+    holder = subprocess.Popen([sys.executable, '-c', script, ROOT_DIR, lock_file, DEVICE],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == 'held'
+        result = lock(lock_file).run(DEVICE, 'cli', lambda: {'success': True}, mode=LOCK_SKIP)
+        assert result['skipped']
+        assert result['lock_holder']['pid'] == holder.pid
+    finally:
+        holder.kill()
+        holder.wait()
+
+
+def test_failing_work_runs_once_and_releases(lock_file):
+    calls = []
+
+    def work():
+        calls.append(1)
+        raise RuntimeError('upload exploded')
+
+    with pytest.raises(RuntimeError):
+        lock(lock_file).run(DEVICE, 'cli', work)
+    assert calls == [1]
+    assert lock(lock_file).holder(DEVICE) is None
+
+
+def test_broken_database_runs_work_once_without_lease(tmp_path):
+    calls = []
+    result = lock(str(tmp_path)).run(DEVICE, 'cli', lambda: calls.append(1) or {'success': True})
+    assert result == {'success': True}
+    assert calls == [1]
+
+
+def test_unknown_mode(lock_file):
+    with pytest.raises(ValueError):
+        lock(lock_file).run(DEVICE, 'cli', lambda: {'success': True}, mode='queue')
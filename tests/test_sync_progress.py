@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sync job progress and ETA (services/sync_job_service.py)
+"""
+
+import time
+
+import api_server
+from config import Config
+from controllers.device_controller import DeviceController
+from services.device_service import DeviceService
+from services.sync_job_service import SyncJob, JOB_RUNNING
+from tools.zk_simulator import DeviceTables
+
+
+def test_upload_eta_follows_bytes_sent():
+    job = SyncJob('job', 'test')
+    job.status = JOB_RUNNING
+    job.started_monotonic = time.monotonic() - 30
+    job.update('uploading', records_total=1000, records_processed=0, bytes_total=4000, bytes_uploaded=0)
+    job.stage_started_monotonic = time.monotonic() - 10
+    job.expected_duration = 35
+    assert job.eta_seconds() == 5.0  # no bytes sent yet: previous job's duration
+
+    job.update(bytes_uploaded=1000, records_processed=250)
+    assert 29 <= job.eta_seconds() <= 31
+    job.update(bytes_uploaded=4000, records_processed=1000)
+    assert job.eta_seconds() == 0.0
+
+
+def test_read_eta_without_history():
+    job = SyncJob('job', 'test')
+    job.status = JOB_RUNNING
+    job.started_monotonic = time.monotonic() - 5
+    job.update('reading_attendance', records_total=1000, records_processed=0)
+    assert job.eta_seconds() is None
+    job.stage_started_monotonic = time.monotonic() - 4
+    job.update(records_processed=800)
+    assert 0.9 <= job.eta_seconds() <= 1.1
+
+
+def test_sync_reports_progress_while_reading_and_uploading(configured, simulator, mock_server):
+    # About 2,000 records: more than one 64 KB chunk of attendance log
+    simulator.tables = DeviceTables.synthetic(users=40, days=15)
+    updates = []
+
+    def record(stage=None, **fields):
+        updates.append((stage, fields))
+
+    service = DeviceService()
+    try:
+        result = service.sync_device_data(progress_callback=record, trigger='test')
+    finally:
+        service.close()
+    assert result['success']
+
+    def first(stage):
+        return next(index for index, (name, _) in enumerate(updates) if name == stage)
+
+    reading = updates[first('reading_attendance'):first('formatting')]
+    read_counts = [fields['records_processed'] for _, fields in reading if 'records_processed' in fields]
+    assert len(read_counts) >= 2
+    assert 0 < read_counts[0] < simulator.tables.records_count
+    assert read_counts[-1] == simulator.tables.records_count
+
+    uploading = updates[first('uploading'):]
+    sent = [fields['bytes_uploaded'] for _, fields in uploading if 'bytes_uploaded' in fields]
+    total = next(fields['bytes_total'] for _, fields in uploading if 'bytes_total' in fields)
+    assert sent[0] == 0
+    assert any(0 < value < total for value in sent)
+    assert sent == sorted(sent) and sent[-1] == total
+    assert mock_server.summary()['statuses'] == {'200': 1}
+
+
+def test_sync_wait_is_bounded(configured, mock_server, monkeypatch):
+    controller = DeviceController()
+    monkeypatch.setattr(api_server, 'get_device_controller', lambda: controller)
+    monkeypatch.setattr(Config, 'SYNC_WAIT_TIMEOUT', 0.5)
+    mock_server.faults.update({'latency': 2})
+    try:
+        client = api_server.app.test_client()
+        started = time.monotonic()
+        response = client.post('/api/device/sync?wait=1')
+        assert response.status_code == 202
+        assert time.monotonic() - started < 2
+        job_id = response.get_json()['data']['job_id']
+        assert response.get_json()['running']
+
+        job = controller.sync_jobs.get_job(job_id)
+        assert controller.sync_jobs.wait(job, 30) and job.result['success']
+        assert client.get(f'/api/jobs/{job_id}').get_json()['data']['status'] == 'succeeded'
+    finally:
+        controller.device_service.close()
@@ -0,0 +1,3 @@
+"""
+Development tools for ZKTeco Device Information System
+"""
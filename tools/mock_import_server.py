@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mock Device-Import Server for ZKTeco Device Information System
+Stands in for TARGET_SERVER_URL: validates uploads against the
+period/attendance_records contract, records them and injects latency,
+errors, throttling and timeouts on demand. GET <path>/digests reports
+per-day or per-month digests of the stored records for reconciliation.
+
+    python -m tools.mock_import_server --port 8099 --error-rate 0.1 --throttle 2
+    TARGET_SERVER_URL=http://127.0.0.1:8099/api/attendance/device-import python sync_command.py sync
+"""
+
+import argparse
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+from services.upload_ledger import digest_tree, record_digest
+
+logger = logging.getLogger(__name__)
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+TIME_PATTERN = re.compile(r'^\d{2}:\d{2}:\d{2}$')
+MAX_ERRORS = 20  # validation errors reported per request
+
+
+def validate_payload(payload: Any) -> List[str]:
+    """
+    Check an upload against the device-import contract
+
+    Args:
+        payload: Decoded JSON body
+
+    Returns:
+        List of problems (empty if valid)
+    """
+    errors = []
+    if not isinstance(payload, dict):
+        return ['body must be a JSON object']
+
+    period = payload.get('period')
+    if not isinstance(period, dict):
+        errors.append('period must be an object')
+    else:
+        for key in ('start_date', 'end_date'):
+            if not DATE_PATTERN.match(str(period.get(key, ''))):
+                errors.append(f'period.{key} must be YYYY-MM-DD')
+        if not errors and period['start_date'] > period['end_date']:
+            errors.append('period.start_date is after period.end_date')
+
+    records = payload.get('attendance_records')
+    if not isinstance(records, list):
+        errors.append('attendance_records must be a list')
+        return errors
+
+    for index, record in enumerate(records):
+        if len(errors) >= MAX_ERRORS:
+            break
+        where = f'attendance_records[{index}]'
+        if not isinstance(record, dict):
+            errors.append(f'{where} must be an object')
+            continue
+        for key in ('date', 'id_number', 'name', 'times', 'card'):
+            if key not in record:
+                errors.append(f'{where}.{key} is missing')
+        if not DATE_PATTERN.match(str(record.get('date', ''))):
+            errors.append(f'{where}.date must be YYYY-MM-DD')
+        elif isinstance(period, dict) and not period.get('start_date', '') <= record['date'] <= period.get('end_date', ''):
+            errors.append(f'{where}.date is outside the period')
+        times = record.get('times')
+        if not isinstance(times, list) or not all(TIME_PATTERN.match(str(value)) for value in times):
+            errors.append(f'{where}.times must be a list of HH:MM:SS')
+        elif times != sorted(times):
+            errors.append(f'{where}.times must be sorted')
+        daily = record.get('daily')
+        if daily is not None and not (isinstance(daily, dict) and isinstance(daily.get('attendance_details'), list)):
+            errors.append(f'{where}.daily.attendance_details must be a list')
+    return errors
+
+
+class ImportFaults:
+    """Failure injection settings, changeable while the server runs"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, throttle: float = 0.0, timeout_rate: float = 0.0,
+                 hang_seconds: float = 60.0, script: Optional[List[int]] = None, seed: Optional[int] = None):
+        """
+        Initialize import faults
+
+        Args:
+            latency: Seconds added to every import response
+            jitter: Extra random delay of up to this many seconds
+            error_rate: Share of imports answered with error_status
+            error_status: Status code of injected errors (5xx)
+            throttle: Accepted imports per second; faster requests get 429 (0: off)
+            timeout_rate: Share of imports that hang for hang_seconds (client timeout)
+            hang_seconds: How long a hanging import waits before answering
+            script: Status codes for the next imports, in order, before the
+                random faults apply (200 means process normally)
+            seed: Random seed for reproducible fault sequences
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.throttle = throttle
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.script = deque(script or [])
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._last_accepted = None
+
+    def update(self, settings: Dict[str, Any]):
+        """Change settings from a dict (keys as in __init__)"""
+        with self._lock:
+            for key, value in settings.items():
+                if key == 'script':
+                    self.script = deque(int(status) for status in value)
+                elif key in ('latency', 'jitter', 'error_rate', 'throttle', 'timeout_rate', 'hang_seconds'):
+                    setattr(self, key, float(value))
+                elif key == 'error_status':
+                    self.error_status = int(value)
+                else:
+                    raise ValueError(f"Unknown fault setting: {key}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'latency': self.latency,
+                'jitter': self.jitter,
+                'error_rate': self.error_rate,
+                'error_status': self.error_status,
+                'throttle': self.throttle,
+                'timeout_rate': self.timeout_rate,
+                'hang_seconds': self.hang_seconds,
+                'script': list(self.script)
+            }
+
+    def decide(self) -> Dict[str, Any]:
+        """
+        Decide what happens to the next import
+
+        Returns:
+            Dict with delay (seconds) and status (None to process normally)
+        """
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            if self.script:
+                status = self.script.popleft()
+                return {'delay': delay, 'status': None if status == 200 else status}
+            roll = self._random.random()
+            if roll < self.timeout_rate:
+                return {'delay': self.hang_seconds, 'status': None}
+            if roll < self.timeout_rate + self.error_rate:
+                return {'delay': delay, 'status': self.error_status}
+            now = time.monotonic()
+            if self.throttle and self._last_accepted is not None and now - self._last_accepted < 1 / self.throttle:
+                return {'delay': delay, 'status': 429}
+            self._last_accepted = now
+            return {'delay': delay, 'status': None}
+
+
+class MockImportServer:
+    """Flask mock of the device-import API"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8099, token: Optional[str] = None,
+                 faults: Optional[ImportFaults] = None, path: str = '/api/attendance/device-import',
+                 keep_payloads: bool = False, replace_period: bool = False):
+        """
+        Initialize mock server
+
+        Args:
+            host: Address to listen on
+            port: Port (0 picks a free one)
+            token: Bearer token imports must carry (any if None)
+            faults: Failure injection settings (none if None)
+            path: Import path; GET on the path with '/import' replaced by
+                '/health' answers the health check, as DeviceService expects,
+                and GET path/digests the reconciliation check
+            keep_payloads: Keep full request bodies, not only summaries
+            replace_period: Drop every stored record in an upload's period
+                before storing its records, instead of upserting by date
+                and id_number; a server doing this loses data under delta
+                uploads
+        """
+        self.host = host
+        self.port = port
+        self.token = token
+        self.faults = faults or ImportFaults()
+        self.path = path
+        self.keep_payloads = keep_payloads
+        self.replace_period = replace_period
+        self.requests = []
+        self.records = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.app = self._create_app()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}{self.path}"
+
+    def _create_app(self) -> Flask:
+        app = Flask(__name__)
+        mock = self
+
+        # Same derivation as DeviceService.test_server_connection(); for
+        # .../device-import that is the import path itself
+        health_path = self.path.replace('/import', '/health')
+
+        @app.route(self.path, methods=['POST'])
+        def device_import():
+            return mock._handle_import()
+
+        @app.route(health_path, methods=['GET'])
+        def health():
+            return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()})
+
+        @app.route(self.path + '/digests', methods=['GET'])
+        def digests():
+            granularity = request.args.get('granularity', 'month')
+            if granularity not in ('day', 'month'):
+                return jsonify({'success': False, 'message': 'granularity must be day or month'}), 400
+            tree = mock.digests(request.args.get('start'), request.args.get('end'))
+            return jsonify({'success': True, 'granularity': granularity,
+                            'digests': tree['days' if granularity == 'day' else 'months']})
+
+        @app.route('/_mock/requests', methods=['GET', 'DELETE'])
+        def requests_log():
+            if request.method == 'DELETE':
+                mock.reset()
+                return jsonify({'success': True})
+            return jsonify({'success': True, 'data': mock.summary(), 'requests': mock.requests_snapshot()})
+
+        @app.route('/_mock/faults', methods=['GET', 'POST'])
+        def faults():
+            if request.method == 'POST':
+                try:
+                    mock.faults.update(request.get_json(force=True) or {})
+                except (ValueError, TypeError) as e:
+                    return jsonify({'success': False, 'message': str(e)}), 400
+            return jsonify({'success': True, 'data': mock.faults.to_dict()})
+
+        return app
+
+    def _handle_import(self):
+        received = time.perf_counter()
+        body = request.get_data()
+        decision = self.faults.decide()
+        if decision['delay']:
+            time.sleep(decision['delay'])
+
+        entry = {
+            'received_at': datetime.now().isoformat(),
+            'bytes': len(body),
+            'records': 0,
+            'status': None,
+            'errors': []
+        }
+        if self.token and request.headers.get('Authorization') != f'Bearer {self.token}':
+            entry['status'] = 401
+            entry['errors'] = ['invalid bearer token']
+        elif decision['status']:
+            entry['status'] = decision['status']
+            entry['errors'] = ['injected']
+        else:
+            payload = request.get_json(force=True, silent=True)
+            errors = validate_payload(payload) if payload is not None else ['body is not valid JSON']
+            entry['status'] = 422 if errors else 200
+            entry['errors'] = errors
+            if not errors:
+                entry['records'] = len(payload['attendance_records'])
+                with self._lock:
+                    if self.replace_period:
+                        period = payload['period']
+                        self.records = {
+                            key: stored for key, stored in self.records.items()
+                            if not period['start_date'] <= key[0] <= period['end_date']
+                        }
+                    for record in payload['attendance_records']:
+                        self.records[(record['date'], record['id_number'])] = record
+            if self.keep_payloads:
+                entry['payload'] = payload
+
+        entry['seconds'] = round(time.perf_counter() - received, 6)
+        with self._lock:
+            self.requests.append(entry)
+
+        if entry['status'] == 200:
+            return jsonify({'success': True, 'message': 'Imported', 'records': entry['records']})
+        response = jsonify({'success': False, 'message': 'Import rejected', 'errors': entry['errors']})
+        response.status_code = entry['status']
+        if entry['status'] == 429:
+            response.headers['Retry-After'] = '1'
+        return response
+
+    def digests(self, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Dict[str, str]]:
+        """Day and month digests of the stored records between start and end (inclusive)"""
+        with self._lock:
+            records = list(self.records.items())
+        return digest_tree(
+            (date, str(id_number), record_digest(record))
+            for (date, id_number), record in records
+            if (not start or date >= start) and (not end or date <= end)
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        """Counts of received imports by status, bytes and stored records"""
+        with self._lock:
+            statuses = {}
+            for entry in self.requests:
+                statuses[str(entry['status'])] = statuses.get(str(entry['status']), 0) + 1
+            return {
+                'requests': len(self.requests),
+                'statuses': statuses,
+                'bytes': sum(entry['bytes'] for entry in self.requests),
+                'records_accepted': sum(entry['records'] for entry in self.requests),
+                'records_stored': len(self.records)
+            }
+
+    def requests_snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(entry) for entry in self.requests]
+
+    def reset(self):
+        """Forget received requests and stored records"""
+        with self._lock:
+            self.requests = []
+            self.records = {}
+
+    def start(self) -> 'MockImportServer':
+        """Serve in a background thread"""
+        self._server = make_server(self.host, self.port, self.app, threaded=True)
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-import-server', daemon=True)
+        self._thread.start()
+        logger.info(f"Mock import server listening on {self.url}")
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        if self._server:
+            self._server.shutdown()
+            self._thread.join(timeout=5)
+            self._server = None
+
+
+def _status_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Mock device-import server')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8099, help='Port (default: 8099)')
+    parser.add_argument('--token', help='Required bearer token (default: accept any)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every import')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra delay up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of imports that fail (0-1)')
+    parser.add_argument('--error-status', type=int, default=503, help='Status of failed imports (default: 503)')
+    parser.add_argument('--throttle', type=float, default=0.0, help='Imports per second before 429 (default: off)')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='Share of imports that hang (0-1)')
+    parser.add_argument('--hang-seconds', type=float, default=60.0, help='How long hanging imports wait')
+    parser.add_argument('--script', type=_status_list, help='Statuses for the first imports, e.g. 500,500,429,200')
+    parser.add_argument('--seed', type=int, help='Random seed for faults')
+    parser.add_argument('--replace-period', action='store_true',
+                        help="Replace all stored records of an upload's period instead of upserting")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    faults = ImportFaults(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          error_status=args.error_status, throttle=args.throttle,
+                          timeout_rate=args.timeout_rate, hang_seconds=args.hang_seconds,
+                          script=args.script, seed=args.seed)
+    server = MockImportServer(host=args.host, port=args.port, token=args.token, faults=faults,
+                              replace_period=args.replace_period).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        logger.info(f"Mock import server stopped: {server.summary()}")
+
+
+if __name__ == '__main__':
+    main()
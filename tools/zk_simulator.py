@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ZK Protocol Device Simulator for ZKTeco Device Information System
+Serves a user table and attendance log over the ZK TCP/UDP protocol so
+ApiService, DeviceService and sync_command.py run end to end without a
+terminal, with injectable latency, packet loss, disconnects and slow
+chunked transfers
+
+    python -m tools.zk_simulator --port 4370 --users 500 --days 90
+    DEVICE_IP=127.0.0.1 DEVICE_PORT=4370 python sync_command.py sync
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from zk import const
+from zk.base import make_commkey
+
+logger = logging.getLogger(__name__)
+
+USHRT_MAX = 65535
+TCP_TOP = struct.pack('<HH', const.MACHINE_PREPARE_DATA_1, const.MACHINE_PREPARE_DATA_2)
+CMD_PREPARE_BUFFER = 1503  # read_with_buffer(): prepare a table for chunked reads
+CMD_READ_BUFFER = 1504     # read one chunk of the prepared table
+UDP_DATA_SIZE = 1024       # payload bytes per CMD_DATA datagram
+
+# Packet formats: 'zk8' (72-byte users, 40-byte attendance) or 'zk6' (28 and 16 bytes)
+PACKET_FORMATS = ('zk8', 'zk6')
+
+COMMAND_NAMES = {value: name for name, value in vars(const).items() if name.startswith('CMD_')}
+COMMAND_NAMES.update({CMD_PREPARE_BUFFER: 'CMD_PREPARE_BUFFER', CMD_READ_BUFFER: 'CMD_READ_BUFFER'})
+
+
+def encode_time(moment: datetime) -> int:
+    """Encode a timestamp the way the terminal stores it (zkemsdk EncodeTime)"""
+    return (
+        ((moment.year % 100) * 12 * 31 + ((moment.month - 1) * 31) + moment.day - 1) *
+        (24 * 60 * 60) + (moment.hour * 60 + moment.minute) * 60 + moment.second
+    )
+
+
+def checksum(packet: bytes) -> int:
+    """Packet checksum (zkemsdk), over header and payload"""
+    if len(packet) % 2:
+        packet += b'\x00'
+    total = 0
+    for (word,) in struct.iter_unpack('<H', packet):
+        total += word
+        if total > USHRT_MAX:
+            total -= USHRT_MAX
+    total = ~total
+    while total < 0:
+        total += USHRT_MAX
+    return total
+
+
+def make_packet(command: int, session_id: int, reply_id: int, payload: bytes = b'') -> bytes:
+    """Build a response packet (without the TCP top)"""
+    header = struct.pack('<4H', command, 0, session_id, reply_id)
+    return struct.pack('<4H', command, checksum(header + payload), session_id, reply_id) + payload
+
+
+class DeviceTables:
+    """User table and attendance log, pre-encoded in the terminal's record format"""
+
+    def __init__(self, users: List[Dict[str, Any]], attendance: List[Dict[str, Any]],
+                 packet_format: str = 'zk8'):
+        """
+        Initialize device tables
+
+        Args:
+            users: Dicts with user_id, name and optionally card, privilege,
+                password, group_id (DeviceService.get_device_data() format)
+            attendance: Dicts with user_id, timestamp (YYYY-MM-DD HH:MM:SS),
+                status and punch
+            packet_format: 'zk8' or 'zk6'
+
+        Raises:
+            ValueError: If the format is unknown
+        """
+        if packet_format not in PACKET_FORMATS:
+            raise ValueError(f"packet_format must be one of {PACKET_FORMATS}")
+        self.packet_format = packet_format
+        self.users_count = len(users)
+        self.records_count = len(attendance)
+        uids = {}
+        user_blobs = []
+        for index, user in enumerate(users):
+            uid = int(user.get('uid', index + 1))
+            uids[str(user['user_id'])] = uid
+            user_blobs.append(self._pack_user(uid, user))
+        self.users_data = _with_size(b''.join(user_blobs))
+        self.attendance_data = _with_size(b''.join(
+            self._pack_attendance(uids.get(str(record['user_id']), 0), record) for record in attendance
+        ))
+
+    @classmethod
+    def from_file(cls, path: str, packet_format: str = 'zk8') -> 'DeviceTables':
+        """Load tables from a JSON file with 'users' and 'attendance' lists"""
+        with open(path, 'r', encoding='utf-8') as source:
+            data = json.load(source)
+        return cls(data.get('users', []), data.get('attendance', []), packet_format)
+
+    @classmethod
+    def synthetic(cls, users: int, days: int, packet_format: str = 'zk8', seed: int = 0) -> 'DeviceTables':
+        """Generate tables with the benchmark fleet generator"""
+        from benchmarks.fleet import generate_fleet
+        fleet = generate_fleet(users, days, seed=seed)
+        return cls(fleet['users'], fleet['attendance'], packet_format)
+
+    def _pack_user(self, uid: int, user: Dict[str, Any]) -> bytes:
+        password = str(user.get('password') or '').encode('utf-8')
+        name = str(user.get('name') or '').encode('utf-8')
+        privilege = int(user.get('privilege') or 0)
+        card = int(user.get('card') or 0)
+        if self.packet_format == 'zk6':
+            return struct.pack('<HB5s8sIxBhI', uid, privilege, password, name, card,
+                               int(user.get('group_id') or 0), 0, int(user['user_id']))
+        return struct.pack('<HB8s24sIx7sx24s', uid, privilege, password, name, card,
+                           str(user.get('group_id') or '').encode('utf-8'), str(user['user_id']).encode('utf-8'))
+
+    def _pack_attendance(self, uid: int, record: Dict[str, Any]) -> bytes:
+        timestamp = struct.pack('<I', encode_time(datetime.strptime(str(record['timestamp'])[:19], '%Y-%m-%d %H:%M:%S')))
+        status = int(record.get('status') or 0)
+        punch = int(record.get('punch') or 0)
+        if self.packet_format == 'zk6':
+            return struct.pack('<I4sBB2sI', int(record['user_id']), timestamp, status, punch, b'', 0)
+        return struct.pack('<H24sB4sB8s', uid, str(record['user_id']).encode('utf-8'), status, timestamp, punch, b'')
+
+
+class FaultInjector:
+    """Decides per response whether to delay, drop or disconnect"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, drop_rate: float = 0.0,
+                 disconnect_rate: float = 0.0, chunk_size: int = 0, chunk_delay: float = 0.0,
+                 seed: Optional[int] = None):
+        """
+        Initialize fault injector
+
+        Args:
+            latency: Seconds added before every response
+            jitter: Extra random delay of up to this many seconds
+            drop_rate: Share of responses never sent (the client times out)
+            disconnect_rate: Share of commands answered by closing the connection
+            chunk_size: Send table data in pieces of this many bytes (0: at once)
+            chunk_delay: Seconds between those pieces
+            seed: Random seed for reproducible fault sequences
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.disconnect_rate = disconnect_rate
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """Sleep for the configured latency"""
+        with self._lock:
+            extra = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+
+    def fault(self) -> Optional[str]:
+        """Pick the fault for the next response: 'drop', 'disconnect' or None"""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.drop_rate:
+            return 'drop'
+        if roll < self.drop_rate + self.disconnect_rate:
+            return 'disconnect'
+        return None
+
+
+class _Session:
+    """Protocol state of one client (TCP connection or UDP peer)"""
+
+    def __init__(self, session_id: int, authenticated: bool):
+        self.session_id = session_id
+        self.authenticated = authenticated
+        self.buffer = b''
+        self.lock = threading.Lock()
+
+
+class ZKSimulator:
+    """ZK protocol server backed by DeviceTables"""
+
+    def __init__(self, tables: DeviceTables, host: str = '127.0.0.1', port: int = 4370,
+                 faults: Optional[FaultInjector] = None, password: int = 0, tcp: bool = True, udp: bool = True,
+                 device_name: str = 'ZK Simulator', serial_number: str = 'SIM0000001',
+                 firmware_version: str = 'Ver 6.60 Simulator'):
+        """
+        Initialize simulator
+
+        Args:
+            tables: Data served by the device
+            host: Address to listen on
+            port: TCP and UDP port (0 picks a free one)
+            faults: Fault injection settings (none if None)
+            password: Communication key clients must authenticate with (0: none)
+            tcp: Listen on TCP (pyzk's default transport)
+            udp: Listen on UDP (pyzk with force_udp)
+            device_name: Value of ~DeviceName
+            serial_number: Value of ~SerialNumber
+            firmware_version: Firmware version string
+        """
+        self.tables = tables
+        self.host = host
+        self.port = port
+        self.faults = faults or FaultInjector()
+        self.password = password
+        self.options = {
+            b'~DeviceName': device_name.encode('utf-8'),
+            b'~SerialNumber': serial_number.encode('utf-8'),
+            b'~Platform': b'ZK_SIM',
+            b'MAC': b'00:17:61:00:00:01',
+            b'~ZKFPVersion': b'10',
+            b'ZKFaceVersion': b'0',
+            b'~ExtendFmt': b'0' if tables.packet_format == 'zk6' else b'1',
+            b'~UserExtFmt': b'0' if tables.packet_format == 'zk6' else b'1',
+        }
+        self.firmware_version = firmware_version.encode('utf-8')
+        self.enable_tcp = tcp
+        self.enable_udp = udp
+        self._tcp_server = None
+        self._udp_server = None
+        self._threads = []
+        self._udp_sessions = {}
+        self._stats_lock = threading.Lock()
+        self.commands = Counter()
+        self.connections = 0
+        self.bytes_sent = 0
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.host, self.port
+
+    def start(self) -> 'ZKSimulator':
+        """Start listening in background threads"""
+        simulator = self
+        if self.enable_tcp:
+            class TCPHandler(socketserver.BaseRequestHandler):
+                def handle(self):
+                    simulator._serve_tcp(self.request)
+
+            self._tcp_server = _ThreadingTCPServer((self.host, self.port), TCPHandler)
+            self.port = self._tcp_server.server_address[1]
+        if self.enable_udp:
+            class UDPHandler(socketserver.BaseRequestHandler):
+                def handle(self):
+                    data, sock = self.request
+                    simulator._serve_udp(data, sock, self.client_address)
+
+            self._udp_server = _ThreadingUDPServer((self.host, self.port), UDPHandler)
+            self.port = self._udp_server.server_address[1]
+
+        for server in (self._tcp_server, self._udp_server):
+            if server:
+                thread = threading.Thread(target=server.serve_forever, name='zk-simulator', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"ZK simulator listening on {self.host}:{self.port} "
+                    f"({'tcp ' if self.enable_tcp else ''}{'udp ' if self.enable_udp else ''}"
+                    f"{self.tables.packet_format}, {self.tables.users_count} users, "
+                    f"{self.tables.records_count} records)")
+        return self
+
+    def stop(self):
+        """Stop listening"""
+        for server in (self._tcp_server, self._udp_server):
+            if server:
+                server.shutdown()
+                server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def stats(self) -> Dict[str, Any]:
+        """Commands served by name, connections and bytes sent so far"""
+        with self._stats_lock:
+            return {
+                'commands': dict(self.commands),
+                'commands_total': sum(self.commands.values()),
+                'connections': self.connections,
+                'bytes_sent': self.bytes_sent
+            }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.commands.clear()
+            self.connections = 0
+            self.bytes_sent = 0
+
+    def _count(self, command: int, sent: int = 0):
+        with self._stats_lock:
+            self.commands[COMMAND_NAMES.get(command, str(command))] += 1
+            self.bytes_sent += sent
+
+    def _new_session(self) -> _Session:
+        with self._stats_lock:
+            self.connections += 1
+        return _Session(random.randint(1, USHRT_MAX - 1), authenticated=not self.password)
+
+    def _serve_tcp(self, sock: socket.socket):
+        """Answer commands on one TCP connection until it closes"""
+        session = self._new_session()
+        stream = b''
+        while True:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            stream += data
+            while len(stream) >= 8:
+                if stream[:4] != TCP_TOP:
+                    logger.warning("Invalid TCP packet from client, closing connection")
+                    return
+                length = struct.unpack('<I', stream[4:8])[0]
+                if len(stream) < 8 + length:
+                    break
+                packet, stream = stream[8:8 + length], stream[8 + length:]
+                responses = self._respond(session, packet, tcp=True)
+                if responses is None:
+                    sock.close()
+                    return
+                try:
+                    for response, paced in responses:
+                        self._send_tcp(sock, response, paced)
+                except OSError:
+                    return
+
+    def _send_tcp(self, sock: socket.socket, packet: bytes, paced: bool):
+        """Send one packet with its TCP top, in slow pieces if configured"""
+        data = TCP_TOP + struct.pack('<I', len(packet)) + packet
+        size = self.faults.chunk_size
+        if paced and size:
+            for start in range(0, len(data), size):
+                sock.sendall(data[start:start + size])
+                time.sleep(self.faults.chunk_delay)
+        else:
+            sock.sendall(data)
+
+    def _serve_udp(self, packet: bytes, sock: socket.socket, address: Tuple[str, int]):
+        """Answer one UDP datagram"""
+        session = self._udp_sessions.get(address)
+        if session is None or struct.unpack('<H', packet[:2])[0] == const.CMD_CONNECT:
+            session = self._udp_sessions[address] = self._new_session()
+        with session.lock:
+            responses = self._respond(session, packet, tcp=False)
+            if responses is None:
+                self._udp_sessions.pop(address, None)
+                return
+            for response, paced in responses:
+                sock.sendto(response, address)
+                if paced and self.faults.chunk_delay:
+                    time.sleep(self.faults.chunk_delay)
+
+    def _respond(self, session: _Session, packet: bytes, tcp: bool) -> Optional[List[Tuple[bytes, bool]]]:
+        """
+        Handle one command
+
+        Args:
+            session: Client state
+            packet: Command packet (header and payload)
+            tcp: Whether the client uses TCP (changes the chunk framing)
+
+        Returns:
+            List of (packet, paced) to send, [] to send nothing, or None to
+            drop the connection
+        """
+        if len(packet) < 8:
+            return []
+        command, _, _, reply_id = struct.unpack('<4H', packet[:8])
+        payload = packet[8:]
+
+        fault = self.faults.fault()
+        if fault == 'disconnect':
+            logger.info(f"Injected disconnect on {COMMAND_NAMES.get(command, command)}")
+            self._count(command)
+            return None
+        self.faults.delay()
+        if fault == 'drop':
+            logger.info(f"Injected packet loss on {COMMAND_NAMES.get(command, command)}")
+            self._count(command)
+            return []
+
+        def reply(code: int, data: bytes = b'', paced: bool = False) -> Tuple[bytes, bool]:
+            return make_packet(code, session.session_id, reply_id, data), paced
+
+        if command == const.CMD_CONNECT:
+            responses = [reply(const.CMD_ACK_OK if session.authenticated else const.CMD_ACK_UNAUTH)]
+        elif command == const.CMD_AUTH:
+            session.authenticated = payload == make_commkey(self.password, session.session_id)
+            responses = [reply(const.CMD_ACK_OK if session.authenticated else const.CMD_ACK_UNAUTH)]
+        elif not session.authenticated:
+            responses = [reply(const.CMD_ACK_UNAUTH)]
+        elif command == const.CMD_EXIT:
+            responses = [reply(const.CMD_ACK_OK)]
+        elif command == const.CMD_OPTIONS_RRQ:
+            key = payload.split(b'\x00')[0]
+            if key in self.options:
+                responses = [reply(const.CMD_ACK_OK, key + b'=' + self.options[key] + b'\x00')]
+            else:
+                responses = [reply(const.CMD_ACK_ERROR)]
+        elif command == const.CMD_GET_VERSION:
+            responses = [reply(const.CMD_ACK_OK, self.firmware_version + b'\x00')]
+        elif command == const.CMD_GET_TIME:
+            responses = [reply(const.CMD_ACK_OK, struct.pack('<I', encode_time(datetime.now())))]
+        elif command == const.CMD_GET_FREE_SIZES:
+            responses = [reply(const.CMD_ACK_OK, self._sizes())]
+        elif command == CMD_PREPARE_BUFFER:
+            responses = [self._prepare_buffer(session, payload, reply)]
+        elif command == CMD_READ_BUFFER:
+            responses = self._read_buffer(session, payload, reply, tcp)
+        elif command == const.CMD_FREE_DATA:
+            session.buffer = b''
+            responses = [reply(const.CMD_ACK_OK)]
+        elif command in (const.CMD_ENABLEDEVICE, const.CMD_DISABLEDEVICE, const.CMD_REFRESHDATA,
+                         const.CMD_ACK_OK):
+            responses = [reply(const.CMD_ACK_OK)]
+        else:
+            responses = [reply(const.CMD_ACK_UNKNOWN)]
+
+        self._count(command, sum(len(response) for response, _ in responses))
+        return responses
+
+    def _sizes(self) -> bytes:
+        """CMD_GET_FREE_SIZES payload: 20 ints of counts and capacities plus face info"""
+        fields = [0] * 20
+        fields[4] = self.tables.users_count
+        fields[8] = self.tables.records_count
+        fields[15] = max(3000, self.tables.users_count)
+        fields[16] = max(100000, self.tables.records_count)
+        fields[18] = fields[15] - fields[4]
+        fields[19] = fields[16] - fields[8]
+        return struct.pack('<20i', *fields) + struct.pack('<3i', 0, 0, 0)
+
+    def _prepare_buffer(self, session: _Session, payload: bytes, reply) -> Tuple[bytes, bool]:
+        """Select the table for a buffered read and announce its size"""
+        _, table, fct, _ = struct.unpack('<bhii', payload[:11])
+        if table == const.CMD_USERTEMP_RRQ and fct == const.FCT_USER:
+            session.buffer = self.tables.users_data
+        elif table == const.CMD_ATTLOG_RRQ:
+            session.buffer = self.tables.attendance_data
+        else:
+            session.buffer = struct.pack('<I', 0)
+        return reply(const.CMD_ACK_OK, b'\x00' + struct.pack('<I', len(session.buffer)) + b'\x00' * 4)
+
+    def _read_buffer(self, session: _Session, payload: bytes, reply, tcp: bool) -> List[Tuple[bytes, bool]]:
+        """Send one chunk of the prepared table: PREPARE_DATA, DATA packet(s), ACK_OK"""
+        start, size = struct.unpack('<ii', payload[:8])
+        chunk = session.buffer[start:start + size]
+        if tcp:
+            return [
+                reply(const.CMD_PREPARE_DATA, struct.pack('<II', len(chunk), 0)),
+                reply(const.CMD_DATA, chunk, paced=True),
+                reply(const.CMD_ACK_OK)
+            ]
+        responses = [reply(const.CMD_PREPARE_DATA, struct.pack('<I', len(chunk)))]
+        for offset in range(0, len(chunk), UDP_DATA_SIZE):
+            responses.append(reply(const.CMD_DATA, chunk[offset:offset + UDP_DATA_SIZE], paced=True))
+        responses.append(reply(const.CMD_ACK_OK))
+        return responses
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _ThreadingUDPServer(socketserver.ThreadingUDPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def _with_size(records: bytes) -> bytes:
+    """Prefix table data with its byte size, as the terminal does"""
+    return struct.pack('<I', len(records)) + records
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='ZK protocol device simulator')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=4370, help='TCP and UDP port (default: 4370)')
+    parser.add_argument('--users', type=int, default=100, help='Synthetic users (default: 100)')
+    parser.add_argument('--days', type=int, default=30, help='Synthetic days of punches (default: 30)')
+    parser.add_argument('--data', help='JSON file with users and attendance lists instead of synthetic data')
+    parser.add_argument('--format', choices=PACKET_FORMATS, default='zk8', help='Record format (default: zk8)')
+    parser.add_argument('--no-tcp', action='store_true', help='Do not listen on TCP')
+    parser.add_argument('--no-udp', action='store_true', help='Do not listen on UDP')
+    parser.add_argument('--password', type=int, default=0, help='Communication key (default: none)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra delay up to this many seconds')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Share of responses not sent (0-1)')
+    parser.add_argument('--disconnect-rate', type=float, default=0.0,
+                        help='Share of commands answered by closing the connection (0-1)')
+    parser.add_argument('--chunk-size', type=int, default=0, help='Send table data in pieces of this many bytes')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='Seconds between those pieces')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for data and faults')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.data:
+        tables = DeviceTables.from_file(args.data, args.format)
+    else:
+        tables = DeviceTables.synthetic(args.users, args.days, args.format, seed=args.seed)
+    faults = FaultInjector(latency=args.latency, jitter=args.jitter, drop_rate=args.drop_rate,
+                           disconnect_rate=args.disconnect_rate, chunk_size=args.chunk_size,
+                           chunk_delay=args.chunk_delay, seed=args.seed)
+    simulator = ZKSimulator(tables, host=args.host, port=args.port, faults=faults, password=args.password,
+                            tcp=not args.no_tcp, udp=not args.no_udp).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+        logger.info(f"ZK simulator stopped: {simulator.stats()}")
+
+
+if __name__ == '__main__':
+    main()
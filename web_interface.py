@@ -5,56 +5,43 @@ Web Interface for ZKTeco Device Information System
 Provides a web-based interface for device management
 """
 
-from flask import Flask, render_template_string, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, stream_with_context, send_from_directory, abort
 import logging
+import json
+import hashlib
+import importlib.util
 from datetime import datetime
 import threading
 import os
 import sys
 import time
 
-# Try to import System Tray dependencies
-try:
-    import pystray
-    from pystray import MenuItem as item
-    from PIL import Image, ImageDraw
-    TRAY_AVAILABLE = True
-except ImportError as e:
-    print(f"System Tray not available: {e}")
-    TRAY_AVAILABLE = False
-
-try:
-    import win32com.client
-    WIN32_AVAILABLE = True
-except ImportError:
-    WIN32_AVAILABLE = False
-
-try:
-    import win10toast
-    TOAST_AVAILABLE = True
-except ImportError:
-    TOAST_AVAILABLE = False
-
-from controllers.device_controller import DeviceController
+# Optional desktop integrations (System Tray, Windows startup shortcut, toast
+# notifications) are imported where they are used, not at startup
+def _installed(*modules):
+    """Check optional dependencies without importing them (they load on first use)"""
+    return all(importlib.util.find_spec(module) is not None for module in modules)
+
+TRAY_AVAILABLE = _installed('pystray', 'PIL')
+WIN32_AVAILABLE = _installed('win32com')
+TOAST_AVAILABLE = _installed('win10toast')
+
+from controllers.device_controller import get_device_controller
+from services.snapshot_service import snapshot_delta
+from services.log_setup import setup_logging
 from config import Config
 
-# Configure logging
-logging.basicConfig(
-    level=getattr(logging, Config.LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(Config.LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging (queued, rotated; see services/log_setup.py)
+setup_logging(process='web_interface')
 
 logger = logging.getLogger(__name__)
 
-# Initialize Flask app
-app = Flask(__name__)
+# Templates and static assets live next to this file, or in the PyInstaller bundle
+BASE_DIR = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
 
-# Initialize controller
-device_controller = DeviceController()
+# Initialize Flask app; assets are served only under fingerprinted names
+app = Flask(__name__, template_folder=os.path.join(BASE_DIR, 'templates'), static_folder=None)
 
 # Global variable for tray icon
 tray_icon = None
@@ -62,6 +49,8 @@ tray_icon = None
 def create_image():
     """Create a simple icon for System Tray"""
     try:
+        from PIL import Image, ImageDraw
+        
         # Generate a simple icon (blue circle)
         image = Image.new('RGB', (64, 64), color=(255, 255, 255))
         d = ImageDraw.Draw(image)
@@ -97,6 +86,7 @@ def add_to_startup():
         if not shortcut_path or not exe_path:
             return False
             
+        import win32com.client
         shell = win32com.client.Dispatch('WScript.Shell')
         shortcut = shell.CreateShortCut(shortcut_path)
         shortcut.Targetpath = exe_path
@@ -140,6 +130,9 @@ def tray_thread():
         return
     
     try:
+        import pystray
+        from pystray import MenuItem as item
+        
         def on_exit(icon, item):
             logger.info("Exiting application...")
             icon.stop()
@@ -162,6 +155,7 @@ def tray_thread():
         def on_show_status(icon, item):
             try:
                 if TOAST_AVAILABLE:
+                    import win10toast
                     toaster = win10toast.ToastNotifier()
                     toaster.show_toast('وضعیت برنامه', 'برنامه در حال اجراست.', duration=3)
                 else:
@@ -205,378 +199,97 @@ def tray_thread():
     except Exception as e:
         logger.error(f"Error in tray thread: {e}")
 
-# HTML Template
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="fa" dir="rtl">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>سیستم اطلاعات دستگاه ZKTeco</title>
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: 'Tahoma', Arial, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-        }
-        
-        .container {
-            max-width: 1200px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 15px;
-            box-shadow: 0 20px 40px rgba(0,0,0,0.1);
-            overflow: hidden;
-        }
-        
-        .header {
-            background: linear-gradient(135deg, #2c3e50 0%, #34495e 100%);
-            color: white;
-            padding: 30px;
-            text-align: center;
-        }
-        
-        .header h1 {
-            font-size: 2.5em;
-            margin-bottom: 10px;
-        }
-        
-        .header p {
-            font-size: 1.1em;
-            opacity: 0.9;
-        }
-        
-        .content {
-            padding: 30px;
-        }
-        
-        .dashboard {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(300px, 1fr));
-            gap: 20px;
-            margin-bottom: 30px;
-        }
-        
-        .card {
-            background: #f8f9fa;
-            border-radius: 10px;
-            padding: 25px;
-            border-left: 5px solid #3498db;
-            transition: transform 0.3s ease;
-        }
-        
-        .card:hover {
-            transform: translateY(-5px);
-        }
-        
-        .card h3 {
-            color: #2c3e50;
-            margin-bottom: 15px;
-            font-size: 1.3em;
-        }
-        
-        .status-indicator {
-            display: inline-block;
-            width: 12px;
-            height: 12px;
-            border-radius: 50%;
-            margin-left: 10px;
-        }
-        
-        .status-online {
-            background: #27ae60;
-        }
-        
-        .status-offline {
-            background: #e74c3c;
-        }
-        
-        .btn {
-            background: linear-gradient(135deg, #3498db 0%, #2980b9 100%);
-            color: white;
-            border: none;
-            padding: 12px 25px;
-            border-radius: 25px;
-            cursor: pointer;
-            font-size: 1em;
-            transition: all 0.3s ease;
-            text-decoration: none;
-            display: inline-block;
-            margin: 5px;
-        }
-        
-        .btn:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 5px 15px rgba(52, 152, 219, 0.4);
-        }
-        
-        .btn-success {
-            background: linear-gradient(135deg, #27ae60 0%, #229954 100%);
-        }
-        
-        .btn-warning {
-            background: linear-gradient(135deg, #f39c12 0%, #e67e22 100%);
-        }
-        
-        .btn-danger {
-            background: linear-gradient(135deg, #e74c3c 0%, #c0392b 100%);
-        }
-        
-        .info-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-            gap: 15px;
-            margin-top: 15px;
-        }
-        
-        .info-item {
-            background: white;
-            padding: 15px;
-            border-radius: 8px;
-            border: 1px solid #e9ecef;
-        }
-        
-        .info-label {
-            font-weight: bold;
-            color: #6c757d;
-            font-size: 0.9em;
-        }
-        
-        .info-value {
-            color: #2c3e50;
-            font-size: 1.1em;
-            margin-top: 5px;
-        }
-        
-        .alert {
-            padding: 15px;
-            border-radius: 8px;
-            margin: 20px 0;
-        }
-        
-        .alert-success {
-            background: #d4edda;
-            color: #155724;
-            border: 1px solid #c3e6cb;
-        }
-        
-        .alert-error {
-            background: #f8d7da;
-            color: #721c24;
-            border: 1px solid #f5c6cb;
-        }
-        
-        .loading {
-            display: none;
-            text-align: center;
-            padding: 20px;
-        }
-        
-        .spinner {
-            border: 4px solid #f3f3f3;
-            border-top: 4px solid #3498db;
-            border-radius: 50%;
-            width: 40px;
-            height: 40px;
-            animation: spin 1s linear infinite;
-            margin: 0 auto 10px;
-        }
-        
-        @keyframes spin {
-            0% { transform: rotate(0deg); }
-            100% { transform: rotate(360deg); }
-        }
-        
-        .footer {
-            background: #f8f9fa;
-            padding: 20px;
-            text-align: center;
-            color: #6c757d;
-            border-top: 1px solid #e9ecef;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>سیستم اطلاعات دستگاه ZKTeco</h1>
-            <p>مدیریت و همگام‌سازی اطلاعات دستگاه حضور و غیاب</p>
-        </div>
-        
-        <div class="content">
-            {% if message %}
-            <div class="alert alert-{{ message_type }}">
-                {{ message }}
-            </div>
-            {% endif %}
-            
-            <div class="dashboard">
-                <div class="card">
-                    <h3>وضعیت دستگاه <span class="status-indicator status-{{ 'online' if device_status else 'offline' }}"></span></h3>
-                    <div class="info-grid">
-                        <div class="info-item">
-                            <div class="info-label">نام دستگاه</div>
-                            <div class="info-value">{{ device_info.get('device_name', 'نامشخص') }}</div>
-                        </div>
-                        <div class="info-item">
-                            <div class="info-label">شماره سریال</div>
-                            <div class="info-value">{{ device_info.get('serial_number', 'نامشخص') }}</div>
-                        </div>
-                        <div class="info-item">
-                            <div class="info-label">تعداد کاربران</div>
-                            <div class="info-value">{{ device_info.get('users_count', 0) }}</div>
-                        </div>
-                        <div class="info-item">
-                            <div class="info-label">رکوردهای حضور</div>
-                            <div class="info-value">{{ device_info.get('attendance_count', 0) }}</div>
-                        </div>
-                    </div>
-                </div>
-                
-                <div class="card">
-                    <h3>عملیات</h3>
-                    <div style="text-align: center;">
-                        <a href="/sync" class="btn btn-success" onclick="showLoading()">همگام‌سازی</a>
-                        <a href="/status" class="btn btn-warning">بروزرسانی وضعیت</a>
-                        <a href="/test" class="btn btn-danger">تست اتصال</a>
-                    </div>
-                    <div class="loading" id="loading">
-                        <div class="spinner"></div>
-                        <p>در حال پردازش...</p>
-                    </div>
-                </div>
-                
-                <div class="card">
-                    <h3>اطلاعات سیستم</h3>
-                    <div class="info-grid">
-                        <div class="info-item">
-                            <div class="info-label">آخرین همگام‌سازی</div>
-                            <div class="info-value">{{ last_sync or 'هیچ' }}</div>
-                        </div>
-                        <div class="info-item">
-                            <div class="info-label">وضعیت سرور</div>
-                            <div class="info-value">{{ 'متصل' if server_status else 'قطع' }}</div>
-                        </div>
-                        <div class="info-item">
-                            <div class="info-label">فاصله همگام‌سازی</div>
-                            <div class="info-value">{{ sync_interval }} ثانیه</div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="card">
-                <h3>لاگ‌های اخیر</h3>
-                <div style="max-height: 300px; overflow-y: auto; background: #f8f9fa; padding: 15px; border-radius: 8px;">
-                    {% for log in recent_logs %}
-                    <div style="margin-bottom: 10px; padding: 10px; background: white; border-radius: 5px; border-left: 3px solid #3498db;">
-                        <strong>{{ log.timestamp }}</strong><br>
-                        {{ log.message }}
-                    </div>
-                    {% endfor %}
-                </div>
-            </div>
-        </div>
-        
-        <div class="footer">
-            <p>سیستم اطلاعات دستگاه ZKTeco - نسخه 1.0.0</p>
-            <p>آخرین بروزرسانی: {{ current_time }}</p>
-        </div>
-    </div>
-    
-    <script>
-        function showLoading() {
-            document.getElementById('loading').style.display = 'block';
-        }
-        
-        // Auto-refresh status every 30 seconds
-        setInterval(function() {
-            fetch('/status')
-                .then(response => response.json())
-                .then(data => {
-                    if (data.success) {
-                        location.reload();
-                    }
-                });
-        }, 30000);
-    </script>
-</body>
-</html>
-"""
+# Fingerprinted assets never change, so browsers may keep them for a year
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# Logical asset name -> fingerprinted name (content hash in the file name)
+_asset_names = {}
+
+def fingerprinted_name(name):
+    """Get the content-hashed file name of a static asset"""
+    if name not in _asset_names:
+        with open(os.path.join(STATIC_DIR, name), 'rb') as asset_file:
+            digest = hashlib.sha1(asset_file.read()).hexdigest()[:10]
+        stem, extension = os.path.splitext(name)
+        _asset_names[name] = f"{stem}.{digest}{extension}"
+    return _asset_names[name]
+
+@app.template_global()
+def asset_url(name):
+    """URL of a static asset under its fingerprinted name"""
+    return url_for('asset', filename=fingerprinted_name(name))
+
+@app.route('/assets/<filename>')
+def asset(filename):
+    """Serve a fingerprinted static asset with long-lived cache headers"""
+    stem, extension = os.path.splitext(filename)
+    name = stem.rpartition('.')[0] + extension
+    try:
+        if fingerprinted_name(name) != filename:
+            abort(404)
+    except OSError:
+        abort(404)
+    response = send_from_directory(STATIC_DIR, name, max_age=ASSET_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    return response
 
 @app.route('/')
 def index():
-    """Main dashboard page"""
+    """Main dashboard page (static shell; data is loaded from /events, /status and /logs)"""
     try:
-        # Get device status
-        status_result = device_controller.get_device_status()
-        device_status = status_result['success']
-        device_info = status_result.get('data', {})
-        
-        # Get health status
-        health_result = device_controller.get_health_status()
-        server_status = health_result.get('data', {}).get('server_connection', False)
-        
-        # Get configuration
-        sync_config = Config.get_sync_config()
-        
-        return render_template_string(HTML_TEMPLATE,
-            device_status=device_status,
-            device_info=device_info.get('device_info', {}),
-            server_status=server_status,
-            last_sync=device_info.get('last_sync', ''),
-            sync_interval=sync_config['interval'],
+        # The template is compiled once and cached by Jinja
+        return render_template('dashboard.html',
+            sync_interval=Config.get_sync_config()['interval'],
+            log_limit=Config.LOG_TAIL_RECORDS,
             current_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            recent_logs=[],  # You can implement log retrieval here
             message=request.args.get('message', ''),
-            message_type=request.args.get('type', 'success')
+            message_type=request.args.get('type', 'success'),
+            job_id=request.args.get('job', '')
         )
         
     except Exception as e:
         logger.error(f"Error in dashboard: {e}")
-        return render_template_string(HTML_TEMPLATE,
-            device_status=False,
-            device_info={},
-            server_status=False,
-            last_sync='',
-            sync_interval=3600,
-            current_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            recent_logs=[],
-            message=f'خطا در بارگذاری: {str(e)}',
-            message_type='error'
-        )
+        return f'خطا در بارگذاری: {str(e)}', 500
 
 @app.route('/sync')
 def sync():
-    """Sync device data"""
+    """Start a background sync job"""
     try:
-        result = device_controller.sync_device_data()
+        result = get_device_controller().start_sync_job(trigger='web')
         
         if result['success']:
-            message = f"همگام‌سازی موفق: {result['message']}"
-            message_type = 'success'
-        else:
-            message = f"خطا در همگام‌سازی: {result['message']}"
-            message_type = 'error'
-            
-        return redirect(f'/?message={message}&type={message_type}')
+            job_id = result['data']['job_id']
+            if result['created']:
+                message = f"همگام‌سازی در پس‌زمینه آغاز شد (شناسه: {job_id})"
+            else:
+                message = f"همگام‌سازی در حال اجراست (شناسه: {job_id})"
+            return redirect(f'/?message={message}&type=success&job={job_id}')
+        
+        message = f"خطا در همگام‌سازی: {result['message']}"
+        return redirect(f'/?message={message}&type=error')
         
     except Exception as e:
         logger.error(f"Error in sync: {e}")
         return redirect(f'/?message=خطای سرور: {str(e)}&type=error')
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Get sync job progress"""
+    try:
+        result = get_device_controller().get_sync_job(job_id)
+        return jsonify(result), 200 if result['success'] else 404
+    except Exception as e:
+        logger.error(f"Error in job status: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
 @app.route('/status')
 def status():
-    """Get device status"""
+    """Get dashboard snapshot (served from memory, no device traffic)"""
     try:
-        result = device_controller.get_device_status()
+        result = get_device_controller().get_dashboard_snapshot()
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error in status: {e}")
@@ -585,11 +298,66 @@ def status():
             'message': f'Error: {str(e)}'
         })
 
+@app.route('/logs')
+def logs():
+    """Get recent log records (?after=<offset> returns only records written since)"""
+    try:
+        after = request.args.get('after')
+        offset = int(after) if after not in (None, '') else None
+        count = min(max(int(request.args.get('lines', Config.LOG_TAIL_RECORDS)), 1), 1000)
+        result = get_device_controller().get_recent_logs(count, offset)
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error in logs: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        })
+
+# Seconds between keep-alive comments on idle event streams
+EVENT_STREAM_HEARTBEAT = 15
+
+@app.route('/events')
+def events():
+    """Server-sent events stream of dashboard snapshot changes"""
+    controller = get_device_controller()
+    controller.get_dashboard_snapshot()
+    snapshot_service = controller.snapshot_service
+    
+    def stream():
+        last = snapshot_service.get_snapshot()
+        yield f"event: snapshot\ndata: {json.dumps(last)}\n\n"
+        while True:
+            current = snapshot_service.wait_for_change(last['version'], timeout=EVENT_STREAM_HEARTBEAT)
+            if current is None:
+                yield ": keep-alive\n\n"
+                continue
+            delta = snapshot_delta(last, current)
+            last = current
+            if delta:
+                yield f"event: delta\ndata: {json.dumps(delta)}\n\n"
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/refresh')
+def refresh():
+    """Ask the background refresher to update the snapshot now"""
+    try:
+        get_device_controller().snapshot_service.request_refresh()
+        return redirect('/?message=بروزرسانی وضعیت درخواست شد&type=success')
+    except Exception as e:
+        logger.error(f"Error in refresh: {e}")
+        return redirect(f'/?message=خطای سرور: {str(e)}&type=error')
+
 @app.route('/test')
 def test():
     """Test connections"""
     try:
-        result = device_controller.test_connections()
+        result = get_device_controller().test_connections()
         
         if result['success']:
             message = "تست اتصال موفق"
@@ -608,6 +376,9 @@ if __name__ == '__main__':
     try:
         logger.info("Starting ZKTeco Device Information Web Interface")
         
+        # Serve the persisted snapshot at once and refresh it in the background
+        get_device_controller().snapshot_service.start()
+        
         # Start tray icon in a separate thread
         if TRAY_AVAILABLE:
             tray = threading.Thread(target=tray_thread, daemon=True)
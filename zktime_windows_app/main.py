@@ -19,13 +19,14 @@ from tkinter import messagebox, simpledialog
 import pystray
 from PIL import Image, ImageDraw
 import winreg
-import schedule
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import Config
 from services.device_service import DeviceService
+from services.scheduler import SyncScheduler
+from services.log_setup import setup_logging
 
 class ZKTecoWindowsApp:
     """Main Windows application with system tray and sync functionality"""
@@ -36,6 +37,7 @@ class ZKTecoWindowsApp:
         self.device_service = None
         self.sync_thread = None
         self.sync_running = False
+        self.sync_stop = threading.Event()
         self.icon = None
         self.setup_logging()
         self.setup_device_service()
@@ -44,14 +46,8 @@ class ZKTecoWindowsApp:
     def setup_logging(self):
         """Setup logging configuration"""
         log_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'zktime_sync.log')
-        logging.basicConfig(
-            level=getattr(logging, self.config.LOG_LEVEL),
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
+        # The tray app has its own log file, so it always rotates it
+        setup_logging(log_file=log_file, rotate=True)
         self.logger = logging.getLogger(__name__)
         self.logger.info("ZKTeco Windows Application started")
         
@@ -132,7 +128,7 @@ class ZKTecoWindowsApp:
                 self.logger.error("Device service not initialized")
                 return
                 
-            result = self.device_service.sync_device_data()
+            result = self.device_service.sync_device_data(trigger='tray')
             
             if result['success']:
                 self.logger.info(f"Manual sync completed successfully: {result['message']}")
@@ -306,6 +302,8 @@ class ZKTecoWindowsApp:
         """Exit the application"""
         try:
             self.logger.info("Application exiting")
+            self.sync_running = False
+            self.sync_stop.set()
             if self.icon:
                 self.icon.stop()
             sys.exit(0)
@@ -318,22 +316,21 @@ class ZKTecoWindowsApp:
         try:
             self.logger.info("Starting scheduled sync process")
             self.sync_running = True
+            self.sync_stop.clear()
             
-            # Schedule sync based on configuration
-            sync_interval = self.config.SYNC_INTERVAL
-            schedule.every(sync_interval).seconds.do(self._scheduled_sync)
+            # Aligned to the sync interval and limited to the configured window;
+            # the thread sleeps until the next run instead of polling
+            scheduler = SyncScheduler.from_config()
             
-            # Run the scheduler in a separate thread
-            def run_scheduler():
-                while self.sync_running:
-                    schedule.run_pending()
-                    time.sleep(1)
-                    
-            self.sync_thread = threading.Thread(target=run_scheduler)
+            self.sync_thread = threading.Thread(
+                target=scheduler.run_forever,
+                args=(self._scheduled_sync, self.sync_stop),
+                kwargs={'run_immediately': False}
+            )
             self.sync_thread.daemon = True
             self.sync_thread.start()
             
-            self.logger.info(f"Scheduled sync started with {sync_interval} second interval")
+            self.logger.info(f"Scheduled sync started with {scheduler.interval} second interval")
             
         except Exception as e:
             self.logger.error(f"Failed to start scheduled sync: {e}")
@@ -347,7 +344,7 @@ class ZKTecoWindowsApp:
                 self.logger.error("Device service not initialized")
                 return
                 
-            result = self.device_service.sync_device_data()
+            result = self.device_service.sync_device_data(lock_mode='skip', trigger='tray-scheduled')
             
             if result['success']:
                 self.logger.info(f"Scheduled sync completed successfully: {result['message']}")
@@ -8,6 +8,7 @@ No web interface, just system tray and sync functionality
 import sys
 import os
 import logging
+import logging.handlers
 import threading
 import time
 import json
@@ -40,6 +41,7 @@ class SimpleZKTimeApp:
         
         # Application state
         self.sync_running = False
+        self.sync_stop = threading.Event()
         self.sync_thread = None
         self.icon = None
         
@@ -56,7 +58,8 @@ class SimpleZKTimeApp:
             level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s',
             handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
+                logging.handlers.RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=3,
+                                                     encoding='utf-8'),
                 logging.StreamHandler()
             ]
         )
@@ -314,12 +317,15 @@ class SimpleZKTimeApp:
                 return
                 
             self.sync_running = True
+            self.sync_stop.clear()
             
             def sync_scheduler():
                 schedule.every(self.SYNC_INTERVAL).seconds.do(self.perform_sync)
                 while self.sync_running:
                     schedule.run_pending()
-                    time.sleep(1)
+                    # Sleep until the next job is due; stop_auto_sync wakes us early
+                    idle = schedule.idle_seconds()
+                    self.sync_stop.wait(max(idle, 0) if idle is not None else None)
                     
             self.sync_thread = threading.Thread(target=sync_scheduler)
             self.sync_thread.daemon = True
@@ -336,6 +342,7 @@ class SimpleZKTimeApp:
         """Stop automatic sync"""
         try:
             self.sync_running = False
+            self.sync_stop.set()
             schedule.clear()
             self.logger.info("Auto sync stopped")
             messagebox.showinfo("Auto Sync", "Auto sync stopped")
@@ -388,6 +395,7 @@ class SimpleZKTimeApp:
         try:
             self.logger.info("Application exiting")
             self.sync_running = False
+            self.sync_stop.set()
             if self.icon:
                 self.icon.stop()
             sys.exit(0)
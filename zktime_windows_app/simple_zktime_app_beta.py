@@ -9,6 +9,7 @@ Uses BETA server for testing: https://beta.sdadparts.com/api/attendance/device-i
 import sys
 import os
 import logging
+import logging.handlers
 import threading
 import time
 import json
@@ -41,6 +42,7 @@ class SimpleZKTimeAppBeta:
         
         # Application state
         self.sync_running = False
+        self.sync_stop = threading.Event()
         self.sync_thread = None
         self.icon = None
         
@@ -57,7 +59,8 @@ class SimpleZKTimeAppBeta:
             level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s',
             handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
+                logging.handlers.RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=3,
+                                                     encoding='utf-8'),
                 logging.StreamHandler()
             ]
         )
@@ -194,7 +197,8 @@ class SimpleZKTimeAppBeta:
             }
             
             self.logger.info(f"Formatted {len(attendance_records_api)} records for BETA API")
-            self.logger.info(f"Sample formatted data: {json.dumps(api_data, indent=2, ensure_ascii=False)[:500]}...")
+            if attendance_records_api and self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"Sample formatted record: {json.dumps(attendance_records_api[0], ensure_ascii=False)}")
             return api_data
             
         except Exception as e:
@@ -210,24 +214,24 @@ class SimpleZKTimeAppBeta:
                 'Authorization': f'Bearer {self.SERVER_TOKEN}'
             }
             
-            self.logger.info(f"Sending data to BETA server: {self.SERVER_URL}")
-            self.logger.info(f"Data size: {len(json.dumps(data))} characters")
+            body = json.dumps(data).encode('utf-8')
+            self.logger.info(f"Sending {len(body)} bytes to BETA server: {self.SERVER_URL}")
             
             response = requests.post(
                 self.SERVER_URL,
-                json=data,
+                data=body,
                 headers=headers,
                 timeout=30
             )
             
             self.logger.info(f"Server response status: {response.status_code}")
-            self.logger.info(f"Server response: {response.text}")
+            self.logger.debug(f"Server response: {response.text[:500]}")
             
             if response.status_code == 200:
                 self.logger.info("Data sent to BETA server successfully")
                 return True
             else:
-                self.logger.error(f"BETA server returned status {response.status_code}: {response.text}")
+                self.logger.error(f"BETA server returned status {response.status_code}: {response.text[:500]}")
                 return False
                 
         except Exception as e:
@@ -354,12 +358,15 @@ class SimpleZKTimeAppBeta:
                 return
                 
             self.sync_running = True
+            self.sync_stop.clear()
             
             def sync_scheduler():
                 schedule.every(self.SYNC_INTERVAL).seconds.do(self.perform_sync)
                 while self.sync_running:
                     schedule.run_pending()
-                    time.sleep(1)
+                    # Sleep until the next job is due; stop_auto_sync wakes us early
+                    idle = schedule.idle_seconds()
+                    self.sync_stop.wait(max(idle, 0) if idle is not None else None)
                     
             self.sync_thread = threading.Thread(target=sync_scheduler)
             self.sync_thread.daemon = True
@@ -376,6 +383,7 @@ class SimpleZKTimeAppBeta:
         """Stop automatic sync"""
         try:
             self.sync_running = False
+            self.sync_stop.set()
             schedule.clear()
             self.logger.info("BETA auto sync stopped")
             messagebox.showinfo("Auto Sync", "BETA auto sync stopped")
@@ -429,6 +437,7 @@ class SimpleZKTimeAppBeta:
         try:
             self.logger.info("BETA application exiting")
             self.sync_running = False
+            self.sync_stop.set()
             if self.icon:
                 self.icon.stop()
             sys.exit(0)